@@ -1,6 +1,7 @@
 #@IgnoreInspection BashAddShebang
 apt-get -qqy update
-apt-get -qqy install postgresql python-psycopg2
+# tournament needs PostgreSQL 9.6 or later; the box (Ubuntu 18.04) has 10
+apt-get -qqy install postgresql python-psycopg2 python-numpy
 apt-get -qqy install python-flask python-sqlalchemy
 apt-get -qqy install python-pip
 pip install bleach
@@ -10,6 +11,11 @@ pip install Flask-Login==0.1.3
 pip install google-api-python-client
 pip install requests
 pip install httplib2
+# tournament_async.py needs Python 3.7+ with asyncpg, and psycopg2 and NumPy
+# for tournament.py, which it imports
+apt-get -qqy install python3.7 python3-pip
+python3.7 -m pip install --upgrade pip
+python3.7 -m pip install asyncpg psycopg2-binary numpy
 
 su postgres -c 'createuser -dRS vagrant'
 su vagrant -c 'createdb'
@@ -17,6 +23,7 @@ su vagrant -c 'createdb forum'
 su vagrant -c 'psql forum -f /vagrant/forum/forum.sql'
 su vagrant -c 'createdb tournament'
 su vagrant -c 'psql tournament -f /vagrant/tournament/tournament.sql'
+su vagrant -c 'cd /vagrant/tournament && python migrate.py'
 su vagrant -c 'createdb restaurant'
 su vagrant -c 'psql restaurant -f /vagrant/restaurant/restaurant.sql'
 
@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+#
+# backends.py -- database backends for tournament.py
+#
+# tournament.py writes its SQL for PostgreSQL through psycopg2. A backend
+# opens connections and runs the few operations whose SQL differs between
+# databases: multi-row VALUES lists, bulk loads with COPY, and the isolation
+# and retry of transactions that write results.
+#
+
+import csv
+import io
+import json
+import os
+import re
+import sqlite3
+
+try:
+    import psycopg2
+    from psycopg2.extras import execute_values
+except ImportError:
+    # only the SQLite backend is available
+    psycopg2 = None
+
+# SQLSTATEs PostgreSQL aborts a transaction with to resolve a conflict with
+# concurrent transactions, serialization_failure and deadlock_detected; the
+# transaction succeeds if it is run again.
+RETRY_SQLSTATES = ('40001', '40P01')
+
+# Python 2's csv module reads and writes byte strings only; text is passed
+# through it as UTF-8.
+_TEXT = type(u'')
+_CSV_BYTES = bytes is str
+
+SQLITE_SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'tournament_sqlite.sql')
+
+
+class PostgresBackend(object):
+    """Connects to a PostgreSQL server with psycopg2.
+
+    Args:
+      database_name: the database to connect to.
+      host, user, password: the server and the credentials to use.
+      cursor_factory: a psycopg2 cursor class used for every cursor opened
+        on the connections, e.g. to count or log statements.
+    """
+    # no limit on the connections a pool may hold
+    maxconn = None
+
+    def __init__(self, database_name="tournament", host="localhost",
+                 user="postgres", password="postgres", cursor_factory=None):
+        self.database_name = database_name
+        self.host = host
+        self.user = user
+        self.password = password
+        self.cursor_factory = cursor_factory
+
+    def connect(self):
+        """Opens a new connection."""
+        if psycopg2 is None:
+            raise ImportError("The PostgreSQL backend needs psycopg2.")
+        return psycopg2.connect(host=self.host, dbname=self.database_name,
+                                user=self.user, password=self.password,
+                                cursor_factory=self.cursor_factory)
+
+    def streamingCursor(self, db, batch_size):
+        """Returns a named cursor, which keeps a query's result on the
+        server and fetches it batch_size rows at a time. It lives as long as
+        the connection's transaction."""
+        c = db.cursor(name='tournament_stream')
+        c.itersize = batch_size
+        return c
+
+    def executeValues(self, c, sql, rows, template=None, fetch=False):
+        """Runs sql, whose single %s stands for a VALUES list, with every row
+        in rows as a single statement."""
+        return execute_values(c, sql, rows, template=template,
+                              page_size=max(len(rows), 1), fetch=fetch)
+
+    def beginTransaction(self, c, isolation):
+        """Sets the isolation level, e.g. 'READ COMMITTED', of the
+        transaction c runs in. Must be its first statement."""
+        c.execute("SET TRANSACTION ISOLATION LEVEL " + isolation)
+
+    def isRetryable(self, error):
+        """Returns True if error aborted a transaction only because of a
+        conflict with concurrent transactions."""
+        return getattr(error, 'pgcode', None) in RETRY_SQLSTATES
+
+    def copyFrom(self, c, table, columns, source, header=False):
+        """Loads rows into a table with COPY. source is a file object on CSV
+        text or an iterable of rows. Returns the number of rows loaded."""
+        if not hasattr(source, 'read'):
+            source = _CsvStream(source)
+            header = False
+        elif _CSV_BYTES:
+            source = _Utf8Reader(source)
+        c.copy_expert("COPY %s (%s) FROM STDIN WITH CSV%s"
+                      % (table, ", ".join(columns),
+                         " HEADER" if header else ""),
+                      source)
+        return c.rowcount
+
+
+class SQLiteBackend(object):
+    """Runs the database in process with SQLite 3.35 or newer, in a file or
+    in memory. The schema in tournament_sqlite.sql is created when a new
+    database is opened.
+
+    SQLite lets one connection write at a time, so a pool keeps a single
+    connection that its threads take turns on. An in-memory database lives
+    as long as that connection: closePool() discards it.
+
+    Args:
+      path: the database file, or ':memory:'.
+    """
+    maxconn = 1
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+
+    def connect(self):
+        """Opens a new connection, creating the schema if the database is
+        empty."""
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               isolation_level=None)
+        conn.create_function('GREATEST', -1, _greatest)
+        if self.path != ':memory:':
+            conn.execute("PRAGMA journal_mode = WAL")
+        tables = conn.execute("SELECT count(*) FROM sqlite_master "
+                              "WHERE type = 'table' AND name = 'members'")
+        if tables.fetchone()[0] == 0:
+            with open(SQLITE_SCHEMA) as f:
+                conn.executescript(f.read())
+        return SQLiteConnection(conn)
+
+    def streamingCursor(self, db, batch_size):
+        """Returns a plain cursor: SQLite steps through a query's result as
+        rows are fetched, so nothing is read ahead."""
+        return db.cursor()
+
+    def executeValues(self, c, sql, rows, template=None, fetch=False):
+        """Runs sql, whose single %s stands for a VALUES list, once per row
+        in rows. Statements cost no round trip in process, and one row per
+        statement stays within SQLite's limit on parameters."""
+        if not rows:
+            return [] if fetch else None
+        if template is None:
+            template = "(" + ", ".join(["%s"] * len(rows[0])) + ")"
+        sql = sql.replace("%s", template, 1)
+        if not fetch:
+            c.executemany(sql, rows)
+            return None
+        result = []
+        for row in rows:
+            c.execute(sql, row)
+            result.extend(c.fetchall())
+        return result
+
+    def beginTransaction(self, c, isolation):
+        """Does nothing: SQLite transactions are serializable whatever the
+        level asked for, as one connection writes at a time."""
+        pass
+
+    def isRetryable(self, error):
+        """Returns True if error is a write that gave up waiting for
+        another process holding the database file's lock."""
+        return isinstance(error, sqlite3.OperationalError) and \
+            'locked' in str(error)
+
+    def copyFrom(self, c, table, columns, source, header=False):
+        """Loads rows into a table with a single prepared INSERT. source is a
+        file object on CSV text or an iterable of rows. Returns the number
+        of rows loaded."""
+        if hasattr(source, 'read'):
+            if _CSV_BYTES:
+                rows = ([cell.decode('utf-8') for cell in row]
+                        for row in csv.reader(_utf8(line) for line in source))
+            else:
+                rows = csv.reader(source)
+            if header:
+                next(rows, None)
+        else:
+            rows = (row if isinstance(row, (tuple, list)) else (row,)
+                    for row in source)
+        c.executemany("INSERT INTO %s (%s) VALUES (%s)"
+                      % (table, ", ".join(columns),
+                         ", ".join(["%s"] * len(columns))), rows)
+        return c.rowcount
+
+
+class SQLiteConnection(object):
+    """Wraps a sqlite3 connection so it takes the SQL tournament.py writes
+    for psycopg2. Every transaction is opened explicitly, on the first
+    statement after a commit or rollback, so a transaction holds all of its
+    statements whatever their kind."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._in_transaction = False
+
+    def cursor(self):
+        return SQLiteCursor(self, self._conn.cursor())
+
+    def _begin(self):
+        if not self._in_transaction:
+            self._conn.execute("BEGIN")
+            self._in_transaction = True
+
+    def commit(self):
+        if self._in_transaction:
+            self._in_transaction = False
+            self._conn.execute("COMMIT")
+
+    def rollback(self):
+        if self._in_transaction:
+            self._in_transaction = False
+            self._conn.execute("ROLLBACK")
+
+    def close(self):
+        self._conn.close()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class SQLiteCursor(object):
+    """Wraps a sqlite3 cursor, translating psycopg2 SQL and parameters."""
+
+    def __init__(self, db, cursor):
+        self._db = db
+        self._cursor = cursor
+        self.rowcount = -1
+
+    def execute(self, query, vars=None):
+        self._db._begin()
+        changes = self._db._conn.total_changes
+        if vars is None:
+            # like psycopg2, leave a query without parameters as it is
+            self._cursor.execute(query)
+        else:
+            self._cursor.execute(_translate(query), _params(vars))
+        self._countRows(changes)
+
+    def executemany(self, query, vars_list):
+        self._db._begin()
+        changes = self._db._conn.total_changes
+        self._cursor.executemany(_translate(query),
+                                 (_params(vars) for vars in vars_list))
+        self._countRows(changes)
+
+    def _countRows(self, changes):
+        # sqlite3 leaves rowcount at -1 for statements that do not start with
+        # INSERT, UPDATE or DELETE, such as WITH ... UPDATE
+        self.rowcount = self._cursor.rowcount
+        if self.rowcount == -1:
+            changes = self._db._conn.total_changes - changes
+            if changes:
+                self.rowcount = changes
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def _greatest(*args):
+    """GREATEST as in PostgreSQL, which ignores NULLs."""
+    values = [arg for arg in args if arg is not None]
+    return max(values) if values else None
+
+
+# Translated queries, by psycopg2 query text.
+_translations = {}
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+def _translate(query):
+    """Returns a psycopg2 query as SQLite SQL: placeholders become ? or
+    :name, casts and row locks are dropped, and arrays are read as JSON."""
+    sql = _translations.get(query)
+    if sql is None:
+        sql = re.sub(r"=\s*ANY\s*\(%s\)",
+                     "IN (SELECT value FROM json_each(%s))", query)
+        sql = re.sub(r"::\w+", "", sql)
+        sql = re.sub(r"\s+FOR UPDATE\b", "", sql)
+        sql = _PLACEHOLDER.sub(_placeholder, sql)
+        if len(_translations) > 1000:
+            _translations.clear()
+        _translations[query] = sql
+    return sql
+
+
+def _placeholder(match):
+    if match.group(1):
+        return ":" + match.group(1)
+    return "?" if match.group(0) == "%s" else "%"
+
+
+def _params(vars):
+    """Passes lists as JSON arrays; see _translate()."""
+    if vars is None:
+        return ()
+    if isinstance(vars, dict):
+        return dict((key, _param(value)) for key, value in vars.items())
+    return [_param(value) for value in vars]
+
+
+def _param(value):
+    if isinstance(value, (list, tuple)):
+        return json.dumps(list(value))
+    return value
+
+
+class _CsvStream(object):
+    """A read-only file object that formats rows as CSV as they are read,
+    so COPY can stream an iterable without building the file in memory."""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = io.BytesIO() if bytes is str else io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator='\n')
+        self._pending = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            chunk = self._format(8192)
+            if not chunk:
+                break
+            self._pending += chunk
+        if size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def _format(self, count):
+        """Returns up to count rows formatted as CSV."""
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        for row in self._rows:
+            if not isinstance(row, (tuple, list)):
+                row = (row,)
+            if _CSV_BYTES:
+                row = [_utf8(cell) for cell in row]
+            self._writer.writerow(row)
+            count -= 1
+            if count == 0:
+                break
+        return self._buffer.getvalue()
+
+
+class _Utf8Reader(object):
+    """Wraps a file object on CSV text so that reads return UTF-8 bytes,
+    whether the file was opened in text or in binary mode."""
+
+    def __init__(self, source):
+        self._source = source
+
+    def read(self, size=-1):
+        return _utf8(self._source.read(size))
+
+    def readline(self, size=-1):
+        return _utf8(self._source.readline(size))
+
+
+def _utf8(value):
+    """Returns text encoded as UTF-8, and any other value as it is."""
+    return value.encode('utf-8') if isinstance(value, _TEXT) else value
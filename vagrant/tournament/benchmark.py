@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+#
+# benchmark.py -- scaling benchmark for tournament.py
+#
+# Runs complete Swiss tournaments over synthetic member pools and records,
+# per function and per round, the wall time, the number of SQL statements
+# executed and the peak memory allocated (on Python 2, the peak resident size
+# of the process). The report is JSON with one record
+# per (pool, round, function), so reports of two releases can be diffed or
+# compared with --compare.
+#
+# Usage:
+#   python benchmark.py [--sizes 1000 10000 100000] [--output FILE]
+#   python benchmark.py --compare OLD.json NEW.json
+#
+
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+
+import tournament
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2: fall back to the process's peak resident size
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+# Tourney ids at and above this are used by the benchmark.
+BENCHMARK_TOURNEY = 900000
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """A cursor that counts every statement sent to the server."""
+    statements = 0
+
+    def execute(self, query, vars=None):
+        CountingCursor.statements += 1
+        return super(CountingCursor, self).execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        CountingCursor.statements += len(vars_list)
+        return super(CountingCursor, self).executemany(query, vars_list)
+
+
+class Recorder(object):
+    """Collects one record per (pool, round, function)."""
+
+    def __init__(self, track_memory=True):
+        # how peak memory is measured: 'tracemalloc' for the bytes allocated
+        # during each call, 'maxrss' for the peak resident size of the whole
+        # process so far, or None if it is not measured
+        self.memory = None
+        if track_memory and tracemalloc is not None:
+            self.memory = 'tracemalloc'
+        elif track_memory and resource is not None:
+            self.memory = 'maxrss'
+        self.track_memory = self.memory is not None
+        self.records = {}
+
+    def call(self, pool, round_id, func, *args, **kwargs):
+        """Calls func and adds its time, statements and peak memory to the
+        record of func for this pool and round. Returns func's result."""
+        statements = CountingCursor.statements
+        if self.memory == 'tracemalloc':
+            tracemalloc.stop()
+            tracemalloc.start()
+        start = _clock()
+        result = func(*args, **kwargs)
+        elapsed = _clock() - start
+        record = self.records.setdefault((pool, round_id, func.__name__), {
+            'pool': pool, 'round': round_id, 'function': func.__name__,
+            'calls': 0, 'seconds': 0.0, 'queries': 0, 'peak_bytes': None})
+        record['calls'] += 1
+        record['seconds'] += elapsed
+        record['queries'] += CountingCursor.statements - statements
+        if self.track_memory:
+            peak = self._peak()
+            record['peak_bytes'] = max(record['peak_bytes'] or 0, peak)
+        return result
+
+    def _peak(self):
+        if self.memory == 'tracemalloc':
+            return tracemalloc.get_traced_memory()[1]
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+    def report(self):
+        """Returns the records sorted by pool, round and function."""
+        return [self.records[key] for key in sorted(self.records)]
+
+
+def createMemberPool(size, rng):
+    """Inserts size synthetic members with random records in a single
+    statement. Returns their ids in insertion order, which is unrelated to
+    their records."""
+    rows = []
+    for i in range(size):
+        matches = rng.randint(0, 50)
+        rows.append(('bench-%d' % i, rng.randint(0, matches), matches))
+    with tournament.getConnection() as (db, c):
+        ids = execute_values(c, "INSERT INTO members (name, wins, matches) "
+                                "VALUES %s RETURNING id",
+                             rows, page_size=1000, fetch=True)
+    return [row[0] for row in ids]
+
+
+def deleteMemberPool(ids):
+    """Removes the synthetic members."""
+    with tournament.getConnection() as (db, c):
+        c.execute("DELETE FROM members WHERE id = ANY(%s)", (list(ids),))
+
+
+def runTournament(recorder, t_id, member_ids, rng):
+    """Runs a full Swiss tournament for the given members through the public
+    API of tournament.py, recording every call. Registration is recorded as
+    round 0 and the final ranking as round rounds + 1."""
+    pool = len(member_ids)
+    recorder.call(pool, 0, tournament.registerPlayers, t_id, member_ids)
+    rounds = int(math.ceil(math.log(pool, 2)))
+    for current_round in range(1, rounds + 1):
+        pairs = recorder.call(pool, current_round, tournament.swissPairings,
+                              t_id)
+        for (id1, id2, diff) in pairs:
+            if rng.random() < .5:
+                id1, id2 = id2, id1
+            recorder.call(pool, current_round, tournament.reportMatch,
+                          t_id, current_round, id1, id2)
+    recorder.call(pool, rounds + 1, tournament.playerRanks, t_id)
+    recorder.call(pool, rounds + 1, tournament.endTournament, t_id)
+
+
+def runBenchmark(sizes=(1000, 10000, 100000), seed=2015, track_memory=True):
+    """Runs one tournament per pool size and returns the report.
+
+    Args:
+      sizes: the member pool sizes to run.
+      seed: seed for the synthetic records and match outcomes.
+      track_memory: record peak memory per call. On Python 3 this is what
+        the call allocated, and slows the calls being measured; on Python 2
+        it is the peak resident size of the process when the call returns.
+        meta['memory'] says which was measured, None if neither.
+
+    Returns:
+      A dict with the run's environment under 'meta' and the list of
+      records under 'records'.
+    """
+    recorder = Recorder(track_memory)
+    # count statements on a pool like the caller's, and give the caller back
+    # its own backend and pool settings afterwards
+    backend, pool = tournament._backend, tournament._pool
+    settings = {}
+    if pool is not None:
+        settings = dict(minconn=pool.minconn, maxconn=pool.maxconn,
+                        health_check_interval=pool.health_check_interval,
+                        timeout=pool.timeout)
+    tournament.configurePool(cursor_factory=CountingCursor, **settings)
+    try:
+        for n, size in enumerate(sizes):
+            rng = random.Random(seed)
+            t_id = BENCHMARK_TOURNEY + n
+            tournament.deletePlayers(t_id)
+            tournament.deleteMatches(t_id)
+            member_ids = createMemberPool(size, rng)
+            try:
+                runTournament(recorder, t_id, member_ids, rng)
+            finally:
+                tournament.deletePlayers(t_id)
+                tournament.deleteMatches(t_id)
+                deleteMemberPool(member_ids)
+    finally:
+        tournament.closePool()
+        tournament._backend = backend
+        if pool is not None:
+            tournament.configurePool(**settings)
+    return {'meta': {'python': platform.python_version(),
+                     'sizes': list(sizes),
+                     'seed': seed,
+                     'track_memory': recorder.track_memory,
+                     'memory': recorder.memory,
+                     'date': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'records': recorder.report()}
+
+
+def compareReports(old, new):
+    """Returns a list of tuples (pool, round, function, seconds_ratio,
+    queries_ratio) comparing two reports; ratios above 1 mean the new report
+    is slower or runs more statements."""
+    old_records = dict(((r['pool'], r['round'], r['function']), r)
+                       for r in old['records'])
+    rows = []
+    for r in new['records']:
+        key = (r['pool'], r['round'], r['function'])
+        if key not in old_records:
+            continue
+        before = old_records[key]
+        rows.append(key + (_ratio(r['seconds'], before['seconds']),
+                           _ratio(r['queries'], before['queries'])))
+    return rows
+
+
+def _ratio(new, old):
+    if not old:
+        return None
+    return new / float(old)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark tournament.py over synthetic member pools.")
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--seed', type=int, default=2015)
+    parser.add_argument('--no-memory', action='store_true',
+                        help="do not track peak memory")
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help="compare two reports instead of running")
+    args = parser.parse_args()
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        print("%8s %6s %-16s %8s %8s" % ('pool', 'round', 'function',
+                                         'time', 'queries'))
+        for row in compareReports(old, new):
+            print("%8d %6d %-16s %8s %8s" % (
+                row[0], row[1], row[2],
+                '-' if row[3] is None else '%.2fx' % row[3],
+                '-' if row[4] is None else '%.2fx' % row[4]))
+    else:
+        result = runBenchmark(args.sizes, args.seed, not args.no_memory)
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=1, sort_keys=True)
+        sys.stdout.write("Wrote %d records to %s\n" % (
+            len(result['records']), args.output))
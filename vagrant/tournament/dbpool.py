@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+#
+# dbpool.py -- a small thread-safe connection pool for tournament.py
+#
+
+import collections
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolError(Exception):
+    """Raised when a connection cannot be checked out of the pool."""
+    pass
+
+
+class ConnectionPool(object):
+    """Keeps a set of open database connections so they can be reused instead
+    of opening a fresh connection (TCP + auth handshake) for every query.
+
+    Connections are handed out most recently used first, so a quiet pool keeps
+    reusing the same warm connection. A connection that has been idle longer
+    than health_check_interval seconds is pinged with 'SELECT 1' before it is
+    handed out; broken connections are dropped and replaced.
+
+    Args:
+      factory: a callable returning a new DB-API connection.
+      minconn: number of connections opened up front and kept idle.
+      maxconn: upper limit of connections open at any one time.
+      health_check_interval: idle seconds before a connection is pinged;
+        0 pings on every checkout, None never pings.
+      timeout: seconds getconn() waits for a free connection when maxconn is
+        reached; None waits forever.
+    """
+
+    def __init__(self, factory, minconn=1, maxconn=10,
+                 health_check_interval=30.0, timeout=None):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Pool sizes must satisfy 0 <= minconn <= maxconn "
+                             "and maxconn >= 1.")
+        self.factory = factory
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._reset()
+        for i in range(minconn):
+            self._idle.append((self.factory(), time.time()))
+
+    def _reset(self):
+        """Forget all connections; used on creation and after a fork, since
+        connections cannot be shared between processes."""
+        self._pid = os.getpid()
+        self._idle = collections.deque()
+        self._used = 0
+        self._closed = False
+
+    def _checkPid(self):
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _isHealthy(self, conn, last_used):
+        if getattr(conn, 'closed', False):
+            return False
+        interval = self.health_check_interval
+        if interval is None or time.time() - last_used < interval:
+            return True
+        try:
+            c = conn.cursor()
+            c.execute("SELECT 1")
+            c.fetchone()
+            c.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        """Returns a connection from the pool, opening a new one if none is
+        idle and the pool is below maxconn."""
+        with self._cond:
+            self._checkPid()
+            if self._closed:
+                raise PoolError("Connection pool is closed.")
+            deadline = None
+            if self.timeout is not None:
+                deadline = time.time() + self.timeout
+            while not self._idle and self._used >= self.maxconn:
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise PoolError("Timed out waiting for a connection; "
+                                        "all %d are in use." % self.maxconn)
+                    self._cond.wait(remaining)
+            self._used += 1
+            idle = self._idle.pop() if self._idle else None
+        try:
+            if idle is not None:
+                conn, last_used = idle
+                if self._isHealthy(conn, last_used):
+                    return conn
+                self._discard(conn)
+            return self.factory()
+        except Exception:
+            with self._cond:
+                self._used -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn, close=False):
+        """Returns a connection to the pool. Any open transaction is rolled
+        back. The connection is closed instead of kept if close is True or if
+        it is broken."""
+        if self._pid != os.getpid():
+            # connection belongs to the parent process; leave it alone
+            return
+        keep = not close and not getattr(conn, 'closed', False)
+        if keep:
+            try:
+                conn.rollback()
+            except Exception:
+                keep = False
+        with self._cond:
+            self._used -= 1
+            self._cond.notify()
+            if keep and not self._closed:
+                self._idle.append((conn, time.time()))
+                return
+        self._discard(conn)
+
+    def closeall(self):
+        """Closes every idle connection and refuses further checkouts.
+        Connections still in use are closed as they are returned."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, collections.deque()
+            self._cond.notify_all()
+        for conn, last_used in idle:
+            self._discard(conn)
+
+    def size(self):
+        """Returns a tuple of (idle, in_use) connection counts."""
+        with self._cond:
+            return len(self._idle), self._used
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a pooled connection. Commits when the
+        block completes, rolls back if it raises, and always returns the
+        connection to the pool."""
+        conn = self.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            # including GeneratorExit, when a generator reading from the
+            # connection is closed early
+            broken = getattr(conn, 'closed', False)
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            self.putconn(conn, close=broken)
+            raise
+        self.putconn(conn)
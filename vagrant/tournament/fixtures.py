@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+#
+# fixtures.py -- isolated, seeded databases for the tests in test.py
+#
+# A template database is built and seeded once per run, and every test then
+# runs on a copy of its own: on PostgreSQL a database created with CREATE
+# DATABASE ... TEMPLATE, which copies the template's files instead of
+# replaying its SQL, and on SQLite a copy of the template's file. No test
+# has to clean up after another, so tests can run in parallel processes.
+#
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import traceback
+
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+
+import backends
+import tournament
+
+# The tables a new PostgreSQL template is emptied of, their id sequences
+# restarted; schema_version keeps the migrations the source database has
+# applied.
+DATA_TABLES = ('matches', 'match_events', 'brackets', 'rated_tourneys',
+               'players', 'members')
+
+
+class PostgresTemplate(object):
+    """A template database on the server of a PostgreSQL backend, with the
+    schema of the backend's database. That database must be migrated, and
+    no connection may be open to it while the template is built.
+
+    Args:
+      backend: a backends.PostgresBackend whose database is copied.
+      name: the template's name; its clones are named after it.
+    """
+
+    def __init__(self, backend, name=None):
+        self.backend = backend
+        self.name = name or backend.database_name + '_template'
+        self._clones = 0
+
+    def build(self, seed=None):
+        """Creates the template as an empty copy of the backend's database
+        and calls seed(), if given, with the module's pool on the template.
+        Replaces any template of the same name and its clones."""
+        tournament.closePool()
+        self.destroy()
+        self._admin("CREATE DATABASE %s TEMPLATE %s"
+                    % (self.name, self.backend.database_name))
+        _seed(self._backend(self.name),
+              "TRUNCATE %s RESTART IDENTITY" % ", ".join(DATA_TABLES), seed)
+
+    def clone(self):
+        """Returns a backend on a new copy of the template."""
+        self._clones += 1
+        name = "%s_%d_%d" % (self.name, os.getpid(), self._clones)
+        self._admin("CREATE DATABASE %s TEMPLATE %s" % (name, self.name))
+        return self._backend(name)
+
+    def drop(self, clone):
+        """Drops a clone. Its connections must be closed."""
+        self._admin("DROP DATABASE IF EXISTS %s" % clone.database_name)
+
+    def destroy(self):
+        """Drops the template and every clone of it, including those left
+        behind by an interrupted run."""
+        clones = self.name.replace('_', r'\_') + r'\_%'
+        rows = self._admin("SELECT datname FROM pg_database "
+                           "WHERE datname = %s OR datname LIKE %s",
+                           (self.name, clones))
+        # clones first: the template cannot be dropped while one is copied
+        for (name,) in sorted(rows, key=lambda row: row[0] == self.name):
+            self._admin("DROP DATABASE IF EXISTS %s" % name)
+
+    def _admin(self, sql, params=None):
+        """Runs sql on the server's postgres database outside a transaction,
+        as CREATE and DROP DATABASE must run. Returns the rows, if any."""
+        db = self._backend('postgres').connect()
+        try:
+            db.autocommit = True
+            c = db.cursor()
+            c.execute(sql, params)
+            return c.fetchall() if c.description is not None else None
+        finally:
+            db.close()
+
+    def _backend(self, database_name):
+        b = self.backend
+        return backends.PostgresBackend(database_name, b.host, b.user,
+                                        b.password, b.cursor_factory)
+
+
+class SQLiteTemplate(object):
+    """A template database file for the SQLite backend, cloned by copying
+    the file.
+
+    Args:
+      directory: where the template and its clones are kept; a temporary
+        directory, removed by destroy(), if None.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.path = None
+        self._made_directory = False
+        self._clones = 0
+
+    def build(self, seed=None):
+        """Creates the template with the schema of tournament_sqlite.sql and
+        calls seed(), if given, with the module's pool on the template."""
+        tournament.closePool()
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix='tournament')
+            self._made_directory = True
+        self.path = os.path.join(self.directory, 'template.db')
+        _remove(self.path)
+        _seed(backends.SQLiteBackend(self.path), None, seed)
+
+    def clone(self):
+        """Returns a backend on a new copy of the template."""
+        self._clones += 1
+        path = os.path.join(self.directory, "clone_%d_%d.db"
+                            % (os.getpid(), self._clones))
+        shutil.copyfile(self.path, path)
+        return backends.SQLiteBackend(path)
+
+    def drop(self, clone):
+        """Deletes a clone's file. Its connection must be closed."""
+        _remove(clone.path)
+
+    def destroy(self):
+        """Deletes the template, and its directory if it made it."""
+        if self.path is not None:
+            _remove(self.path)
+        if self._made_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def runTests(template, tests, workers=1):
+    """Runs each test function on a clone of the template of its own, with
+    the module's pool on the clone.
+
+    Args:
+      template: a built PostgresTemplate or SQLiteTemplate.
+      tests: the test functions, which raise an exception to fail.
+      workers: the processes to run tests in at once; 1 runs them one after
+        another in this process.
+
+    Returns:
+      A list of tuples (test name, traceback) of the tests that failed.
+    """
+    if workers <= 1:
+        return _runQueued(template, tests, range(len(tests)))
+    tournament.closePool()
+    tasks = multiprocessing.Queue()
+    for i in range(len(tests)):
+        tasks.put(i)
+    results = multiprocessing.Queue()
+    # not daemons: tests may start processes of their own
+    processes = [multiprocessing.Process(target=_worker,
+                                         args=(template, tests, tasks,
+                                               results))
+                 for n in range(min(workers, len(tests)))]
+    for process in processes:
+        process.start()
+    failures = []
+    for process in processes:
+        failures.extend(results.get())
+    for process in processes:
+        process.join()
+    return failures
+
+
+def _worker(template, tests, tasks, results):
+    """Runs the tests whose indexes it takes from tasks until none are left,
+    and puts the list of failures on results."""
+    failures = []
+    try:
+        failures = _runQueued(template, tests, _drain(tasks))
+    except Exception:
+        failures.append(('worker', traceback.format_exc()))
+    finally:
+        results.put(failures)
+
+
+def _drain(tasks):
+    """Yields items from a queue that is filled before it is read, until it
+    is empty."""
+    while True:
+        try:
+            yield tasks.get(timeout=1)
+        except Empty:
+            return
+
+
+def _runQueued(template, tests, indexes):
+    """Runs the tests at indexes, each on a new clone. Returns the list of
+    failures."""
+    failures = []
+    for i in indexes:
+        test = tests[i]
+        clone = template.clone()
+        tournament.configurePool(backend=clone)
+        tournament.clearStandingsCache()
+        try:
+            test()
+        except Exception:
+            failures.append((test.__name__, traceback.format_exc()))
+        finally:
+            tournament.closePool()
+            template.drop(clone)
+    return failures
+
+
+def _seed(backend, sql, seed):
+    """Runs sql, then seed(), with the module's pool on backend."""
+    tournament.configurePool(backend=backend)
+    try:
+        if sql is not None:
+            with tournament.getConnection() as (db, c):
+                c.execute(sql)
+        tournament.clearStandingsCache()
+        if seed is not None:
+            seed()
+    finally:
+        tournament.closePool()
+
+
+def _remove(path):
+    """Deletes a SQLite database file and its write-ahead log, if any."""
+    for name in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(name):
+            os.remove(name)
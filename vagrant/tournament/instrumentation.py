@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+#
+# instrumentation.py -- per-function call statistics for tournament.py
+#
+
+import json
+import math
+import threading
+import time
+from array import array
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+# Counters kept per function, in report order.
+COUNTERS = ('calls', 'connections', 'statements', 'rows', 'retries')
+
+# Latency percentiles reported per function.
+PERCENTILES = (50, 90, 99)
+
+
+class Instrumentation(object):
+    """Collects, per function, the number of calls, connections borrowed,
+    statements executed, rows returned and transactions retried after a
+    conflict, and the latency of every call.
+
+    The counts of a call made while another instrumented call is running on
+    the same thread are added to both, so each function's numbers include
+    those of the functions it calls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counts = {}
+        self._latencies = {}
+
+    def call(self, name, func, *args, **kwargs):
+        """Calls func, recording the call under name. Returns func's result."""
+        stack = self._stack()
+        frame = dict.fromkeys(COUNTERS[1:], 0)
+        stack.append(frame)
+        start = _clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = _clock() - start
+            stack.pop()
+            with self._lock:
+                counts = self._counts.get(name)
+                if counts is None:
+                    counts = self._counts[name] = dict.fromkeys(COUNTERS, 0)
+                    self._latencies[name] = array('d')
+                counts['calls'] += 1
+                for counter, value in frame.items():
+                    counts[counter] += value
+                self._latencies[name].append(elapsed)
+
+    def count(self, counter, n=1):
+        """Adds n to a counter of every call running on this thread."""
+        for frame in self._stack():
+            frame[counter] += n
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def reset(self):
+        """Forgets everything recorded so far."""
+        with self._lock:
+            self._counts = {}
+            self._latencies = {}
+
+    def stats(self):
+        """Returns a dict mapping each function name to a dict of its
+        counters, its total 'seconds', and its latency in seconds at each
+        percentile ('p50', 'p90', 'p99') and at most ('max')."""
+        with self._lock:
+            counts = dict((name, dict(c)) for name, c in self._counts.items())
+            latencies = dict((name, sorted(l))
+                             for name, l in self._latencies.items())
+        for name, stats in counts.items():
+            times = latencies[name]
+            stats['seconds'] = sum(times)
+            for p in PERCENTILES:
+                # nearest-rank percentile
+                rank = int(math.ceil(p / 100.0 * len(times)))
+                stats['p%d' % p] = times[max(rank, 1) - 1]
+            stats['max'] = times[-1]
+        return counts
+
+    def dump(self, f):
+        """Writes stats() to the file object f as JSON."""
+        json.dump(self.stats(), f, indent=1, sort_keys=True)
+
+    def table(self):
+        """Returns stats() as a text table, slowest functions first."""
+        stats = self.stats()
+        columns = COUNTERS + ('seconds',) + \
+            tuple('p%d' % p for p in PERCENTILES) + ('max',)
+        lines = ["%-22s" % 'function' +
+                 "".join("%12s" % column for column in columns)]
+        for name in sorted(stats, key=lambda n: -stats[n]['seconds']):
+            line = "%-22s" % name
+            for column in COUNTERS:
+                line += "%12d" % stats[name][column]
+            for column in columns[len(COUNTERS):]:
+                line += "%12.6f" % stats[name][column]
+            lines.append(line)
+        return "\n".join(lines)
+
+
+class InstrumentedCursor(object):
+    """Wraps a DB-API cursor, counting the statements it executes and the
+    rows it returns. Everything else is passed through to the cursor."""
+
+    def __init__(self, cursor, instrumentation):
+        self._cursor = cursor
+        self._instrumentation = instrumentation
+
+    def execute(self, query, vars=None):
+        self._instrumentation.count('statements')
+        return self._cursor.execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        self._instrumentation.count('statements', len(vars_list))
+        return self._cursor.executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        self._instrumentation.count('statements')
+        return self._cursor.copy_expert(sql, file, size)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._instrumentation.count('rows')
+        return row
+
+    def fetchmany(self, size=None):
+        if size is None:
+            size = self._cursor.arraysize
+        rows = self._cursor.fetchmany(size)
+        self._instrumentation.count('rows', len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._instrumentation.count('rows', len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._instrumentation.count('rows')
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
@@ -0,0 +1,469 @@
+#!/usr/bin/env python
+#
+# matching.py -- maximum weight matching in general graphs
+#
+# An implementation of Edmonds' blossom algorithm with the primal-dual
+# method of Galil ("Efficient algorithms for finding maximum matching in
+# graphs", ACM Computing Surveys, 1986), following the well known public
+# domain formulation by Joris van Rantwijk. Runs in O(n^3) time.
+#
+
+try:
+    _integer_types = (int, long)
+except NameError:
+    _integer_types = (int,)
+
+
+def maxWeightMatching(edges, maxcardinality=False):
+    """Computes a maximum-weighted matching in a general undirected graph.
+
+    Args:
+      edges: a list of tuples (i, j, weight); vertices are the integers
+        0 .. n-1 and at most one edge may join any two vertices. Integer
+        weights keep every computation exact.
+      maxcardinality: if True, only maximum-cardinality matchings are
+        considered, so a perfect matching is returned whenever one exists.
+
+    Returns:
+      A list mate such that mate[i] == j if vertex i is matched to vertex j,
+      and mate[i] == -1 if vertex i is not matched.
+    """
+    if not edges:
+        return []
+
+    nedge = len(edges)
+    nvertex = 0
+    for (i, j, wt) in edges:
+        if i < 0 or j < 0 or i == j:
+            raise ValueError("Invalid edge (%r, %r)." % (i, j))
+        nvertex = max(nvertex, i + 1, j + 1)
+
+    maxweight = max(0, max(wt for (i, j, wt) in edges))
+    allinteger = all(isinstance(wt, _integer_types) for (i, j, wt) in edges)
+
+    # Edge k joins endpoints 2k and 2k+1; endpoint[p] is the vertex at p.
+    endpoint = [edges[p // 2][p % 2] for p in range(2 * nedge)]
+
+    # neighbend[v] lists the remote endpoints of the edges at vertex v.
+    neighbend = [[] for i in range(nvertex)]
+    for k in range(nedge):
+        (i, j, wt) = edges[k]
+        neighbend[i].append(2 * k + 1)
+        neighbend[j].append(2 * k)
+
+    # mate[v] is the remote endpoint of v's matched edge, or -1.
+    mate = nvertex * [-1]
+
+    # Blossoms are numbered nvertex .. 2*nvertex-1; vertices double as
+    # trivial blossoms. label[b] is 0 (free), 1 (S) or 2 (T).
+    label = (2 * nvertex) * [0]
+
+    # labelend[b] is the remote endpoint of the edge through which b got its
+    # label, or -1 for single vertices or unlabeled blossoms.
+    labelend = (2 * nvertex) * [-1]
+
+    # inblossom[v] is the top-level blossom containing vertex v.
+    inblossom = list(range(nvertex))
+
+    # blossomparent[b] is the immediate parent blossom of b, or -1.
+    blossomparent = (2 * nvertex) * [-1]
+
+    # blossomchilds[b] lists the sub-blossoms of b, base first, going round.
+    blossomchilds = (2 * nvertex) * [None]
+
+    # blossombase[b] is the base vertex of blossom b.
+    blossombase = list(range(nvertex)) + nvertex * [-1]
+
+    # blossomendps[b][i] is the endpoint of the edge joining sub-blossom i to
+    # sub-blossom i+1 of b.
+    blossomendps = (2 * nvertex) * [None]
+
+    # bestedge[b] is the least-slack edge from b to a different S-blossom.
+    bestedge = (2 * nvertex) * [-1]
+
+    # blossombestedges[b] lists the least-slack edges from blossom b to
+    # each neighbouring S-blossom, or is None.
+    blossombestedges = (2 * nvertex) * [None]
+
+    unusedblossoms = list(range(nvertex, 2 * nvertex))
+
+    # dualvar[v] is 2 * u(v) for vertices and z(b) for blossoms.
+    dualvar = nvertex * [maxweight] + nvertex * [0]
+
+    # allowedge[k] is True if edge k is known to have zero slack.
+    allowedge = nedge * [False]
+
+    # S-vertices waiting to be scanned.
+    queue = []
+
+    # Start from a greedy matching of the heaviest edges: they are tight
+    # under the initial duals, so each spares the search a stage. Where most
+    # edges share the top weight, as in a Swiss round's score groups, few
+    # stages are left.
+    if maxweight > 0:
+        for k in range(nedge):
+            (i, j, wt) = edges[k]
+            if wt == maxweight and mate[i] == -1 and mate[j] == -1:
+                mate[i] = 2 * k + 1
+                mate[j] = 2 * k
+
+    def slack(k):
+        (i, j, wt) = edges[k]
+        return dualvar[i] + dualvar[j] - 2 * wt
+
+    def blossomLeaves(b):
+        stack = [b]
+        while stack:
+            t = stack.pop()
+            if t < nvertex:
+                yield t
+            else:
+                stack.extend(blossomchilds[t])
+
+    def assignLabel(w, t, p):
+        b = inblossom[w]
+        label[w] = label[b] = t
+        labelend[w] = labelend[b] = p
+        bestedge[w] = bestedge[b] = -1
+        if t == 1:
+            queue.extend(blossomLeaves(b))
+        elif t == 2:
+            # a T-blossom's mate becomes an S-blossom
+            base = blossombase[b]
+            assignLabel(endpoint[mate[base]], 1, mate[base] ^ 1)
+
+    def scanBlossom(v, w):
+        # Trace back from v and w; return the base of a new blossom, or -1
+        # if the paths reach two single vertices (an augmenting path).
+        path = []
+        base = -1
+        while v != -1 or w != -1:
+            b = inblossom[v]
+            if label[b] & 4:
+                base = blossombase[b]
+                break
+            path.append(b)
+            label[b] = 5
+            if labelend[b] == -1:
+                v = -1
+            else:
+                v = endpoint[labelend[b]]
+                b = inblossom[v]
+                v = endpoint[labelend[b]]
+            if w != -1:
+                v, w = w, v
+        for b in path:
+            label[b] = 1
+        return base
+
+    def addBlossom(base, k):
+        # Build a new S-blossom with the given base around edge k, which
+        # joins two S-vertices.
+        (v, w, wt) = edges[k]
+        bb = inblossom[base]
+        bv = inblossom[v]
+        bw = inblossom[w]
+        b = unusedblossoms.pop()
+        blossombase[b] = base
+        blossomparent[b] = -1
+        blossomparent[bb] = b
+        blossomchilds[b] = path = []
+        blossomendps[b] = endps = []
+        while bv != bb:
+            blossomparent[bv] = b
+            path.append(bv)
+            endps.append(labelend[bv])
+            v = endpoint[labelend[bv]]
+            bv = inblossom[v]
+        path.append(bb)
+        path.reverse()
+        endps.reverse()
+        endps.append(2 * k)
+        while bw != bb:
+            blossomparent[bw] = b
+            path.append(bw)
+            endps.append(labelend[bw] ^ 1)
+            w = endpoint[labelend[bw]]
+            bw = inblossom[w]
+        label[b] = 1
+        labelend[b] = labelend[bb]
+        dualvar[b] = 0
+        for v in blossomLeaves(b):
+            if label[inblossom[v]] == 2:
+                # former T-vertices are now S-vertices and must be scanned
+                queue.append(v)
+            inblossom[v] = b
+        # Collect the least-slack edges to each neighbouring S-blossom.
+        bestedgeto = (2 * nvertex) * [-1]
+        for bv in path:
+            if blossombestedges[bv] is None:
+                nblists = [[p // 2 for p in neighbend[v]]
+                           for v in blossomLeaves(bv)]
+            else:
+                nblists = [blossombestedges[bv]]
+            for nblist in nblists:
+                for k in nblist:
+                    (i, j, wt) = edges[k]
+                    if inblossom[j] == b:
+                        i, j = j, i
+                    bj = inblossom[j]
+                    if (bj != b and label[bj] == 1 and
+                            (bestedgeto[bj] == -1 or
+                             slack(k) < slack(bestedgeto[bj]))):
+                        bestedgeto[bj] = k
+            blossombestedges[bv] = None
+            bestedge[bv] = -1
+        blossombestedges[b] = [k for k in bestedgeto if k != -1]
+        bestedge[b] = -1
+        for k in blossombestedges[b]:
+            if bestedge[b] == -1 or slack(k) < slack(bestedge[b]):
+                bestedge[b] = k
+
+    def expandBlossom(b, endstage):
+        # Turn the sub-blossoms of top-level blossom b into top-level
+        # blossoms, relabeling them if b was a T-blossom mid-stage.
+        for s in blossomchilds[b]:
+            blossomparent[s] = -1
+            if s < nvertex:
+                inblossom[s] = s
+            elif endstage and dualvar[s] == 0:
+                expandBlossom(s, endstage)
+            else:
+                for v in blossomLeaves(s):
+                    inblossom[v] = s
+        if (not endstage) and label[b] == 2:
+            entrychild = inblossom[endpoint[labelend[b] ^ 1]]
+            j = blossomchilds[b].index(entrychild)
+            if j & 1:
+                # odd start index: go forward and wrap
+                j -= len(blossomchilds[b])
+                jstep = 1
+                endptrick = 0
+            else:
+                # even start index: go backward
+                jstep = -1
+                endptrick = 1
+            p = labelend[b]
+            while j != 0:
+                label[endpoint[p ^ 1]] = 0
+                label[endpoint[blossomendps[b][j - endptrick] ^
+                               endptrick ^ 1]] = 0
+                assignLabel(endpoint[p ^ 1], 2, p)
+                allowedge[blossomendps[b][j - endptrick] // 2] = True
+                j += jstep
+                p = blossomendps[b][j - endptrick] ^ endptrick
+                allowedge[p // 2] = True
+                j += jstep
+            # label the base T-sub-blossom without labeling its mate
+            bv = blossomchilds[b][j]
+            label[endpoint[p ^ 1]] = label[bv] = 2
+            labelend[endpoint[p ^ 1]] = labelend[bv] = p
+            bestedge[bv] = -1
+            j += jstep
+            while blossomchilds[b][j] != entrychild:
+                bv = blossomchilds[b][j]
+                if label[bv] == 1:
+                    j += jstep
+                    continue
+                for v in blossomLeaves(bv):
+                    if label[v] != 0:
+                        break
+                if label[v] != 0:
+                    # bv holds a vertex reached from outside; label it T
+                    label[v] = 0
+                    label[endpoint[mate[blossombase[bv]]]] = 0
+                    assignLabel(v, 2, labelend[v])
+                j += jstep
+        label[b] = labelend[b] = -1
+        blossomchilds[b] = blossomendps[b] = None
+        blossombase[b] = -1
+        blossombestedges[b] = None
+        bestedge[b] = -1
+        unusedblossoms.append(b)
+
+    def augmentBlossom(b, v):
+        # Swap matched and unmatched edges along the alternating path
+        # through blossom b from vertex v to the base, making v the new base.
+        t = v
+        while blossomparent[t] != b:
+            t = blossomparent[t]
+        if t >= nvertex:
+            augmentBlossom(t, v)
+        i = j = blossomchilds[b].index(t)
+        if i & 1:
+            j -= len(blossomchilds[b])
+            jstep = 1
+            endptrick = 0
+        else:
+            jstep = -1
+            endptrick = 1
+        while j != 0:
+            j += jstep
+            t = blossomchilds[b][j]
+            p = blossomendps[b][j - endptrick] ^ endptrick
+            if t >= nvertex:
+                augmentBlossom(t, endpoint[p])
+            j += jstep
+            t = blossomchilds[b][j]
+            if t >= nvertex:
+                augmentBlossom(t, endpoint[p ^ 1])
+            mate[endpoint[p]] = p ^ 1
+            mate[endpoint[p ^ 1]] = p
+        blossomchilds[b] = blossomchilds[b][i:] + blossomchilds[b][:i]
+        blossomendps[b] = blossomendps[b][i:] + blossomendps[b][:i]
+        blossombase[b] = blossombase[blossomchilds[b][0]]
+
+    def augmentMatching(k):
+        # Swap matched and unmatched edges along the augmenting path that
+        # runs through edge k between two single vertices.
+        (v, w, wt) = edges[k]
+        for (s, p) in ((v, 2 * k + 1), (w, 2 * k)):
+            while True:
+                bs = inblossom[s]
+                if bs >= nvertex:
+                    augmentBlossom(bs, s)
+                mate[s] = p
+                if labelend[bs] == -1:
+                    break
+                t = endpoint[labelend[bs]]
+                bt = inblossom[t]
+                s = endpoint[labelend[bt]]
+                j = endpoint[labelend[bt] ^ 1]
+                if bt >= nvertex:
+                    augmentBlossom(bt, j)
+                mate[j] = labelend[bt]
+                p = labelend[bt] ^ 1
+
+    # Each stage finds one augmenting path, so there are at most n stages.
+    for stage in range(nvertex):
+        label[:] = (2 * nvertex) * [0]
+        bestedge[:] = (2 * nvertex) * [-1]
+        blossombestedges[nvertex:] = nvertex * [None]
+        allowedge[:] = nedge * [False]
+        queue[:] = []
+        for v in range(nvertex):
+            if mate[v] == -1 and label[inblossom[v]] == 0:
+                assignLabel(v, 1, -1)
+
+        augmented = False
+        while True:
+            # Label everything reachable over tight edges; stop on finding
+            # an augmenting path.
+            while queue and not augmented:
+                v = queue.pop()
+                for p in neighbend[v]:
+                    k = p // 2
+                    w = endpoint[p]
+                    if inblossom[v] == inblossom[w]:
+                        continue
+                    if not allowedge[k]:
+                        kslack = slack(k)
+                        if kslack <= 0:
+                            allowedge[k] = True
+                    if allowedge[k]:
+                        if label[inblossom[w]] == 0:
+                            assignLabel(w, 2, p ^ 1)
+                        elif label[inblossom[w]] == 1:
+                            base = scanBlossom(v, w)
+                            if base >= 0:
+                                addBlossom(base, k)
+                            else:
+                                augmentMatching(k)
+                                augmented = True
+                                break
+                        elif label[w] == 0:
+                            # w sits in a T-blossom; remember how it was
+                            # reached for when the blossom is expanded
+                            label[w] = 2
+                            labelend[w] = p ^ 1
+                    elif label[inblossom[w]] == 1:
+                        b = inblossom[v]
+                        if bestedge[b] == -1 or kslack < slack(bestedge[b]):
+                            bestedge[b] = k
+                    elif label[w] == 0:
+                        if bestedge[w] == -1 or kslack < slack(bestedge[w]):
+                            bestedge[w] = k
+            if augmented:
+                break
+
+            # No augmenting path over tight edges; adjust the duals.
+            deltatype = -1
+            delta = deltaedge = deltablossom = None
+            if not maxcardinality:
+                # delta1: the smallest vertex dual
+                deltatype = 1
+                delta = min(dualvar[:nvertex])
+            for v in range(nvertex):
+                # delta2: least slack from a free vertex to an S-vertex
+                if label[inblossom[v]] == 0 and bestedge[v] != -1:
+                    d = slack(bestedge[v])
+                    if deltatype == -1 or d < delta:
+                        delta = d
+                        deltatype = 2
+                        deltaedge = bestedge[v]
+            for b in range(2 * nvertex):
+                # delta3: half the least slack between two S-blossoms
+                if (blossomparent[b] == -1 and label[b] == 1 and
+                        bestedge[b] != -1):
+                    kslack = slack(bestedge[b])
+                    if allinteger:
+                        d = kslack // 2
+                    else:
+                        d = kslack / 2.0
+                    if deltatype == -1 or d < delta:
+                        delta = d
+                        deltatype = 3
+                        deltaedge = bestedge[b]
+            for b in range(nvertex, 2 * nvertex):
+                # delta4: the smallest dual of a T-blossom
+                if (blossombase[b] >= 0 and blossomparent[b] == -1 and
+                        label[b] == 2 and
+                        (deltatype == -1 or dualvar[b] < delta)):
+                    delta = dualvar[b]
+                    deltatype = 4
+                    deltablossom = b
+            if deltatype == -1:
+                # maximum cardinality reached; finish with a delta1 step
+                deltatype = 1
+                delta = max(0, min(dualvar[:nvertex]))
+
+            for v in range(nvertex):
+                if label[inblossom[v]] == 1:
+                    dualvar[v] -= delta
+                elif label[inblossom[v]] == 2:
+                    dualvar[v] += delta
+            for b in range(nvertex, 2 * nvertex):
+                if blossombase[b] >= 0 and blossomparent[b] == -1:
+                    if label[b] == 1:
+                        dualvar[b] += delta
+                    elif label[b] == 2:
+                        dualvar[b] -= delta
+
+            if deltatype == 1:
+                break
+            elif deltatype == 2:
+                allowedge[deltaedge] = True
+                (i, j, wt) = edges[deltaedge]
+                if label[inblossom[i]] == 0:
+                    i, j = j, i
+                queue.append(i)
+            elif deltatype == 3:
+                allowedge[deltaedge] = True
+                (i, j, wt) = edges[deltaedge]
+                queue.append(i)
+            elif deltatype == 4:
+                expandBlossom(deltablossom, False)
+
+        if not augmented:
+            break
+
+        # End of stage: expand S-blossoms whose dual has dropped to zero.
+        for b in range(nvertex, 2 * nvertex):
+            if (blossomparent[b] == -1 and blossombase[b] >= 0 and
+                    label[b] == 1 and dualvar[b] == 0):
+                expandBlossom(b, True)
+
+    for v in range(nvertex):
+        if mate[v] >= 0:
+            mate[v] = endpoint[mate[v]]
+    return mate
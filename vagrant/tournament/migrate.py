@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+#
+# migrate.py -- versioned schema migrations and query plan checks for the
+# tournament database
+#
+# Usage:
+#   python migrate.py               apply every pending migration
+#   python migrate.py --check SIZE  report sequential scans in the hot
+#                                   queries at SIZE rows per table
+#
+
+import argparse
+import json
+import os
+import re
+
+import tournament
+from tournament import getConnection
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'migrations')
+
+
+def _values(sql, template):
+    """Returns a statement written for a VALUES list with a single row, as
+    the template gives it, in the list's place."""
+    return sql.replace("VALUES %s", "VALUES " + template, 1)
+
+
+# Selective queries run by tournament.py on every round or result, taken
+# from its module constants so that the check plans the very statements the
+# module runs. Queries that list whole tables (membersBySeeding,
+# membersByWins) are left out; a sequential scan is the right plan for them.
+# Their pages are checked, since each should read only its own rows through
+# the index. Each entry is (name, sql, params): params names, in order, the
+# parameters from _planParams() to run sql with, or is None for sql with
+# named parameters, which is run with all of them.
+HOT_QUERIES = [
+    ('countPlayers', tournament._COUNT_PLAYERS, ('t_id',)),
+    ('registerPlayer', tournament._REGISTER_PLAYER, ('t_id', 'p_id')),
+    ('playerStandings', tournament._PLAYER_STANDINGS, ('t_id',)),
+    ('playerRanks', tournament._PLAYER_RANKS, ('t_id',)),
+    ('pairingData', tournament._PAIRING_STANDINGS, ('t_id',)),
+    ('pairingData', tournament._PAIRING_HISTORY, ('t_id',)),
+    ('remainingOpponents', tournament._REMAINING_OPPONENTS,
+     ('t_id', 'p_id')),
+    ('reportMatch', tournament._LOCK_PLAYERS,
+     ('t_id', 'p_ids', 't_id', 'p_ids')),
+    ('reportMatch', _values(tournament._UPDATE_OPPONENT_SCORES,
+                            tournament._RESULT_POINTS),
+     ('t_id', 'p_id', 'wins')),
+    ('reportMatch', _values(tournament._ADD_RESULT_POINTS,
+                            tournament._RESULT_POINTS),
+     ('t_id', 'p_id', 'wins')),
+    ('reportMatch', _values(tournament._INSERT_CARDS,
+                            "(%s, %s, %s, %s, %s)"),
+     ('t_id', 'm_id', 'p_id', 'o_id', 'wins')),
+    ('reportMatch', _values(tournament._INSERT_EVENTS,
+                            "(%s, %s, %s, %s, %s)"),
+     ('t_id', 'm_id', 'p_id', 'o_id', 'draw')),
+    ('reportMatch', _values(tournament._ADD_OPPONENT_RECORDS,
+                            tournament._RESULT_OPPONENTS),
+     ('t_id', 'p_id', 'o_id')),
+    ('endTournament', tournament._ADD_MEMBER_RECORDS, ('t_id',)),
+    ('rateTournament', tournament._TOURNEY_RATED_MATCHES, ('t_id',)),
+    ('membersBySeedingPage',
+     tournament._pageQuery(tournament._MEMBERS_BY_SEEDING, True), None),
+    ('membersByWinsPage',
+     tournament._pageQuery(tournament._MEMBERS_BY_WINS, True), None),
+    ('deleteMatches', tournament._DELETE_TOURNEY_MATCHES, ('t_id',)),
+]
+
+
+def migrationFiles():
+    """Returns the available migrations as a list of tuples (version, name,
+    path), ordered by version. Migration files are named NNN_name.sql."""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = re.match(r'^(\d+)_(\w+)\.sql$', filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2),
+                               os.path.join(MIGRATIONS_DIR, filename)))
+    return sorted(migrations)
+
+
+def schemaVersion():
+    """Returns the version of the last migration applied to the database, or
+    0 if none has been applied."""
+    with getConnection() as (db, c):
+        _createVersionTable(c)
+        c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        version = c.fetchone()[0]
+    return version
+
+
+def migrate(target=None):
+    """Applies every migration newer than the database's schema version, up
+    to and including target if it is given. Each migration runs in its own
+    transaction together with the update of the schema_version table, so a
+    failed migration leaves the database at the previous version.
+
+    Args:
+      target: the version to migrate to; the latest if None.
+
+    Returns:
+      A list of the (version, name) tuples applied.
+    """
+    applied = []
+    current = schemaVersion()
+    for version, name, path in migrationFiles():
+        if version <= current or (target is not None and version > target):
+            continue
+        with open(path) as f:
+            sql = f.read()
+        with getConnection() as (db, c):
+            c.execute(sql)
+            c.execute("INSERT INTO schema_version (version, name) "
+                      "VALUES (%s, %s)", (version, name))
+        applied.append((version, name))
+    return applied
+
+
+def checkQueryPlans(table_size=100000, players_per_tourney=256):
+    """Runs EXPLAIN on every query in HOT_QUERIES against tables of the given
+    size and reports the queries that would read a table sequentially.
+
+    The tables are filled with synthetic members, players and matches and
+    analyzed inside a transaction that is rolled back afterwards, so the
+    check leaves the database unchanged.
+
+    Args:
+      table_size: rows put in each of the members, players and matches
+        tables before planning.
+      players_per_tourney: size of each synthetic tournament.
+
+    Returns:
+      A list of tuples, each of which contains (query, table):
+        query: the name of the hot query, as in HOT_QUERIES
+        table: the table it scans sequentially
+    """
+    tourneys = max(1, table_size // players_per_tourney)
+    seq_scans = []
+    with getConnection() as (db, c):
+        # ANALYZE stores table sizes outside the transaction; hold off
+        # autovacuum, which would store the sizes without the synthetic rows
+        # while the plans are made. Reads and writes are not blocked.
+        c.execute("LOCK TABLE members, players, matches "
+                  "IN SHARE UPDATE EXCLUSIVE MODE")
+        # Synthetic rows use negative ids so they never collide with real
+        # rows; everything is rolled back below.
+        c.execute("INSERT INTO members (id, name, wins, matches) "
+                  "SELECT -g, 'm' || -g, g %% 10, 10 "
+                  "FROM generate_series(1, %s) AS g", (table_size,))
+        c.execute("INSERT INTO players (tourney_id, id, name) "
+                  "SELECT -1 - g %% %s, -g, 'm' || -g "
+                  "FROM generate_series(1, %s) AS g",
+                  (tourneys, table_size))
+        c.execute("INSERT INTO matches (tourney_id, match_id, player_id, "
+                  "opponent_id) "
+                  "SELECT -1 - g %% %s, g, -g, -1 - g "
+                  "FROM generate_series(1, %s) AS g",
+                  (tourneys, table_size))
+        c.execute("ANALYZE members")
+        c.execute("ANALYZE players")
+        c.execute("ANALYZE matches")
+        values = _planParams(tourneys)
+        for name, sql, params in HOT_QUERIES:
+            if params is None:
+                args = values
+            else:
+                args = tuple(values[param] for param in params)
+            c.execute("EXPLAIN (FORMAT JSON) " + sql, args)
+            plan = c.fetchone()[0]
+            if not isinstance(plan, list):
+                plan = json.loads(plan)
+            for table in _seqScans(plan[0]['Plan']):
+                seq_scans.append((name, table))
+        db.rollback()
+    return seq_scans
+
+
+def _planParams(tourneys):
+    """Returns the parameters the hot queries are planned with, by name:
+    t_id and m_id for the first synthetic tournament and round, p_id and
+    o_id for two of its players (p_ids lists p_id), and the rest for a row
+    of a member listing or a result."""
+    return {'t_id': -1, 'm_id': 1, 'p_id': -tourneys, 'p_ids': [-tourneys],
+            'o_id': -2 * tourneys, 'wins': 1, 'draw': False,
+            'id': -tourneys, 'matches': 10, 'seed_score': 1500,
+            'limit': 50}
+
+
+def _seqScans(node):
+    """Yields the relation of every sequential scan in an EXPLAIN plan."""
+    if node.get('Node Type') == 'Seq Scan':
+        yield node.get('Relation Name')
+    for child in node.get('Plans', []):
+        for table in _seqScans(child):
+            yield table
+
+
+def _createVersionTable(c):
+    c.execute("CREATE TABLE IF NOT EXISTS schema_version "
+              "(version integer PRIMARY KEY, "
+              "name text NOT NULL, "
+              "applied_at timestamp DEFAULT now())")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Migrate the tournament database or check its plans.")
+    parser.add_argument('--check', metavar='SIZE', type=int,
+                        help="report sequential scans in the hot queries "
+                             "at SIZE rows per table")
+    args = parser.parse_args()
+    if args.check:
+        seq_scans = checkQueryPlans(args.check)
+        for (name, table) in seq_scans:
+            print("%-20s sequential scan on %s" % (name, table))
+        if not seq_scans:
+            print("No sequential scans at %d rows." % args.check)
+    else:
+        applied = migrate()
+        for (version, name) in applied:
+            print("Applied %03d_%s" % (version, name))
+        print("Schema is at version %d." % schemaVersion())
@@ -0,0 +1,24 @@
+-- Indexes for the hot queries in tournament.py.
+
+-- pairingData, remainingOpponents and rebuildOpponentScores read a
+-- tournament's match history by player.
+CREATE INDEX IF NOT EXISTS matches_player_idx
+  ON matches (tourney_id, player_id);
+
+-- reportMatch and reportRound find the earlier opponents of each player to
+-- keep opponent match wins up to date.
+CREATE INDEX IF NOT EXISTS matches_opponent_idx
+  ON matches (tourney_id, opponent_id);
+
+-- registerMember once looked up the new member by name; it now gets the id
+-- back from its INSERT, and migration 008 drops this index.
+CREATE INDEX IF NOT EXISTS members_name_idx
+  ON members (name);
+
+-- membersByWins and membersBySeeding list members in these orders. Both
+-- have since moved to other indexes: 005 replaces members_wins_idx, and 009
+-- drops members_seeding_idx for members_rating_idx (002).
+CREATE INDEX IF NOT EXISTS members_wins_idx
+  ON members (wins DESC);
+CREATE INDEX IF NOT EXISTS members_seeding_idx
+  ON members ((COALESCE(wins / NULLIF(matches, 0), 0)) DESC);
@@ -0,0 +1,15 @@
+-- Elo ratings used for seeding; see ratings.py.
+
+ALTER TABLE members ADD COLUMN IF NOT EXISTS rating real NOT NULL DEFAULT 1500;
+
+-- Tournaments whose matches are counted in the members' ratings.
+-- endTournament adds a tournament once; recomputeRatings replays them all.
+CREATE TABLE IF NOT EXISTS rated_tourneys
+(
+  tourney_id integer NOT NULL,
+  CONSTRAINT rated_tourneys_pkey PRIMARY KEY (tourney_id)
+);
+
+-- membersBySeeding and registerTopSeeds list members in this order.
+CREATE INDEX IF NOT EXISTS members_rating_idx
+  ON members (rating DESC, (COALESCE(wins / NULLIF(matches, 0), 0)) DESC, id);
@@ -0,0 +1,28 @@
+-- Precomputed schedules; see schedules.py. A scheduled match is stored in
+-- the matches table before it is played, with a NULL match_outcome that
+-- reportMatch fills in.
+
+-- The matches of elimination brackets, by slot. A side whose player is not
+-- known yet names the match it comes from: 'W<slot>' for its winner or
+-- 'L<slot>' for its loser. reportMatch fills in the player and schedules the
+-- match once both sides are known.
+CREATE TABLE IF NOT EXISTS brackets
+(
+  tourney_id integer NOT NULL,
+  slot integer NOT NULL,
+  match_id integer NOT NULL,
+  home_from text,
+  away_from text,
+  home_id integer,
+  away_id integer,
+  CONSTRAINT brackets_pkey PRIMARY KEY (tourney_id, slot)
+);
+
+-- reportMatch finds the bracket matches of a round, then the matches their
+-- winners and losers go on to.
+CREATE INDEX IF NOT EXISTS brackets_round_idx
+  ON brackets (tourney_id, match_id);
+CREATE INDEX IF NOT EXISTS brackets_home_idx
+  ON brackets (tourney_id, home_from);
+CREATE INDEX IF NOT EXISTS brackets_away_idx
+  ON brackets (tourney_id, away_from);
@@ -0,0 +1,30 @@
+-- Append-only log of every result reported; see rebuildStandings(). A
+-- result names its winner and loser, or two players who drew. A void event
+-- cancels the result whose event_id is in voids and names the same players.
+CREATE TABLE IF NOT EXISTS match_events
+(
+  event_id bigserial NOT NULL,
+  tourney_id integer NOT NULL,
+  match_id integer NOT NULL,
+  win_id integer NOT NULL,
+  lose_id integer NOT NULL,
+  draw boolean NOT NULL DEFAULT false,
+  voids bigint,
+  recorded_at timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  CONSTRAINT match_events_pkey PRIMARY KEY (event_id)
+);
+
+-- rebuildStandings replays a tournament's log in order; voidResult and
+-- replaceResult look up a round's results and whether they were voided.
+CREATE INDEX IF NOT EXISTS match_events_tourney_idx
+  ON match_events (tourney_id, match_id);
+CREATE INDEX IF NOT EXISTS match_events_voids_idx
+  ON match_events (voids);
+
+-- Log the results recorded before the log existed, one event per match.
+INSERT INTO match_events (tourney_id, match_id, win_id, lose_id, draw)
+SELECT tourney_id, match_id, player_id, opponent_id, match_outcome = 0.5
+FROM matches
+WHERE match_outcome = 1
+   OR (match_outcome = 0.5 AND player_id < opponent_id)
+ORDER BY tourney_id, match_id, player_id;
@@ -0,0 +1,5 @@
+-- membersByWins lists members by wins, then by id, and membersByWinsPage
+-- continues the listing after a (wins, id) key.
+CREATE INDEX IF NOT EXISTS members_wins_id_idx
+  ON members (wins DESC, id);
+DROP INDEX IF EXISTS members_wins_idx;
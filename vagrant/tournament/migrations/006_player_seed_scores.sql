@@ -0,0 +1,3 @@
+-- Seed scores carry the member's win percentage below the rating's last
+-- digit (see _SEED_SCORE in tournament.py), which a real cannot hold.
+ALTER TABLE players ALTER COLUMN seed_score TYPE double precision;
@@ -0,0 +1,51 @@
+-- Moves a players table of the original schema, which held the players of
+-- a single tournament keyed by id, to players of many tournaments keyed by
+-- (tourney_id, id), with the opponent scores kept by reportMatch. A table
+-- already in that shape is left as it is.
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                 WHERE table_schema = current_schema()
+                 AND table_name = 'players' AND column_name = 'tourney_id')
+  THEN
+    -- The players on file are those of the tournament in progress: the
+    -- latest in matches if they have played in it, else the next one.
+    ALTER TABLE players ADD COLUMN tourney_id integer;
+    UPDATE players SET tourney_id = (
+      SELECT CASE WHEN EXISTS (SELECT 1 FROM matches m, players p
+                               WHERE m.tourney_id = t.latest
+                               AND m.player_id = p.id)
+                  THEN t.latest ELSE t.latest + 1 END
+      FROM (SELECT COALESCE(MAX(tourney_id), 0) AS latest
+            FROM matches) AS t);
+    ALTER TABLE players ALTER COLUMN tourney_id SET NOT NULL;
+
+    -- Player ids are member ids, no longer drawn from a sequence.
+    ALTER TABLE players ALTER COLUMN id DROP DEFAULT;
+    DROP SEQUENCE IF EXISTS players_id_seq;
+    ALTER TABLE players DROP CONSTRAINT players_pkey;
+    ALTER TABLE players ADD CONSTRAINT players_pkey
+      PRIMARY KEY (tourney_id, id);
+
+    ALTER TABLE players ADD COLUMN omw real DEFAULT 0;
+    ALTER TABLE players ADD COLUMN opp_pct real DEFAULT 0;
+    UPDATE players AS p
+      SET omw = x.omw, opp_pct = x.pct
+      FROM (SELECT m.player_id, SUM(o.wins) AS omw,
+                   SUM(GREATEST(o.wins / NULLIF(o.matches, 0), 1.0 / 3))
+                     AS pct
+            FROM matches m
+            JOIN players o ON o.tourney_id = m.tourney_id
+              AND o.id = m.opponent_id
+            WHERE m.match_outcome IS NOT NULL
+            GROUP BY m.player_id) AS x
+      WHERE p.id = x.player_id;
+  END IF;
+END
+$$;
+
+-- Per-tournament standings and ranks; see tournament.sql.
+CREATE INDEX IF NOT EXISTS players_standings_idx
+  ON players (tourney_id, wins DESC, seed_score DESC);
+CREATE INDEX IF NOT EXISTS players_ranks_idx
+  ON players (tourney_id, wins DESC, omw DESC, seed_score DESC);
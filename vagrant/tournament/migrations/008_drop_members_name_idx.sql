@@ -0,0 +1,3 @@
+-- No query looks members up by name since registerMember takes the new id
+-- from its INSERT; the index only slowed down every insert.
+DROP INDEX IF EXISTS members_name_idx;
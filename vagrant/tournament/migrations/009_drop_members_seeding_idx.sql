@@ -0,0 +1,3 @@
+-- membersBySeeding orders by rating first and reads members_rating_idx
+-- (002); the index on win percentage alone serves no query.
+DROP INDEX IF EXISTS members_seeding_idx;
@@ -0,0 +1,443 @@
+#!/usr/bin/env python
+#
+# pairing.py -- in-memory Swiss pairing engine used by tournament.py
+#
+
+import bisect
+import collections
+import heapq
+
+from matching import maxWeightMatching
+
+
+def buildOpponents(history):
+    """Returns a dict mapping each player id to the set of opponent ids that
+    player has already played.
+
+    Args:
+      history: an iterable of (player_id, opponent_id) tuples, as stored in
+        the matches table.
+    """
+    opponents = {}
+    for p_id, o_id in history:
+        opponents.setdefault(p_id, set()).add(o_id)
+        opponents.setdefault(o_id, set()).add(p_id)
+    return opponents
+
+
+class PairingSession(object):
+    """The pairing state of a Swiss tournament kept between rounds: every
+    player's wins and seed, the score groups, and the opponents each player
+    has met. Results and withdrawals are applied as deltas, so preparing the
+    next round costs time in proportion to what changed rather than a fresh
+    load of the whole tournament.
+
+    Args:
+      standings: a list of tuples (id, wins, seed_score), as for
+        pairPlayers().
+      history: an iterable of (player_id, opponent_id) tuples of matches
+        already played.
+    """
+
+    def __init__(self, standings, history):
+        self.opponents = buildOpponents(history)
+        self._wins = {}
+        self._seeds = {}
+        # score groups: each score's players as (seed, -id), lowest seed
+        # first, so that equal seeds come out by id, as membersBySeeding()
+        # lists them
+        self._groups = {}
+        for p_id, wins, seed in standings:
+            self._add(p_id, wins, seed)
+        # the last pairing, and the score groups changed since
+        self._pairs = None
+        self._changed = set()
+
+    def __len__(self):
+        return len(self._wins)
+
+    def _add(self, p_id, wins, seed):
+        self._wins[p_id] = wins
+        self._seeds[p_id] = seed
+        bisect.insort(self._groups.setdefault(wins, []), (seed, -p_id))
+
+    def _remove(self, p_id):
+        wins = self._wins.pop(p_id)
+        seed = self._seeds.pop(p_id)
+        group = self._groups[wins]
+        del group[bisect.bisect_left(group, (seed, -p_id))]
+        if not group:
+            del self._groups[wins]
+        return wins, seed
+
+    def played(self):
+        """Returns True once any match has been played."""
+        return bool(self.opponents)
+
+    def standings(self):
+        """Returns the standings as pairPlayers() takes them: tuples (id,
+        wins, seed_score), ordered by wins then seed_score, best first, and
+        then by id."""
+        return [(-key, wins, seed)
+                for wins in sorted(self._groups, reverse=True)
+                for (seed, key) in reversed(self._groups[wins])]
+
+    def addPlayer(self, p_id, seed, wins=0):
+        """Enters a player, such as the BYE, in the tournament."""
+        self._add(p_id, wins, seed)
+        self._changed.add(wins)
+
+    def removePlayer(self, p_id):
+        """Withdraws a player from the tournament."""
+        wins, seed = self._remove(p_id)
+        self._changed.add(wins)
+
+    def addResults(self, results):
+        """Applies the results of a round, moving each player to the score
+        group of their new score.
+
+        Args:
+          results: a list of tuples (win_id, lose_id, draw), as for
+            tournament.reportRound().
+        """
+        for win_id, lose_id, draw in results:
+            points = .5 if draw else 1
+            for p_id, score in ((win_id, points), (lose_id, 1 - points)):
+                wins, seed = self._remove(p_id)
+                self._add(p_id, wins + score, seed)
+            self.opponents.setdefault(win_id, set()).add(lose_id)
+            self.opponents.setdefault(lose_id, set()).add(win_id)
+        # the next round is still to be paired
+        self._pairs = None
+        self._changed = set()
+
+    def pairRound(self, method='search'):
+        """Returns the pairings for the next round, as pairPlayers() or
+        matchPlayers() does, or None if no pairing avoids a rematch.
+
+        Pairing the same round again returns the same pairs. If players have
+        entered or withdrawn since, the pairs made entirely of players in
+        score groups above every changed group are kept, and only the rest
+        of the field is paired again; should that fail, the whole field is.
+
+        Args:
+          method: 'search' for pairPlayers or 'matching' for matchPlayers.
+        """
+        finders = {'search': pairPlayers, 'matching': matchPlayers}
+        if method not in finders:
+            raise ValueError("Pairing method must be 'search' or "
+                             "'matching'.")
+        if self._pairs is not None and not self._changed:
+            return list(self._pairs)
+        pairs = None
+        standings = self.standings()
+        if self._pairs is not None:
+            top = max(self._changed)
+            kept = [pair for pair in self._pairs
+                    if self._wins.get(pair[0], top) > top and
+                    self._wins.get(pair[1], top) > top]
+            paired = set(p_id for pair in kept for p_id in pair[:2])
+            rest = finders[method]([row for row in standings
+                                    if row[0] not in paired],
+                                   self.opponents)
+            if rest is not None:
+                pairs = kept + rest
+        if pairs is None:
+            pairs = finders[method](standings, self.opponents)
+        self._pairs = pairs
+        self._changed = set()
+        return list(pairs) if pairs is not None else None
+
+
+def pairPlayers(standings, history):
+    """Returns the pairings for a whole round, computed in memory from the
+    standings and opponent history of a tournament.
+
+    Follows the same rules as recursivePairFinder: players are taken in
+    order of standings and each is paired with the not yet played opponent
+    with the closest amount of wins, preferring the lowest seeded one; when a
+    choice leaves the rest of the field unpairable, the search backtracks.
+
+    Args:
+      standings: a list of tuples (id, wins, seed_score), ordered by wins
+        then seed_score, best first.
+      history: an iterable of (player_id, opponent_id) tuples of matches
+        already played, or a dict as returned by buildOpponents().
+
+    Returns:
+      A list of tuples, each of which contains (id1, id2, diff), top table
+      first, or None if no pairing avoids a rematch.
+        id1: the first player's unique id
+        id2: the second player's unique id
+        diff: the absolute difference in players' match points
+    """
+    if isinstance(history, dict):
+        opponents = history
+    else:
+        opponents = buildOpponents(history)
+    order = [row[0] for row in standings]
+    wins = dict((row[0], row[1]) for row in standings)
+    seeds = dict((row[0], row[2]) for row in standings)
+    pairs = _searchPairs(order, wins, seeds,
+                         lambda p_id: opponents.get(p_id, ()))
+    if pairs is None:
+        return None
+    return [(p_id, o_id, abs(wins[p_id] - wins[o_id]))
+            for p_id, o_id in pairs]
+
+
+def pairRoster(roster, order=None):
+    """Returns the pairings for a whole round of a roster.Roster, by the
+    rules of pairPlayers(), working on the roster's arrays and opponent
+    bitsets in place. Players are identified by their index in the roster,
+    and players with the same seed are offered as opponents in index order.
+
+    Args:
+      roster: the players, their scores, seeds and opponents.
+      order: the indexes of the players in order of standings, best first;
+        by default roster.rankOrder().
+
+    Returns:
+      A list of tuples (i, j) of the indexes of the paired players, top
+      table first, or None if no pairing avoids a rematch.
+    """
+    if order is None:
+        order = roster.rankOrder()
+    played = roster.played
+    return _searchPairs(order, roster.scores, roster.seeds,
+                        lambda i: _BitSet(played[i]))
+
+
+class _BitSet(object):
+    """Tests membership of an index in an opponent bitset."""
+    __slots__ = ('bits',)
+
+    def __init__(self, bits):
+        self.bits = bits
+
+    def __contains__(self, i):
+        return self.bits >> i & 1
+
+
+def _searchPairs(order, wins, seeds, played_of):
+    """The search behind pairPlayers() and pairRoster(). Players are keys,
+    ids or indexes, into wins and seeds; played_of(key) returns a container
+    of the keys a player has met. Returns a list of tuples (key1, key2), or
+    None."""
+    # Score groups, highest score first; members of a group are kept in
+    # ascending seed order, the order in which they are offered as opponents.
+    scores = sorted(set(wins[p_id] for p_id in order), reverse=True)
+    group_of = dict((score, g) for g, score in enumerate(scores))
+    groups = [[] for score in scores]
+    for p_id in order:
+        groups[group_of[wins[p_id]]].append((seeds[p_id], p_id))
+    position = {}
+    for g, members in enumerate(groups):
+        members.sort()
+        for idx, (seed, p_id) in enumerate(members):
+            position[p_id] = (g, idx)
+    # heads[g] is the index of the first member of group g not yet paired,
+    # so scans skip the already paired low seeds in constant time.
+    heads = [0] * len(groups)
+    paired = set()
+
+    def mark(p_id):
+        paired.add(p_id)
+        g, idx = position[p_id]
+        members = groups[g]
+        while heads[g] < len(members) and members[heads[g]][1] in paired:
+            heads[g] += 1
+
+    def unmark(p_id):
+        paired.discard(p_id)
+        g, idx = position[p_id]
+        if idx < heads[g]:
+            heads[g] = idx
+
+    def scan(g, played):
+        members = groups[g]
+        idx = heads[g]
+        while idx < len(members):
+            seed, o_id = members[idx]
+            if o_id not in paired and o_id not in played:
+                yield seed, o_id
+            idx += 1
+
+    def candidates(p_id):
+        played = played_of(p_id)
+        g = group_of[wins[p_id]]
+        w = wins[p_id]
+        for seed, o_id in scan(g, played):
+            yield o_id
+        # the other score groups are only scanned once the closer ones run
+        # out, which most players never get to
+        above, below = g - 1, g + 1
+        while above >= 0 or below < len(scores):
+            up = scores[above] - w if above >= 0 else None
+            down = w - scores[below] if below < len(scores) else None
+            if down is None or (up is not None and up < down):
+                stream = scan(above, played)
+                above -= 1
+            elif up is None or down < up:
+                stream = scan(below, played)
+                below += 1
+            else:
+                # equally close score groups are offered by seed together
+                stream = heapq.merge(scan(above, played),
+                                     scan(below, played))
+                above -= 1
+                below += 1
+            for seed, o_id in stream:
+                if o_id not in paired:
+                    yield o_id
+
+    pairs = []
+    stack = []
+    k = 0
+    while True:
+        while k < len(order) and order[k] in paired:
+            k += 1
+        if k == len(order):
+            return pairs
+        p_id = order[k]
+        mark(p_id)
+        stack.append((k, p_id, candidates(p_id)))
+        while True:
+            k, p_id, options = stack[-1]
+            o_id = next(options, None)
+            if o_id is not None:
+                mark(o_id)
+                pairs.append((p_id, o_id))
+                break
+            # no opponent left for p_id; undo the pair chosen one level up
+            unmark(p_id)
+            stack.pop()
+            if not stack:
+                return None
+            unmark(pairs.pop()[1])
+
+
+def fallbackPairs(standings, history, lookahead=8):
+    """Returns a pairing for a whole round in linear time, for when the
+    search takes too long. Taking players in order of standings, each is
+    paired with the first of the next lookahead unpaired players not met
+    yet, or failing that with the next unpaired player, even though they
+    have met before. Unlike pairPlayers this always pairs the whole field,
+    at the cost of an occasional rematch.
+
+    Args:
+      standings: a list of tuples (id, wins, seed_score), ordered by wins
+        then seed_score, best first.
+      history: an iterable of (player_id, opponent_id) tuples of matches
+        already played, or a dict as returned by buildOpponents().
+      lookahead: the unpaired players below each player tried for a pair
+        that is not a rematch.
+
+    Returns:
+      A list of tuples (id1, id2, diff), as for pairPlayers(). With an odd
+      number of players the last one is left out.
+    """
+    if isinstance(history, dict):
+        opponents = history
+    else:
+        opponents = buildOpponents(history)
+    wins = dict((row[0], row[1]) for row in standings)
+    pending = collections.deque(row[0] for row in standings)
+    pairs = []
+    while len(pending) > 1:
+        p_id = pending.popleft()
+        played = opponents.get(p_id, ())
+        pick = 0
+        for k in range(min(lookahead, len(pending))):
+            if pending[k] not in played:
+                pick = k
+                break
+        o_id = pending[pick]
+        del pending[pick]
+        pairs.append((p_id, o_id, abs(wins[p_id] - wins[o_id])))
+    return pairs
+
+
+def matchPlayers(standings, history):
+    """Returns the pairings for a whole round as a minimum-cost perfect
+    matching, solved with Edmonds' blossom algorithm (see matching.py).
+
+    Every pair of players that has not met yet is a candidate pair, costing
+    the difference in their wins; rematches, including a second bye, are
+    left out of the graph entirely. A pairing with the smallest total cost
+    is chosen; then, as long as two of its pairs can swap opponents at no
+    extra cost and without a rematch so as to put higher ranked players
+    against lower ranked ones, they do. Unlike pairPlayers this never
+    backtracks: it takes O(n^3) time whatever the history looks like and
+    finds a pairing whenever one exists.
+
+    Args:
+      standings: a list of tuples (id, wins, seed_score), ordered by wins
+        then seed_score, best first.
+      history: an iterable of (player_id, opponent_id) tuples of matches
+        already played, or a dict as returned by buildOpponents().
+
+    Returns:
+      A list of tuples, each of which contains (id1, id2, diff), top table
+      first, or None if no pairing avoids a rematch.
+        id1: the first player's unique id
+        id2: the second player's unique id
+        diff: the absolute difference in players' match points
+    """
+    if isinstance(history, dict):
+        opponents = history
+    else:
+        opponents = buildOpponents(history)
+    ids = [row[0] for row in standings]
+    wins = [row[1] for row in standings]
+    size = len(ids)
+    if size == 0:
+        return []
+    # Costs are counted in half points so every weight is an integer.
+    costs = []
+    for i in range(size):
+        played = opponents.get(ids[i], ())
+        for j in range(i + 1, size):
+            if ids[j] not in played:
+                costs.append((i, j, int(round(2 * abs(wins[i] - wins[j])))))
+    if not costs:
+        return None
+    # The blossom algorithm maximizes weight. Weights are kept to as few
+    # distinct values as the costs: the more distinct weights, the more
+    # often the algorithm has to adjust its duals, and the slower it runs.
+    highest = max(cost for (i, j, cost) in costs)
+    edges = [(i, j, highest + 1 - cost) for (i, j, cost) in costs]
+    mate = maxWeightMatching(edges, maxcardinality=True)
+    if len(mate) < size or -1 in mate:
+        return None
+    pairs = _spreadPairs([(i, mate[i]) for i in range(size) if i < mate[i]],
+                         wins, lambda i, j: ids[j] in opponents.get(ids[i],
+                                                                    ()))
+    return [(ids[i], ids[j], abs(wins[i] - wins[j])) for (i, j) in pairs]
+
+
+def _spreadPairs(pairs, wins, met):
+    """Swaps opponents between two pairs of standings indexes wherever that
+    costs no more in wins difference, makes no rematch (met(i, j) tells) and
+    widens the spread in rank between paired players, until no swap does.
+    Returns the pairs as (i, j) with i < j, top table first."""
+    def cost(i, j):
+        return abs(wins[i] - wins[j])
+
+    pairs = list(pairs)
+    swapped = True
+    while swapped:
+        swapped = False
+        for x in range(len(pairs)):
+            for y in range(x + 1, len(pairs)):
+                (a, b), (c, d) = pairs[x], pairs[y]
+                current = cost(a, b) + cost(c, d)
+                spread = abs(b - a) + abs(d - c)
+                for (p, q), (r, t) in (((a, c), (b, d)), ((a, d), (b, c))):
+                    if cost(p, q) + cost(r, t) <= current and \
+                            abs(q - p) + abs(t - r) > spread and \
+                            not met(p, q) and not met(r, t):
+                        pairs[x], pairs[y] = (p, q), (r, t)
+                        swapped = True
+                        break
+    return sorted(tuple(sorted(pair)) for pair in pairs)
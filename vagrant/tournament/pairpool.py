@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+#
+# pairpool.py -- runs the pairing searches of many tournaments at once in
+# worker processes, each within a time budget
+#
+
+import multiprocessing
+import threading
+import time
+
+import pairing
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class PairingJob(object):
+    """The pairing of one tournament's round, running in a worker process.
+    Returned by PairingPool.submit()."""
+
+    def __init__(self, standings, opponents, method, budget):
+        self.standings = standings
+        self.opponents = opponents
+        self.method = method
+        self.budget = budget
+        # set when the search ran over its budget and the pairs are
+        # pairing.fallbackPairs()
+        self.fallback = False
+        self.seconds = None
+        self._pairs = None
+        self._error = None
+        self._done = threading.Event()
+
+    def done(self):
+        """Returns True once the pairs are ready."""
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Waits for the pairs and returns them, as pairing.pairPlayers()
+        would: a list of tuples (id1, id2, diff), or None if no pairing
+        avoids a rematch.
+
+        Args:
+          timeout: seconds to wait; None waits until the job is done,
+            which is never much longer than its budget.
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError("The pairing job is still running.")
+        if self._error is not None:
+            raise RuntimeError("The pairing worker failed: %s" % self._error)
+        return self._pairs
+
+
+class PairingPool(object):
+    """Runs pairing searches in up to processes worker processes at a time,
+    so tournaments closing a round together are paired in parallel instead
+    of one after another.
+
+    Each job gets a fresh process, which is stopped once the job's budget
+    runs out; the job then returns pairing.fallbackPairs(), which takes
+    linear time. A stopped search costs nothing more, and a search that runs
+    away cannot hold up the jobs behind it. Jobs beyond processes wait for a
+    free slot, and their budget only starts once they run.
+
+    Args:
+      processes: the most worker processes running at once; one per CPU if
+        None.
+      budget: the seconds a search may take by default.
+    """
+
+    def __init__(self, processes=None, budget=10.0):
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if processes < 1:
+            raise ValueError("A pairing pool needs at least one process.")
+        self.processes = processes
+        self.budget = budget
+        self._slots = threading.BoundedSemaphore(processes)
+        self._lock = threading.Lock()
+        self._stats = {'jobs': 0, 'fallbacks': 0, 'errors': 0}
+        self._closed = False
+
+    def submit(self, standings, opponents, method='search', budget=None):
+        """Starts pairing a round and returns its PairingJob at once.
+
+        Args:
+          standings: a list of tuples (id, wins, seed_score), as for
+            pairing.pairPlayers().
+          opponents: a dict mapping each player id to the set of ids the
+            player has met, as returned by pairing.buildOpponents().
+          method: 'search' for pairPlayers or 'matching' for matchPlayers.
+          budget: the seconds the search may take; the pool's budget if None.
+        """
+        if method not in ('search', 'matching'):
+            raise ValueError("Pairing method must be 'search' or "
+                             "'matching'.")
+        if self._closed:
+            raise RuntimeError("The pairing pool is closed.")
+        job = PairingJob(standings, opponents, method,
+                         self.budget if budget is None else budget)
+        thread = threading.Thread(target=self._run, args=(job,))
+        thread.daemon = True
+        thread.start()
+        return job
+
+    def stats(self):
+        """Returns the pool's counters as a dict with the keys 'jobs',
+        'fallbacks' and 'errors'."""
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self):
+        """Refuses new jobs. Jobs already submitted still run."""
+        self._closed = True
+
+    def _run(self, job):
+        """Runs a job in a worker process, waiting for a free slot first."""
+        with self._slots:
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            worker = multiprocessing.Process(
+                target=_pairInWorker,
+                args=(sender, job.standings, job.opponents, job.method))
+            worker.daemon = True
+            start = _clock()
+            try:
+                worker.start()
+                sender.close()
+                if receiver.poll(job.budget):
+                    error, pairs = receiver.recv()
+                else:
+                    error, pairs = None, None
+                    job.fallback = True
+            except (EOFError, OSError) as e:
+                # the worker died without sending its result
+                error, pairs = repr(e), None
+            finally:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+                receiver.close()
+        if job.fallback:
+            pairs = pairing.fallbackPairs(job.standings, job.opponents)
+        job.seconds = _clock() - start
+        job._pairs = pairs
+        job._error = error
+        with self._lock:
+            self._stats['jobs'] += 1
+            self._stats['fallbacks'] += job.fallback
+            self._stats['errors'] += error is not None
+        job._done.set()
+
+
+def _pairInWorker(sender, standings, opponents, method):
+    """Pairs a round in a worker process and sends back a tuple (error,
+    pairs)."""
+    finders = {'search': pairing.pairPlayers,
+               'matching': pairing.matchPlayers}
+    try:
+        result = (None, finders[method](standings, opponents))
+    except Exception as e:
+        result = (repr(e), None)
+    sender.send(result)
+    sender.close()
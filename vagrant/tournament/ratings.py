@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+#
+# ratings.py -- Elo ratings for seeding, computed with NumPy
+#
+
+import numpy
+
+# Rating of a member who has not played a rated match yet.
+INITIAL_RATING = 1500.0
+
+# Most rating points a single match can move.
+K_FACTOR = 32.0
+
+
+def expectedScores(ratings, opp_ratings):
+    """Returns the expected score of each player against each opponent, given
+    two arrays of ratings."""
+    return 1.0 / (1.0 + 10.0 ** ((opp_ratings - ratings) / 400.0))
+
+
+def eloRatings(ratings, matches, k=K_FACTOR):
+    """Returns the Elo ratings of every player in matches after playing them
+    in order, one round at a time.
+
+    All matches of a round are rated together from the ratings the players
+    had before the round, as whole-array operations, so the Python loop only
+    runs once per round however many matches a round has.
+
+    Args:
+      ratings: a dict mapping player ids to their current rating; players
+        missing from it start at INITIAL_RATING.
+      matches: a list of tuples (round, player_id, opponent_id, score),
+        ordered by round. Each match is listed once; score is the player's
+        result, 1 for a win, .5 for a draw and 0 for a loss.
+      k: the K-factor.
+
+    Returns:
+      A dict mapping the id of every player in matches to the new rating.
+    """
+    if not matches:
+        return {}
+    table = numpy.array(matches, dtype=numpy.float64)
+    rounds = table[:, 0]
+    scores = table[:, 3]
+    ids, index = numpy.unique(table[:, 1:3].astype(numpy.int64).ravel(),
+                              return_inverse=True)
+    players = index[0::2]
+    opponents = index[1::2]
+    current = numpy.array([ratings.get(p_id, INITIAL_RATING)
+                           for p_id in ids.tolist()], dtype=numpy.float64)
+    starts = numpy.flatnonzero(numpy.diff(rounds)) + 1
+    bounds = zip([0] + starts.tolist(), starts.tolist() + [len(rounds)])
+    for start, end in bounds:
+        p = players[start:end]
+        o = opponents[start:end]
+        delta = k * (scores[start:end] - expectedScores(current[p],
+                                                        current[o]))
+        # add.at accumulates correctly should an id appear twice in a round
+        numpy.add.at(current, p, delta)
+        numpy.add.at(current, o, -delta)
+    return dict(zip(ids.tolist(), current.tolist()))
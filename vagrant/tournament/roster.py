@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+#
+# roster.py -- compact, array-backed player state for simulating many
+# tournaments in memory
+#
+
+from array import array
+
+
+class Roster(object):
+    """The players of a tournament as parallel arrays indexed by position:
+    ids, scores and seeds in typed arrays, and the opponents each player has
+    met as a bitset, an int whose bit j is set once the player has met the
+    player at index j. A player costs a few dozen bytes instead of a tuple
+    and a set per player, and copy() is a handful of array copies, so a
+    simulation can reset the same field thousands of times.
+
+    pairing.pairRoster() pairs a roster and rankOrder() ranks it in place,
+    both by index, without building id-keyed tuples.
+
+    Args:
+      ids: the player ids, in index order.
+      scores: the players' match points; all 0 if None.
+      seeds: the players' seed scores; all 0 if None.
+    """
+    __slots__ = ('ids', 'scores', 'seeds', 'played', '_index')
+
+    def __init__(self, ids=(), scores=None, seeds=None):
+        self.ids = array('l', ids)
+        size = len(self.ids)
+        self.scores = array('d', scores if scores is not None
+                            else [0.0] * size)
+        self.seeds = array('d', seeds if seeds is not None else [0.0] * size)
+        if len(self.scores) != size or len(self.seeds) != size:
+            raise ValueError("ids, scores and seeds must be the same length.")
+        self.played = [0] * size
+        self._index = None
+
+    @classmethod
+    def fromStandings(cls, standings, history=()):
+        """Returns a roster of the players in standings, in that order.
+
+        Args:
+          standings: a list of tuples (id, wins, seed_score), as for
+            pairing.pairPlayers().
+          history: an iterable of (player_id, opponent_id) tuples of matches
+            already played; opponents not in standings are left out.
+        """
+        roster = cls([row[0] for row in standings],
+                     [row[1] for row in standings],
+                     [row[2] for row in standings])
+        index = roster.indexes()
+        played = roster.played
+        for p_id, o_id in history:
+            i = index.get(p_id)
+            j = index.get(o_id)
+            if i is not None and j is not None:
+                played[i] |= 1 << j
+                played[j] |= 1 << i
+        return roster
+
+    def __len__(self):
+        return len(self.ids)
+
+    def indexes(self):
+        """Returns a dict mapping each player id to its index."""
+        if self._index is None:
+            self._index = dict((p_id, i) for i, p_id in enumerate(self.ids))
+        return self._index
+
+    def hasPlayed(self, i, j):
+        """Returns True if the players at indexes i and j have met."""
+        return bool(self.played[i] >> j & 1)
+
+    def addResult(self, i, j, points=1.0):
+        """Records a match between the players at indexes i and j, in which
+        i scored points (1 for a win, .5 for a draw) and j the rest."""
+        self.scores[i] += points
+        self.scores[j] += 1 - points
+        self.played[i] |= 1 << j
+        self.played[j] |= 1 << i
+
+    def rankOrder(self):
+        """Returns the indexes of the players by score, then by seed, best
+        first; players still tied keep their index order."""
+        scores = self.scores
+        seeds = self.seeds
+        return sorted(range(len(self.ids)),
+                      key=lambda i: (-scores[i], -seeds[i]))
+
+    def standings(self):
+        """Returns the standings as tuples (id, wins, seed_score), in
+        rankOrder()."""
+        return [(self.ids[i], self.scores[i], self.seeds[i])
+                for i in self.rankOrder()]
+
+    def copy(self):
+        """Returns an independent copy of the roster."""
+        other = Roster.__new__(Roster)
+        other.ids = array('l', self.ids)
+        other.scores = array('d', self.scores)
+        other.seeds = array('d', self.seeds)
+        # bitsets are immutable ints; only the list is copied
+        other.played = list(self.played)
+        other._index = self._index
+        return other
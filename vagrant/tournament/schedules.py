@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+#
+# schedules.py -- round-robin and elimination schedules computed up front
+#
+
+
+def roundRobin(player_ids):
+    """Returns every round of a round-robin, in which each player meets every
+    other player once, scheduled with the circle method: one player stays in
+    place while the others rotate around it, one step per round.
+
+    Args:
+      player_ids: the ids of the players, best seed first.
+
+    Returns:
+      A list of rounds, each a list of tuples (id1, id2). With an odd number
+      of players a different player sits out each round.
+    """
+    ids = list(player_ids)
+    if len(ids) % 2 != 0:
+        # whoever meets None sits the round out
+        ids.append(None)
+    n = len(ids)
+    rounds = []
+    for r in range(n - 1):
+        pairs = []
+        for i in range(n // 2):
+            id1, id2 = ids[i], ids[n - 1 - i]
+            if id1 is not None and id2 is not None:
+                pairs.append((id1, id2))
+        rounds.append(pairs)
+        ids.insert(1, ids.pop())
+    return rounds
+
+
+def seedOrder(size):
+    """Returns the seeds 1 to size in bracket order, so that seed 1 meets
+    seed size in the first round and seeds 1 and 2 can only meet in the
+    final. size must be a power of two."""
+    order = [1]
+    while len(order) < size:
+        last = 2 * len(order) + 1
+        order = [seed for top in order for seed in (top, last - top)]
+    return order
+
+
+def singleElimination(player_ids):
+    """Returns a single-elimination bracket.
+
+    Args:
+      player_ids: the ids of the players, best seed first. If their number
+        is not a power of two, the best seeds get a bye in the first round.
+
+    Returns:
+      A list of tuples (slot, round, home, away), one per match, each after
+      the matches it depends on:
+        slot: the match's number in the bracket, from 1
+        round: the round the match is played in, from 1
+        home, away: the players, each either a player id or a string
+          'W<slot>' or 'L<slot>' standing for the winner or the loser of an
+          earlier match
+    """
+    matches = []
+    _knockout(matches, _firstRound(player_ids), 1)
+    return matches
+
+
+def doubleElimination(player_ids):
+    """Returns a double-elimination bracket, in which a player is out after
+    losing twice. Losers of the winners' bracket drop into a losers'
+    bracket, whose winner meets the winner of the winners' bracket in a
+    single grand final.
+
+    Rounds of the two brackets are interleaved: round r of the winners'
+    bracket is played in round r, and the losers' bracket takes one round
+    to pair the players it has left and another to take in the next losers
+    of the winners' bracket.
+
+    Args:
+      player_ids: as for singleElimination().
+
+    Returns:
+      A list of tuples (slot, round, home, away), as for singleElimination().
+    """
+    matches = []
+    champion, losers = _knockout(matches, _firstRound(player_ids), 1)
+    r = 2
+    survivors = losers[0]
+    if len(survivors) > 1:
+        survivors = _pairUp(matches, survivors, r)
+    for dropping in losers[1:]:
+        r += 1
+        # take the new losers in reverse order, which keeps players who
+        # met in the winners' bracket apart for as long as possible
+        survivors = [_match(matches, r, home, away)[0]
+                     for home, away in zip(survivors, reversed(dropping))]
+        if len(survivors) > 1:
+            r += 1
+            survivors = _pairUp(matches, survivors, r)
+    final_round = max(match[1] for match in matches) + 1
+    _match(matches, final_round, champion, survivors[0])
+    return matches
+
+
+def _firstRound(player_ids):
+    """Returns the players of the first round in bracket order, with None
+    for each missing player of a bracket padded to a power of two."""
+    ids = list(player_ids)
+    if len(ids) < 2:
+        raise ValueError("An elimination bracket needs at least two "
+                         "players.")
+    size = 1
+    while size < len(ids):
+        size *= 2
+    return [ids[seed - 1] if seed <= len(ids) else None
+            for seed in seedOrder(size)]
+
+
+def _knockout(matches, sides, r):
+    """Adds the matches of a knockout bracket between sides, a round at a
+    time from round r, until one side is left. Returns a tuple (champion,
+    losers) of the last side left and the list of each round's losers."""
+    losers = []
+    while len(sides) > 1:
+        results = [_match(matches, r, sides[i], sides[i + 1])
+                   for i in range(0, len(sides), 2)]
+        sides = [winner for winner, loser in results]
+        losers.append([loser for winner, loser in results])
+        r += 1
+    return sides[0], losers
+
+
+def _pairUp(matches, sides, r):
+    """Adds a round of matches between neighbouring sides. Returns the
+    winners."""
+    return [_match(matches, r, sides[i], sides[i + 1])[0]
+            for i in range(0, len(sides), 2)]
+
+
+def _match(matches, r, home, away):
+    """Adds a match between two sides to matches, and returns its (winner,
+    loser). A missing side, None, gives the other side a walkover without
+    adding a match."""
+    if home is None or away is None:
+        return (away if home is None else home), None
+    slot = len(matches) + 1
+    matches.append((slot, r, home, away))
+    return 'W%d' % slot, 'L%d' % slot
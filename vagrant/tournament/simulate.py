@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+#
+# simulate.py -- Monte Carlo simulation of the rounds left in a Swiss
+# tournament
+#
+# Each trial plays the remaining rounds in memory on a roster.Roster,
+# paired by the rules of swissPairings() and decided at random by the
+# players' Elo ratings. Trials run in batches spread over a process pool.
+#
+# Usage:
+#   python simulate.py [--players 1000] [--rounds 9] [--trials 10000]
+#                      [--processes N]
+#
+
+import argparse
+import multiprocessing
+import random
+import time
+
+import numpy
+
+import pairing
+import ratings
+from roster import Roster
+
+# The id swissPairings() gives the BYE, who loses every match.
+BYE_ID = 2147483647
+
+# Trials per batch handed to a worker. Batches, and the random numbers each
+# is seeded with, do not depend on the number of processes, so a seeded
+# simulation gives the same result however it is spread.
+BATCH_SIZE = 100
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+def simulateEvent(standings, history, rounds, trials=10000, top=8,
+                  draw_rate=0.0, processes=None, seed=None):
+    """Returns each player's chance of finishing in the top places once the
+    remaining rounds are played, estimated from trials simulated runs.
+
+    Rounds are paired as swissPairings() pairs them: the first round of a
+    tournament without matches splits the field in halves by seeding, and
+    later rounds run pairing.pairRoster(). A field of odd size gets the BYE.
+    Each match is drawn with chance draw_rate, and otherwise won by either
+    player with the chance of their Elo expected score. Final places are
+    ranked by score, then by seed_score, as playerStandings() ranks them.
+
+    Args:
+      standings: a list of tuples (id, wins, seed_score), as returned by
+        tournament.pairingData(); the seed scores are the players' ratings.
+      history: an iterable of (player_id, opponent_id) tuples of matches
+        already played.
+      rounds: the number of rounds left to play.
+      trials: the number of simulated runs.
+      top: the number of places counted.
+      draw_rate: the chance of any match being drawn.
+      processes: the worker processes to run; None for one per CPU, 1 to
+        run every trial in this process.
+      seed: seeds the random numbers, for a repeatable result.
+
+    Returns:
+      A dict mapping each player id, other than the BYE's, to the share of
+      trials in which the player finished in the top places.
+    """
+    if not 0 <= draw_rate <= 1:
+        raise ValueError("draw_rate must be between 0 and 1.")
+    field = Roster.fromStandings(standings, history)
+    first_round = not any(field.played)
+    if len(field) % 2 != 0:
+        field = Roster.fromStandings(list(standings) + [(BYE_ID, 0, 0)],
+                                     history)
+    state = (list(field.ids), list(field.scores), list(field.seeds),
+             field.played, first_round, rounds, top, draw_rate)
+    rng = random.Random(seed)
+    jobs = []
+    for start in range(0, trials, BATCH_SIZE):
+        jobs.append(state + (min(BATCH_SIZE, trials - start),
+                             rng.randint(0, 2 ** 31 - 1)))
+    if processes == 1 or len(jobs) <= 1:
+        counts = [_runTrials(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            counts = pool.map(_runTrials, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    finished = numpy.sum(counts, axis=0).tolist() if counts else []
+    return dict((p_id, finished[i] / float(trials))
+                for i, p_id in enumerate(field.ids) if p_id != BYE_ID)
+
+
+def _runTrials(job):
+    """Runs a batch of trials. Returns how often each player of the field
+    finished in the top places, as a list in index order."""
+    (ids, scores, seeds, played, first_round, rounds, top, draw_rate,
+     trials, seed) = job
+    base = Roster(ids, scores, seeds)
+    base.played = played
+    bye = base.indexes().get(BYE_ID)
+    ranked = numpy.asarray(seeds, dtype=numpy.float64)
+    rng = numpy.random.RandomState(seed)
+    counts = [0] * len(ids)
+    for trial in range(trials):
+        field = base.copy()
+        for r in range(rounds):
+            if r == 0 and first_round:
+                order = field.rankOrder()
+                half = len(order) // 2
+                pairs = list(zip(order[:half], order[half:]))
+            else:
+                pairs = pairing.pairRoster(field)
+                if pairs is None:
+                    raise ValueError("No pairing avoids a rematch in round "
+                                     "%d of a trial; too many rounds for "
+                                     "the field." % (r + 1))
+            if not pairs:
+                break
+            home = numpy.array([i for (i, j) in pairs])
+            away = numpy.array([j for (i, j) in pairs])
+            roll = rng.random_sample(len(pairs))
+            expected = ratings.expectedScores(ranked[home], ranked[away])
+            points = numpy.where(roll < draw_rate, .5,
+                                 numpy.where(roll < draw_rate + (1 - draw_rate)
+                                             * expected, 1.0, 0.0))
+            if bye is not None:
+                points[away == bye] = 1.0
+                points[home == bye] = 0.0
+            for (i, j), p in zip(pairs, points.tolist()):
+                field.addResult(i, j, p)
+        placed = 0
+        for i in field.rankOrder():
+            if placed == top:
+                break
+            if i != bye:
+                counts[i] += 1
+                placed += 1
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Time a simulation of a synthetic Swiss event.")
+    parser.add_argument('--players', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=9)
+    parser.add_argument('--trials', type=int, default=10000)
+    parser.add_argument('--top', type=int, default=8)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=2015)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    standings = sorted([(i, 0, rng.gauss(ratings.INITIAL_RATING, 200))
+                        for i in range(1, args.players + 1)],
+                       key=lambda row: -row[2])
+    start = _clock()
+    chances = simulateEvent(standings, [], args.rounds, args.trials,
+                            args.top, processes=args.processes,
+                            seed=args.seed)
+    elapsed = _clock() - start
+    print("%d trials of %d players and %d rounds in %.1f seconds" % (
+        args.trials, args.players, args.rounds, elapsed))
+    for p_id, seed in [row[0::2] for row in standings[:args.top]]:
+        print("%6d  rating %6.0f  top %d: %5.1f%%" % (
+            p_id, seed, args.top, 100 * chances[p_id]))
@@ -3,10 +3,88 @@
 # Test cases for tournament.py
 
 from tournament import *
+from migrate import checkQueryPlans, migrate, migrationFiles, schemaVersion
+import argparse
+import backends
+import fixtures
+import pairpool
+import ratings
+import roster
+import simulate
+import tiebreaks
+import tournament
+import io
 import sys
 import math
 
 
+def testConnectionPool():
+    pool = configurePool(minconn=1, maxconn=2, health_check_interval=0)
+    with getConnection() as (db, c):
+        first = db
+    with getConnection() as (db, c):
+        if db is not first:
+            raise ValueError("An idle pooled connection should be reused.")
+    first.close()
+    with getConnection() as (db, c):
+        if db is first:
+            raise ValueError("A broken connection should be replaced.")
+        c.execute("SELECT 1")
+    if pool.size() != (1, 0):
+        raise ValueError("Connections should be returned to the pool.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testMigrations():
+    migrate()
+    if schemaVersion() != migrationFiles()[-1][0]:
+        raise ValueError("The schema should be at the latest migration.")
+    if migrate() != []:
+        raise ValueError("Applied migrations should not be applied again.")
+    seq_scans = checkQueryPlans(100000)
+    if seq_scans:
+        raise ValueError("Hot queries should not scan tables sequentially: "
+                         "%s" % seq_scans)
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testPlayersMigration():
+    """
+    The tourney_players migration moves a players table of the original
+    schema, keyed by id alone, to players keyed by (tourney_id, id) with
+    opponent scores, and leaves a table already moved alone.
+    """
+    [path] = [row[2] for row in migrationFiles() if row[1] == 'tourney_players']
+    with open(path) as migration:
+        sql = migration.read()
+    with getConnection() as (db, c):
+        c.execute("DROP TABLE players")
+        c.execute("CREATE TABLE players (id serial NOT NULL, "
+                  "seed_score real DEFAULT 0, name text, "
+                  "matches integer DEFAULT 0, wins real DEFAULT 0, "
+                  "CONSTRAINT players_pkey PRIMARY KEY (id))")
+        c.execute("INSERT INTO players (id, name, matches, wins) "
+                  "VALUES (1, 'Ann', 1, 1), (2, 'Bo', 1, 0), (3, 'Cal', 0, 0)")
+        c.execute("DELETE FROM matches")
+        c.execute("INSERT INTO matches (match_id, match_outcome, player_id, "
+                  "opponent_id, tourney_id) "
+                  "VALUES (1, 1, 1, 2, 6), (1, 0, 2, 1, 6)")
+        c.execute(sql)
+        c.execute(sql)
+    ranks = [(p_id, omw, round(pct, 3))
+             for (p_id, name, wins, omw, pct) in playerRanks(6)]
+    if ranks != [(1, 0, .333), (2, 1, 1), (3, 0, 0)]:
+        raise ValueError("Migrated players should join the tournament in "
+                         "progress with their opponent scores.")
+    registerPlayer(7, registerMember("Di"))
+    if countPlayers(7) != 1 or countPlayers(6) != 3:
+        raise ValueError("Migrated players should be keyed by tourney.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
 def testRegisterMember():
     member_count = countMembers()
     new_id = registerMember('steven')
@@ -18,6 +96,80 @@ def testRegisterMember():
     return new_id
 
 
+def testImportMembers():
+    """
+    Members with the same name get their own ids, and importMembers adds
+    members from an iterable of rows and from a CSV file.
+    """
+    if registerMember("Twin") == registerMember("Twin"):
+        raise ValueError("Each registration should return its own id.")
+    member_count = countMembers()
+    rows = [("Gus, Jr.", 3, 4), ('Hal "H"', 0, 2), ("Ivy", 1, 1)]
+    if importMembers(rows, ('name', 'wins', 'matches')) != 3:
+        raise ValueError("Every row should be imported.")
+    csv_file = io.StringIO(u"name\nJo\nKay\n")
+    if importMembers(csv_file, header=True) != 2:
+        raise ValueError("Every CSV line after the header should be imported.")
+    if countMembers() != member_count + 5:
+        raise ValueError("Member count should be plus five of previous count")
+    names = set(row[1] for row in membersBySeeding())
+    if not set(["Gus, Jr.", 'Hal "H"', "Jo"]) <= names:
+        raise ValueError("Imported names should be stored unchanged.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testImportUnicodeNames():
+    """
+    Names outside ASCII are imported from rows and from a text file as
+    registerMember stores them.
+    """
+    names = [u"Jos\xe9", u"Zo\xeb"]
+    importMembers([(names[0],)])
+    importMembers(io.StringIO(names[1] + u"\n"))
+    ids = [row[0] for row in membersByWins() if _text(row[1]) in names]
+    registerPlayers(8, ids)
+    if len(playerStandings(8)) != 2 or \
+            sorted(_text(row[1]) for row in playerRanks(8)) != names:
+        raise ValueError("Imported names should be stored unchanged.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def _text(name):
+    """Returns a name read back from the database as text; psycopg2 on
+    Python 2 returns UTF-8 bytes."""
+    return name.decode('utf-8') if isinstance(name, bytes) else name
+
+
+def testMemberListings():
+    """
+    The streamed and paged member listings return the same rows, in the same
+    order, as the full listings, ties included.
+    """
+    rows = [("Lister%d" % i, i % 3, i % 4) for i in range(20)]
+    importMembers(rows, ('name', 'wins', 'matches'))
+    for listing, stream, page in (
+            (membersBySeeding, streamMembersBySeeding, membersBySeedingPage),
+            (membersByWins, streamMembersByWins, membersByWinsPage)):
+        expected = listing()
+        if list(stream(batch_size=3)) != expected:
+            raise ValueError("A stream should yield the full listing.")
+        pages = [page(limit=6)]
+        while len(pages[-1]) == 6:
+            pages.append(page(pages[-1][-1], limit=6))
+        if sum(pages, []) != expected or \
+                len(pages) != len(expected) // 6 + 1:
+            raise ValueError("Pages should add up to the full listing.")
+    rows = streamMembersByWins()
+    next(rows)
+    rows.close()
+    if countMembers() != len(expected):
+        raise ValueError("A closed stream should give its connection back.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
 def testDeleteMembers():
     member_count = countMembers()
     new_id = testRegisterMember()
@@ -31,12 +183,12 @@ def testDeleteMembers():
 
 
 def testAddPlayers():
-    player_count = countPlayers()
+    player_count = countPlayers(1)
     new_id = testRegisterMember()
-    registerPlayer(new_id)
-    if countPlayers() == player_count:
+    registerPlayer(1, new_id)
+    if countPlayers(1) == player_count:
         raise ValueError("Player count should be plus one of previous count")
-    elif countPlayers() == player_count + 1:
+    elif countPlayers(1) == player_count + 1:
         func_name = sys._getframe().f_code.co_name
         print(func_name + " passed!")
     return new_id
@@ -44,20 +196,64 @@ def testAddPlayers():
 
 def testDeletePlayers():
     new_id = testAddPlayers()
-    player_count = countPlayers()
-    deletePlayers(new_id)
-    if countPlayers() == player_count:
+    player_count = countPlayers(1)
+    deletePlayers(1, new_id)
+    if countPlayers(1) == player_count:
         raise ValueError("Player count should be minus one of previous count")
-    elif countPlayers() == player_count - 1:
+    try:
+        deletePlayers(p_id=new_id)
+    except ValueError:
+        pass
+    else:
+        raise ValueError("A player id without a tourney should be refused.")
+    if countPlayers(1) == player_count - 1:
         func_name = sys._getframe().f_code.co_name
         print(func_name + " passed!")
 
 
+def testBulkRegistration():
+    """
+    registerPlayers and registerTopSeeds add a whole field at once, with the
+    same seed scores registerPlayer gives.
+    """
+    ids = [registerMember(name) for name in ("Cy", "Di", "Ed")]
+    if registerPlayers(21, ids + ids[:1]) != 3 or countPlayers(21) != 3:
+        raise ValueError("Each listed member should be registered once.")
+    seeds = membersBySeeding()
+    if registerTopSeeds(22, 2) != 2:
+        raise ValueError("The top seeds should be registered.")
+    top = sorted(row[0] for row in playerSeedings(22))
+    if top != sorted(row[0] for row in seeds[:2]):
+        raise ValueError("The best seeded members should be registered.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testSeededPairings():
+    """
+    Members of equal rating are seeded by win percentage, as
+    membersBySeeding lists them, and the first round pairs by that seeding.
+    """
+    rows = [("Best", 9, 10), ("Mid", 5, 10), ("Low", 1, 10), ("Worst", 0, 10)]
+    importMembers(rows, ('name', 'wins', 'matches'))
+    names = set(row[0] for row in rows)
+    seeded = [row[0] for row in membersBySeeding() if row[1] in names]
+    for p_id in reversed(seeded):
+        registerPlayer(23, p_id)
+    if [row[0] for row in pairingData(23)[0]] != seeded:
+        raise ValueError("Players should be seeded as membersBySeeding.")
+    [best, mid, low, worst] = seeded
+    if swissPairings(23) != [(best, low, 0), (mid, worst, 0)]:
+        raise ValueError("The first round should pair by seeding.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
 def testMemberStandingsBeforeMatches():
     new_id1 = registerMember("Melpomene Murray")
     new_id2 = registerMember("Randy Schwartz")
-    registerPlayer(new_id1)
-    registerPlayer(new_id2)
+    registerPlayer(1, new_id1)
+    registerPlayer(1, new_id2)
     standings = playerStandings(1)
     if len(standings) < 2:
         raise ValueError("Players should appear in playerStandings even before "
@@ -79,8 +275,8 @@ def testReportMatch():
     """
     new_id1 = registerMember('Abdul')
     new_id2 = registerMember('Doah')
-    registerPlayer(new_id2)
-    registerPlayer(new_id1)
+    registerPlayer(123, new_id2)
+    registerPlayer(123, new_id1)
     reportMatch(123, 1, new_id1, new_id2, draw=True)
     for i in playerStandings(123):
         print(i)
@@ -97,194 +293,779 @@ def testReportMatch():
                 raise ValueError("Loser should have 1 match point, 1 for draw"
                                  "in round 1")
 
-    deleteAll()
     players = [registerMember("Bruno Walton"), registerMember("Boots O'Neal"),
                registerMember("Cathy Burton"), registerMember("Diane Grant")]
     for i in players:
-        registerPlayer(i)
-    standings = playersByWins()
+        registerPlayer(124, i)
+    standings = playersByWins(124)
     [id1, id2, id3, id4] = [row[0] for row in standings]
-    reportMatch(123, 1, id1, id2)
-    reportMatch(123, 1, id3, id4)
-    standings = playerStandings(123)
+    reportMatch(124, 1, id1, id2)
+    reportMatch(124, 1, id3, id4)
+    standings = playerStandings(124)
     for (i, w) in standings:
         if i in (id1, id3) and w != 1:
             raise ValueError("Each match winner should have one win recorded.")
         elif i in (id2, id4) and w != 0:
             raise ValueError("Each match loser should have zero wins recorded.")
-    endTournament()
+    endTournament(124)
     func_name = sys._getframe().f_code.co_name
     print(func_name + " passed!")
 
 
-def createTestSet():
+def testOpponentScores():
     """
-    Create mock records. Create mock tourney with rounds. Modify algorithm
-    to have players face opponents within their own brackets of each round,
-    but with opponents opposite ends of that bracket, thereby saving the
-    most even matches for last.
+    Plays three rounds of eight players, with draws, and checks the opponent
+    scores kept by reportMatch and reportRound against a full rebuild.
     """
-    deleteAll()
-    players = [registerMember("A"), registerMember("B"),
-               registerMember("C"), registerMember("D"),
-               registerMember("E"), registerMember("F"),
-               registerMember("G"), registerMember("H"),
-               registerMember("I"), registerMember("J"),
-               registerMember("K"), registerMember("L"),
-               registerMember("M"), registerMember("N"),
-               registerMember("O"), registerMember("P"),
-               registerMember("Q"), registerMember("R"),
-               registerMember("A"), registerMember("B"),
-               registerMember("C"), registerMember("D"),
-               registerMember("E"), registerMember("F"),
-               registerMember("G"), registerMember("H"),
-               registerMember("I"), registerMember("J"),
-               registerMember("K"), registerMember("L"),
-               registerMember("M"), registerMember("N"),
-               registerMember("O"), registerMember("P"),
-               registerMember("Q"), registerMember("R"),]  # 36
-               # registerMember("A"), registerMember("B"),
-               # registerMember("C"), registerMember("D"),
-               # registerMember("E"), registerMember("F"),
-               # registerMember("G"), registerMember("H"),
-               # registerMember("I"), registerMember("J"),
-               # registerMember("K"), registerMember("L"),
-               # registerMember("M"), registerMember("N"),
-               # registerMember("O"), registerMember("P"),
-               # registerMember("Q"), registerMember("R"),
-               # registerMember("A"), registerMember("B"),
-               # registerMember("C"), registerMember("D"),
-               # registerMember("E"), registerMember("F"),
-               # registerMember("G"), registerMember("H"),
-               # registerMember("I"), registerMember("J"),
-               # registerMember("K"), registerMember("L"),
-               # registerMember("M"), registerMember("N"),
-               # registerMember("O"), registerMember("P"),
-               # registerMember("Q"), registerMember("R"),  # 72
-               # registerMember("A"), registerMember("B"),
-               # registerMember("C"), registerMember("D"),
-               # registerMember("E"), registerMember("F"),
-               # registerMember("G"), registerMember("H"),
-               # registerMember("I"), registerMember("J"),
-               # registerMember("K"), registerMember("L"),
-               # registerMember("M"), registerMember("N"),
-               # registerMember("O"), registerMember("P"),
-               # registerMember("Q"), registerMember("R"),
-               # registerMember("A"), registerMember("B"),
-               # registerMember("C"), registerMember("D"),
-               # registerMember("E"), registerMember("F"),
-               # registerMember("G"), registerMember("H"),
-               # registerMember("I"), registerMember("J"),
-               # registerMember("K"), registerMember("L"),
-               # registerMember("M"), registerMember("N"),
-               # registerMember("O"), registerMember("P"),
-               # registerMember("Q"), registerMember("R"),
-               # registerMember("A"), registerMember("B"),
-               # registerMember("C"), registerMember("D"),
-               # registerMember("E"), registerMember("F"),
-               # registerMember("G"), registerMember("H"),
-               # registerMember("I"), registerMember("J"),
-               # registerMember("K"), registerMember("L"),
-               # registerMember("M"), registerMember("N"),
-               # registerMember("O"), registerMember("P"),
-               # registerMember("Q"), registerMember("R"),
-               # registerMember("A"), registerMember("B"),
-               # registerMember("C"), registerMember("D"),
-               # registerMember("E"), registerMember("F"),
-               # registerMember("G"), registerMember("H"),
-               # registerMember("I"), registerMember("J"),
-               # registerMember("K"), registerMember("L"),
-               # registerMember("M"), registerMember("N"),
-               # registerMember("O"), registerMember("P"),
-               # registerMember("Q"), registerMember("R")]
-    # players2 = [registerMember("A"), registerMember("B"),
-    #            registerMember("C"), registerMember("D"),
-    #            registerMember("E"), registerMember("F"),
-    #            registerMember("G"), registerMember("H"),
-    #            registerMember("I"), registerMember("J"),
-    #            registerMember("K"), registerMember("L"),
-    #            registerMember("M"), registerMember("N"),
-    #            registerMember("O"), registerMember("P"),
-    #            registerMember("Q"), registerMember("R"),
-    #            registerMember("A"), registerMember("B"),
-    #            registerMember("C"), registerMember("D"),
-    #            registerMember("E"), registerMember("F"),
-    #            registerMember("G"), registerMember("H"),
-    #            registerMember("I"), registerMember("J"),
-    #            registerMember("K"), registerMember("L"),
-    #            registerMember("M"), registerMember("N"),
-    #            registerMember("O"), registerMember("P"),
-    #            registerMember("Q"), registerMember("R"),
-    #            registerMember("A"), registerMember("B"),
-    #            registerMember("C"), registerMember("D"),
-    #            registerMember("E"), registerMember("F"),
-    #            registerMember("G"), registerMember("H"),
-    #            registerMember("I"), registerMember("J"),
-    #            registerMember("K"), registerMember("L"),
-    #            registerMember("M"), registerMember("N"),
-    #            registerMember("O"), registerMember("P"),
-    #            registerMember("Q"), registerMember("R"),
-    #            registerMember("A"), registerMember("B"),
-    #            registerMember("C"), registerMember("D"),
-    #            registerMember("E"), registerMember("F"),
-    #            registerMember("G"), registerMember("H"),
-    #            registerMember("I"), registerMember("J"),
-    #            registerMember("K"), registerMember("L"),
-    #            registerMember("M"), registerMember("N"),
-    #            registerMember("O"), registerMember("P"),
-    #            registerMember("Q"), registerMember("R"),
-    #            registerMember("A"), registerMember("B"),
-    #            registerMember("C"), registerMember("D"),
-    #            registerMember("E"), registerMember("F"),
-    #            registerMember("G"), registerMember("H"),
-    #            registerMember("I"), registerMember("J"),
-    #            registerMember("K"), registerMember("L"),
-    #            registerMember("M"), registerMember("N"),
-    #            registerMember("O"), registerMember("P"),
-    #            registerMember("Q"), registerMember("R"),
-    #            registerMember("A"), registerMember("B"),
-    #            registerMember("C"), registerMember("D"),
-    #            registerMember("E"), registerMember("F"),
-    #            registerMember("G"), registerMember("H"),
-    #            registerMember("I"), registerMember("J"),
-    #            registerMember("K"), registerMember("L"),
-    #            registerMember("M"), registerMember("N"),
-    #            registerMember("O"), registerMember("P"),
-    #            registerMember("Q"), registerMember("R"),
-    #            registerMember("A"), registerMember("B"),
-    #            registerMember("C"), registerMember("D"),
-    #            registerMember("E"), registerMember("F"),
-    #            registerMember("G"), registerMember("H"),
-    #            registerMember("I"), registerMember("J"),
-    #            registerMember("K"), registerMember("L"),
-    #            registerMember("M"), registerMember("N"),
-    #            registerMember("O"), registerMember("P"),
-    #            registerMember("Q"), registerMember("R"),
-    #            registerMember("A"), registerMember("B"),
-    #            registerMember("C"), registerMember("D"),
-    #            registerMember("E"), registerMember("F"),
-    #            registerMember("G"), registerMember("H"),
-    #            registerMember("I"), registerMember("J"),
-    #            registerMember("K"), registerMember("L"),
-    #            registerMember("M"), registerMember("N"),
-    #            registerMember("O"), registerMember("P"),
-    #            registerMember("Q"), registerMember("R")]
-    # 288
-    #players.extend(players2)
-    # 576
-    #players.extend(players2)
-    #players.extend(players2)
-
-    db, c = connect()
-    x = countMembers()
-    y = countMembers()
+    players = [registerMember(name) for name in "ABCDEFGH"]
+    for i in players:
+        registerPlayer(5, i)
+    [a, b, c, d, e, f, g, h] = players
+    reportRound(5, 1, [(a, b, False), (c, d, False), (e, f, True),
+                       (g, h, False)])
+    reportRound(5, 2, [(a, c, False), (e, g, False), (b, d, True),
+                       (f, h, False)])
+    reportMatch(5, 3, a, e)
+    reportMatch(5, 3, c, b, draw=True)
+    reportMatch(5, 3, d, f)
+    reportMatch(5, 3, h, g)
+    ranks = playerRanks(5)
+    rebuildOpponentScores(5)
+    rebuilt = dict((row[0], row) for row in playerRanks(5))
+    for (p_id, name, wins, omw, omw_pct) in ranks:
+        if (wins, omw) != rebuilt[p_id][2:4] or \
+                abs(omw_pct - rebuilt[p_id][4]) > 1e-4:
+            raise ValueError("Opponent scores kept by reportMatch should "
+                             "match a rebuild from the matches table.")
+    # a beat b (1), c (1.5) and e (1.5): omw 4, omw_pct (1/3 + .5 + .5) / 3
+    (p_id, name, wins, omw, omw_pct) = ranks[0]
+    if p_id != a or wins != 3 or omw != 4 or abs(omw_pct - 4 / 9.0) > 1e-4:
+        raise ValueError("Player A should rank first with an OMW of 4.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testConcurrentWriters():
+    """
+    Fifty threads report each of three rounds of fifty matches at once, each
+    reporting its own match and then another thread's, so every match is
+    submitted twice. Each must count once, without a deadlock, and the
+    opponent scores must come out as a rebuild from the matches table gives
+    them.
+    """
+    import threading
+    writers = 50
+    registerPlayers(97, [registerMember("Writer%d" % i)
+                         for i in range(2 * writers)])
+    reportRound(97, 1, [(id1, id2, False)
+                        for (id1, id2, diff) in swissPairings(97)])
+    # one connection per writer; the test's own pool is put back afterwards
+    pool = tournament._pool
+    if tournament._backend.maxconn is None:
+        configurePool(maxconn=writers)
+    outcomes = []
+
+    def writer(start, m_id, pairs, k):
+        start.wait()
+        for (id1, id2, diff) in (pairs[k], pairs[(k + 1) % writers]):
+            try:
+                reportMatch(97, m_id, id1, id2, draw=k % 5 == 0)
+                outcomes.append('recorded')
+            except ValueError:
+                outcomes.append('refused')
+            except Exception as e:
+                outcomes.append(repr(e))
+    try:
+        for m_id in (2, 3, 4):
+            start = threading.Event()
+            pairs = swissPairings(97)
+            threads = [threading.Thread(target=writer,
+                                        args=(start, m_id, pairs, k))
+                       for k in range(writers)]
+            for thread in threads:
+                thread.start()
+            start.set()
+            for thread in threads:
+                thread.join()
+    finally:
+        if tournament._pool is not pool:
+            configurePool(pool.minconn, pool.maxconn,
+                          pool.health_check_interval, pool.timeout)
+    if tournament._pool.maxconn != pool.maxconn:
+        raise ValueError("The pool should be restored after the writers.")
+    if sorted(outcomes) != ['recorded'] * 3 * writers + \
+            ['refused'] * 3 * writers:
+        raise ValueError("Each match should be recorded exactly once: %s"
+                         % sorted(set(outcomes)))
+    if sum(wins for (p_id, wins) in playerStandings(97)) != 4 * writers or \
+            len(matchEvents(97)) != 4 * writers:
+        raise ValueError("Every match should count once in the standings.")
+    ranks = playerRanks(97)
+    rebuildOpponentScores(97)
+    rebuilt = dict((row[0], row) for row in playerRanks(97))
+    for (p_id, name, wins, omw, omw_pct) in ranks:
+        if (wins, omw) != rebuilt[p_id][2:4] or \
+                abs(omw_pct - rebuilt[p_id][4]) > 1e-4:
+            raise ValueError("Concurrent writers should keep the opponent "
+                             "scores a rebuild gives.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testPairingEngine():
+    """
+    Pairs a synthetic 10,000 player field in memory for a few rounds and
+    checks that every player is paired exactly once, never twice against
+    the same opponent, and that each round is paired within seconds.
+    """
+    import random
+    import time
+    random.seed(10000)
+    ids = range(1, 10001)
+    seeds = dict((i, random.random()) for i in ids)
+    wins = dict((i, 0) for i in ids)
+    history = set()
+    for current_round in range(5):
+        standings = sorted([(i, wins[i], seeds[i]) for i in ids],
+                           key=lambda row: (-row[1], -row[2]))
+        start = time.time()
+        pairs = pairing.pairPlayers(standings, history)
+        elapsed = time.time() - start
+        paired = set()
+        for (id1, id2, diff) in pairs:
+            if id1 in paired or id2 in paired:
+                raise ValueError("A player should be paired only once.")
+            if (id1, id2) in history:
+                raise ValueError("Players should not be paired twice.")
+            paired.update((id1, id2))
+            winner = random.choice((id1, id2))
+            wins[winner] += 1
+            history.update([(id1, id2), (id2, id1)])
+        if len(paired) != len(ids):
+            raise ValueError("Every player should be paired.")
+        if elapsed > 5:
+            raise ValueError("Pairing 10,000 players took %.1f seconds; it "
+                             "should take well under one." % elapsed)
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testRoster():
+    """
+    A roster pairs and ranks a field by index as pairPlayers and the
+    standings do by id, and plays a 256 player field through eight rounds
+    without a rematch.
+    """
+    import random
+    random.seed(256)
+    standings = sorted([(i, 2 - i // 4, random.random())
+                        for i in range(1, 13)],
+                       key=lambda row: (-row[1], -row[2]))
+    history = [(1, 5), (9, 12), (2, 3)]
+    field = roster.Roster.fromStandings(standings, history)
+    ids = field.ids
+    pairs = [(ids[i], ids[j]) for (i, j) in pairing.pairRoster(field)]
+    if pairs != [pair[:2] for pair
+                 in pairing.pairPlayers(standings, history)]:
+        raise ValueError("A roster should pair as pairPlayers does.")
+    other = field.copy()
+    other.addResult(0, 11, .5)
+    if field.hasPlayed(0, 11) or not other.hasPlayed(11, 0) or \
+            other.scores[11] != field.scores[11] + .5:
+        raise ValueError("A copy should take results on its own.")
+    if other.standings() != sorted(
+            [(p_id, wins + .5 * (p_id in (1, 12)), seed)
+             for (p_id, wins, seed) in standings],
+            key=lambda row: (-row[1], -row[2])):
+        raise ValueError("A roster should rank by score, then seed.")
+
+    field = roster.Roster(range(1000, 1256),
+                          seeds=[random.random() for i in range(256)])
+    for current_round in range(8):
+        pairs = pairing.pairRoster(field)
+        if pairs is None or len(pairs) != 128 or \
+                len(set(i for pair in pairs for i in pair)) != 256:
+            raise ValueError("Every player should be paired once a round.")
+        for (i, j) in pairs:
+            if field.hasPlayed(i, j):
+                raise ValueError("Players should not be paired twice.")
+            field.addResult(i, j, random.choice((0, .5, 1)))
+    if sum(field.scores) != 8 * 128:
+        raise ValueError("Every match should hand out one point.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testSimulation():
+    """
+    Simulated chances of making the top places add up to the places
+    counted, favour the strongest player, and do not depend on how the
+    trials are spread over processes.
+    """
+    standings = [(1, 0, 2400)] + [(i, 0, 1500 - i) for i in range(2, 17)]
+    chances = simulate.simulateEvent(standings, [], 4, trials=300, top=8,
+                                     processes=1, seed=7)
+    if abs(sum(chances.values()) - 8) > 1e-9 or chances[1] < .9:
+        raise ValueError("Chances should add up to the places counted.")
+    if simulate.simulateEvent(standings, [], 4, trials=300, top=8,
+                              processes=2, seed=7) != chances:
+        raise ValueError("A seeded simulation should be repeatable.")
+
+    ids = [registerMember("Sim%d" % i) for i in range(7)]
+    registerPlayers(92, ids)
+    pairs = swissPairings(92)
+    reportRound(92, 1, [(id1, id2, False) for (id1, id2, diff) in pairs])
+    chances = simulateTournament(92, 2, trials=200, top=3, seed=1)
+    if sorted(chances) != sorted(ids) or \
+            abs(sum(chances.values()) - 3) > 1e-9:
+        raise ValueError("Every player but the BYE should get a chance.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testPairingPool():
+    """
+    Searches run in the pairing pool give the pairs of the search run in
+    process, a search over its budget falls back to a full pairing, and
+    several tourneys are paired at once.
+    """
+    import random
+    random.seed(2000)
+    standings = [(i, i % 3, random.random()) for i in range(1, 2001)]
+    standings.sort(key=lambda row: (-row[1], -row[2]))
+    opponents = pairing.buildOpponents((i, i + 1) for i in range(1, 2000))
+    pool = pairpool.PairingPool(processes=2, budget=60)
+    jobs = [pool.submit(standings, opponents) for i in range(3)]
+    late = pool.submit(standings, opponents, budget=0)
+    expected = pairing.pairPlayers(standings, opponents)
+    for job in jobs:
+        if job.result() != expected or job.fallback:
+            raise ValueError("A pooled search should pair as pairPlayers.")
+    pairs = late.result()
+    if not late.fallback or len(pairs) != 1000 or \
+            len(set(sum([pair[:2] for pair in pairs], ()))) != 2000:
+        raise ValueError("A search over budget should fall back.")
+    if pool.stats() != {'jobs': 4, 'fallbacks': 1, 'errors': 0}:
+        raise ValueError("The pool should count its jobs.")
+
+    t_ids = (93, 94, 95)
+    for t_id in t_ids:
+        registerPlayers(t_id, [registerMember("Pool%d" % i)
+                               for i in range(8)])
+    configurePairingPool(processes=2, budget=60)
+    for current_round in (1, 2):
+        paired = pairTournaments(t_ids)
+        for t_id in t_ids:
+            fresh = pairing.PairingSession(*pairingData(t_id))
+            if current_round == 2 and paired[t_id] != fresh.pairRound():
+                raise ValueError("pairTournaments should pair as "
+                                 "swissPairings.")
+            reportRound(t_id, current_round,
+                        [(id1, id2, False) for (id1, id2, d)
+                         in paired[t_id]])
+    if len(swissPairings(93, budget=60)) != 4:
+        raise ValueError("swissPairings should pair in the pool.")
+    closePairingPool()
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testPairingSession():
+    """
+    A pairing session kept between rounds holds the same standings as one
+    loaded afresh, pairs the next round without queries, and after a
+    withdrawal re-pairs only the score groups below it.
+    """
+    standings = [(i, 2 - i // 4, -i) for i in range(1, 13)]
+    session = pairing.PairingSession(standings, [(1, 5), (9, 12)])
+    pairs = session.pairRound()
+    if pairs != pairing.pairPlayers(standings, [(1, 5), (9, 12)]) or \
+            session.pairRound() != pairs:
+        raise ValueError("A session should pair as pairPlayers does.")
+    low = [pair for pair in pairs if pair[0] >= 8]
+    session.removePlayer(low[0][0])
+    session.removePlayer(low[0][1])
+    repaired = session.pairRound()
+    if [pair for pair in repaired if pair[0] < 8] != \
+            [pair for pair in pairs if pair[0] < 8] or len(repaired) != 5:
+        raise ValueError("A withdrawal should keep the pairs above it.")
+
+    ids = [registerMember("Session%d" % i) for i in range(8)]
+    registerPlayers(91, ids)
+    for current_round in (1, 2):
+        pairs = swissPairings(91)
+        reportRound(91, current_round,
+                    [(id1, id2, False) for (id1, id2, diff) in pairs])
+    fresh = pairing.PairingSession(*pairingData(91))
+    if set(tournament._sessions[91].standings()) != set(fresh.standings()):
+        raise ValueError("Results should be applied to the session.")
+    deletePlayers(91, ids[0])
+    deletePlayers(91, ids[1])
+    inst = enableInstrumentation()
+    pairs = swissPairings(91)
+    statements = inst.stats()['swissPairings']['statements']
+    disableInstrumentation()
+    if statements != 0 or len(pairs) != 3 or \
+            set(ids[:2]) & set(sum([pair[:2] for pair in pairs], ())):
+        raise ValueError("Later rounds should be paired from the session.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def playSchedule(t_id):
+    """Reports every scheduled match of a tournament, round by round, with
+    the lower id winning. Returns the list of (win_id, lose_id) played."""
+    played = []
+    m_id = 1
+    while scheduledMatches(t_id):
+        results = [(id1, id2, False)
+                   for (r, id1, id2) in scheduledMatches(t_id, m_id)]
+        reportRound(t_id, m_id, results)
+        played.extend((id1, id2) for (id1, id2, draw) in results)
+        m_id += 1
+    return played
+
+
+def testSchedules():
+    """
+    A round-robin pairs every player with every other once, one match per
+    player per round. An elimination bracket schedules each match once both
+    its players are known, and knocks out every player but one.
+    """
+    ids = [registerMember("Sched%d" % i) for i in range(6)]
+    registerPlayers(71, ids[:5])
+    rounds = scheduleRoundRobin(71)
+    pairs = [frozenset(pair) for matches in rounds for pair in matches]
+    if len(rounds) != 5 or len(pairs) != 10 or len(set(pairs)) != 10 or \
+            any(len(set(sum(matches, ()))) != 4 for matches in rounds):
+        raise ValueError("Every pair of players should meet once.")
+    if len(scheduledMatches(71)) != 10 or playerStandings(71)[0][1] != 0:
+        raise ValueError("Scheduled matches should wait to be played.")
+    try:
+        reportMatch(71, 1, rounds[1][0][0], rounds[1][0][1])
+    except ValueError:
+        pass
+    else:
+        raise ValueError("A result should match the schedule.")
+    if len(playSchedule(71)) != 10 or \
+            sum(wins for (p_id, wins) in playerStandings(71)) != 10:
+        raise ValueError("Results should fill in the scheduled matches.")
+    try:
+        scheduleRoundRobin(71)
+    except ValueError:
+        pass
+    else:
+        raise ValueError("A tournament should only be scheduled once.")
+    registerPlayers(72, ids)
+    if len(scheduleElimination(72)) != 5 or len(scheduledMatches(72)) != 2:
+        raise ValueError("Only the first round should have its players.")
+    first = scheduledMatches(72, 1)[0]
+    try:
+        reportMatch(72, 1, first[1], first[2], draw=True)
+    except ValueError:
+        pass
+    else:
+        raise ValueError("A bracket match should not be a draw.")
+    played = playSchedule(72)
+    losers = set(lose_id for (win_id, lose_id) in played)
+    if len(played) != 5 or len(losers) != 5 or min(ids) in losers:
+        raise ValueError("Every player but the champion should be out.")
+    registerPlayers(73, ids[:4])
+    scheduleElimination(73, double=True)
+    played = playSchedule(73)
+    losses = [lose_id for (win_id, lose_id) in played]
+    if len(played) != 6 or \
+            sorted(losses.count(p_id) for p_id in ids[:4]) != [0, 2, 2, 2]:
+        raise ValueError("Double elimination should take two losses.")
+    for t_id in (71, 72, 73):
+        endTournament(t_id)
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testMatchingPairing():
+    """
+    Six players where the top two have already met each other, the third
+    and fourth placed players, and the second has met the fifth. Only one
+    pairing avoids a rematch; both pairing methods must find it. Matching
+    pairs every round of a 400 player event within seconds.
+    """
+    standings = [(1, 2, 0.9), (2, 2, 0.8), (3, 1, 0.7), (4, 1, 0.6),
+                 (5, 0, 0.5), (6, 0, 0.4)]
+    history = [(1, 2), (1, 3), (1, 4), (2, 3), (2, 4), (2, 5), (3, 5),
+               (4, 6)]
+    expected = set([frozenset((1, 5)), frozenset((2, 6)), frozenset((3, 4))])
+    for pair_finder in (pairing.pairPlayers, pairing.matchPlayers):
+        pairs = pair_finder(standings, history)
+        if set(frozenset((id1, id2)) for (id1, id2, diff) in pairs) != expected:
+            raise ValueError("Pairings should avoid every rematch.")
+    if pairing.matchPlayers(standings, history + [(1, 5), (1, 6)]) is not None:
+        raise ValueError("Matching should report when no pairing exists.")
+
+    # four rounds of a 400 player event, each paired in well under a second
+    import random
+    import time
+    random.seed(400)
+    wins = dict((p_id, 0) for p_id in range(1, 401))
+    seeds = dict((p_id, random.random()) for p_id in wins)
+    history = []
+    for current_round in range(4):
+        standings = sorted([(p_id, wins[p_id], seeds[p_id]) for p_id in wins],
+                           key=lambda row: (-row[1], -row[2]))
+        start = time.time()
+        pairs = pairing.matchPlayers(standings, history)
+        if time.time() - start > 3:
+            raise ValueError("Matching 400 players should take seconds at "
+                             "most.")
+        met = set(frozenset(match) for match in history)
+        if len(set(sum([pair[:2] for pair in pairs], ()))) != 400 or \
+                met & set(frozenset(pair[:2]) for pair in pairs):
+            raise ValueError("Every player should be paired, without "
+                             "rematches.")
+        for (id1, id2, diff) in pairs:
+            wins[random.choice((id1, id2))] += 1
+            history.append((id1, id2))
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testBenchmark():
+    """
+    Runs the benchmark on a 16 player pool: every registration, pairing and
+    result must be recorded with the statements it ran, pairings after the
+    first round need none, the synthetic members must be removed and the
+    caller's backend restored afterwards.
+    """
+    # PostgreSQL only: the benchmark counts statements on psycopg2 cursors
+    import benchmark
+    members = countMembers()
+    backend = tournament._backend
+    result = benchmark.runBenchmark([16], track_memory=False)
+    if tournament._backend is not backend:
+        raise ValueError("The benchmark should restore the backend in use.")
+    calls = dict(((r['round'], r['function']), r)
+                 for r in result['records'])
+    if calls[(0, 'registerPlayers')]['queries'] != 1:
+        raise ValueError("The field should be registered in one statement.")
+    for current_round in range(1, 5):
+        if calls[(current_round, 'swissPairings')]['calls'] != 1:
+            raise ValueError("Each round should be paired once.")
+        if calls[(current_round, 'reportMatch')]['calls'] != 8:
+            raise ValueError("Each round should report 8 matches.")
+    for r in result['records']:
+        if r['function'] == 'swissPairings' and r['round'] > 1:
+            if r['queries'] != 0:
+                raise ValueError("Later rounds should be paired from the "
+                                 "pairing session, without queries.")
+        elif r['queries'] < r['calls']:
+            raise ValueError("Every call should run at least one statement.")
+    if countMembers() != members:
+        raise ValueError("The benchmark should remove its members.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testTiebreaks():
+    """
+    Tiebreaks computed in memory agree with the opponent scores kept in the
+    players table, and a 5,000 player field of 12 rounds is scored in
+    milliseconds.
+    """
+    import random
+    import time
+    players = [registerMember(name) for name in "ABCDEFGH"]
+    registerPlayers(41, players)
+    [a, b, c, d, e, f, g, h] = players
+    reportRound(41, 1, [(a, b, False), (c, d, False), (e, f, True),
+                        (g, h, False)])
+    reportRound(41, 2, [(a, c, False), (e, g, False), (b, d, True),
+                        (f, h, False)])
+    reportRound(41, 3, [(a, e, False), (c, b, True), (d, f, False),
+                        (h, g, False)])
+    ranks = dict((row[0], row) for row in playerRanks(41))
+    rows = playerTiebreaks(41)
+    for (p_id, name, score, omw_pct, buchholz, sb, cumulative) in rows:
+        if (score, buchholz) != ranks[p_id][2:4] or \
+                abs(omw_pct - ranks[p_id][4]) > 1e-4:
+            raise ValueError("Tiebreaks should match playerRanks.")
+    # a beat b (1), c (1.5) and e (1.5), scoring 1, 2 and 3 after each round
+    if rows[0][0] != a or rows[0][4:] != (4, 4, 6):
+        raise ValueError("Player A should rank first with a Buchholz of 4, "
+                         "a Sonneborn-Berger of 4 and a cumulative of 6.")
+    by_buchholz = playerTiebreaks(41, ('buchholz',))
+    if [row[4] for row in by_buchholz] != \
+            sorted([row[4] for row in rows], reverse=True):
+        raise ValueError("Players should rank by the tiebreaks asked for.")
+
+    random.seed(5000)
+    ids = list(range(1, 5001))
+    cards = []
+    for current_round in range(1, 13):
+        random.shuffle(ids)
+        for i in range(0, 5000, 2):
+            score = random.choice((0, .5, 1))
+            cards.append((current_round, ids[i], ids[i + 1], score))
+            cards.append((current_round, ids[i + 1], ids[i], 1 - score))
+    start = time.time()
+    opponents, scores = tiebreaks.resultMatrix(ids, cards)
+    order = tiebreaks.rankOrder(tiebreaks.computeTiebreaks(opponents, scores))
+    elapsed = time.time() - start
+    if sorted(order.tolist()) != list(range(5000)):
+        raise ValueError("Every player should be ranked once.")
+    print("5,000 players and 12 rounds ranked in %.3f seconds" % elapsed)
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testEventLog():
+    """
+    Every result is logged. Voiding or replacing a result leaves the
+    standings the corrected results would have given, and a rebuild from the
+    log restores standings edited by hand, replaying 100,000 results in
+    seconds.
+    """
+    import random
+    import time
+    ids = [registerMember("Log%d" % i) for i in range(6)]
+    [a, b, c, d, e, f] = ids
+    registerPlayers(81, ids)
+    registerPlayers(82, ids)
+    reportRound(81, 1, [(a, b, False), (c, d, False), (e, f, True)])
+    reportRound(81, 2, [(a, c, False), (b, e, False), (d, f, False)])
+    if replaceResult(81, 1, b, a) != (a, b, False) or \
+            voidResult(81, 2, f) != (d, f, False):
+        raise ValueError("A correction should return the result it voids.")
+    reportRound(82, 1, [(b, a, False), (c, d, False), (e, f, True)])
+    reportRound(82, 2, [(a, c, False), (b, e, False)])
+
+    def ranks(t_id):
+        return sorted((p_id, wins, omw, round(omw_pct, 4))
+                      for (p_id, name, wins, omw, omw_pct)
+                      in playerRanks(t_id))
+    if ranks(81) != ranks(82):
+        raise ValueError("Corrections should update the standings.")
+    events = matchEvents(81)
+    if len(events) != 9 or [event[5] is None for event in events] != \
+            [True] * 6 + [False, True, False]:
+        raise ValueError("Results and corrections should be logged.")
+    try:
+        voidResult(81, 2, f)
+    except ValueError:
+        pass
+    else:
+        raise ValueError("A voided result should not be voided again.")
+    with getConnection() as (db, cursor):
+        cursor.execute("UPDATE players SET wins = 9, omw = 9 "
+                       "WHERE tourney_id = 81")
+    clearStandingsCache()
+    if rebuildStandings(81) != 5 or ranks(81) != ranks(82):
+        raise ValueError("A rebuild should replay the log.")
+
+    players = [registerMember("Replay%d" % i) for i in range(1000)]
+    registerPlayers(83, players)
+    random.seed(83)
+    events = []
+    for current_round in range(1, 201):
+        random.shuffle(players)
+        for i in range(0, 1000, 2):
+            events.append((83, current_round, players[i], players[i + 1],
+                           random.random() < .1))
+    with getConnection() as (db, cursor):
+        tournament._backend.executeValues(
+            cursor, "INSERT INTO match_events (tourney_id, match_id, "
+                    "win_id, lose_id, draw) VALUES %s", events)
+    start = time.time()
+    if rebuildStandings(83) != 100000:
+        raise ValueError("Every logged result should be replayed.")
+    elapsed = time.time() - start
+    if countPlayers(83) != 1000 or \
+            sum(wins for (p_id, wins) in playerStandings(83)) != 100000:
+        raise ValueError("A rebuild should restore every player.")
+    print("100,000 results replayed in %.3f seconds" % elapsed)
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testRatings():
+    """
+    Elo ratings move by the K-factor's share of each surprise, rate a round
+    from the ratings before it, keep the total of all ratings constant, and
+    are applied to members once when their tournament ends.
+    """
+    import random
+    import time
+    new = ratings.eloRatings({1: 1500, 2: 1500, 3: 1500},
+                             [(1, 1, 2, 1.0), (2, 3, 1, 0.5)], k=32)
+    if abs(new[1] - 1515.26) > .01 or abs(new[2] - 1484) > .01 or \
+            abs(new[3] - 1500.74) > .01:
+        raise ValueError("Ratings should follow the Elo formula.")
+    random.seed(1500)
+    matches = []
+    for current_round in range(200):
+        ids = random.sample(range(10000), 1000)
+        for i in range(0, 1000, 2):
+            matches.append((current_round, ids[i], ids[i + 1],
+                            random.choice((0, .5, 1))))
+    start = time.time()
+    new = ratings.eloRatings({}, matches)
+    elapsed = time.time() - start
+    if abs(sum(new.values()) - 1500.0 * len(new)) > .01:
+        raise ValueError("Elo ratings should be zero-sum.")
+    print("100,000 matches rated in %.3f seconds" % elapsed)
+
+    [id1, id2, id3, id4] = [registerMember(name)
+                            for name in ("Lou", "Max", "Ned", "Oz")]
+    registerPlayers(31, [id1, id2, id3, id4])
+    reportRound(31, 1, [(id1, id2, False), (id3, id4, True)])
+    endTournament(31)
+    rated = dict((row[0], row[4]) for row in membersBySeeding())
+    if abs(rated[id1] - 1516) > .01 or abs(rated[id2] - 1484) > .01 or \
+            rated[id3] != 1500 or rated[id4] != 1500:
+        raise ValueError("Ending a tournament should update the ratings.")
+    if rateTournament(31):
+        raise ValueError("A tournament should only be rated once.")
+    recomputeRatings()
+    if dict((row[0], row[4]) for row in membersBySeeding()) != rated:
+        raise ValueError("Recomputed ratings should match the stored ones.")
+    registerTopSeeds(32, 1)
+    if membersBySeeding()[0][4] < rated[id1] or \
+            playerSeedings(32)[0][0] != membersBySeeding()[0][0]:
+        raise ValueError("Seeding should follow the ratings.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testStandingsCache():
+    """
+    Standings are read from the database once and then served from the cache
+    until a result, a registration or the end of the tournament changes them.
+    """
+    [id1, id2] = [registerMember("Pat"), registerMember("Quin")]
+    registerPlayers(51, [id1, id2])
+    playerStandings(51)
+    if sorted(playerStandings(51)) != [(id1, 0), (id2, 0)]:
+        raise ValueError("Cached standings should list every player.")
+    stats = standingsCacheStats()
+    if (stats['misses'], stats['hits'], stats['entries']) != (1, 1, 1):
+        raise ValueError("Repeated standings should come from the cache.")
+    playerRanks(51)
+    reportMatch(51, 1, id2, id1)
+    if playerStandings(51) != [(id2, 1), (id1, 0)] or \
+            playerRanks(51)[0][:3] != (id2, "Quin", 1):
+        raise ValueError("A result should invalidate the cached standings.")
+    if standingsCacheStats()['misses'] != 4:
+        raise ValueError("Standings should be read again after a result.")
+    endTournament(51)
+    if playerStandings(51) != [] or playersByWins(51) != []:
+        raise ValueError("Ending a tourney should clear its standings.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testInstrumentation():
+    """
+    With instrumentation on, every public call is recorded with the
+    connections, statements and rows it used; cache hits use none. With it
+    off, nothing is recorded.
+    """
+    import json
+    ids = [registerMember(name) for name in ("Rae", "Sol", "Tam", "Uma")]
+    inst = enableInstrumentation(report_at_end=True)
+    registerPlayers(61, ids)
+    pairs = swissPairings(61)
+    reportRound(61, 1, [(id1, id2, False) for (id1, id2, diff) in pairs])
+    playerStandings(61)
+    playerStandings(61)
+    stdout = sys.stdout
+    sys.stdout = io.StringIO() if bytes is not str else io.BytesIO()
+    try:
+        endTournament(61)
+    finally:
+        printed, sys.stdout = sys.stdout.getvalue(), stdout
+    stats = inst.stats()
+    if [stats['registerPlayers'][key] for key in
+            ('calls', 'connections', 'statements')] != [1, 1, 1]:
+        raise ValueError("registerPlayers should use one statement.")
+    if [stats['playerStandings'][key] for key in
+            ('calls', 'statements', 'rows')] != [2, 1, 4]:
+        raise ValueError("A cached read should not run a statement.")
+    if stats['swissPairings']['statements'] < \
+            stats['pairingData']['statements'] or \
+            not 0 <= stats['reportRound']['p50'] <= \
+            stats['reportRound']['max']:
+        raise ValueError("Calls should include the calls they make.")
+    dump = io.StringIO() if bytes is not str else io.BytesIO()
+    inst.dump(dump)
+    if json.loads(dump.getvalue())['endTournament']['calls'] != 1 or \
+            'reportRound' not in inst.table() or \
+            '\nendTournament ' not in printed:
+        raise ValueError("The statistics should be reported, with the end "
+                         "of the tournament.")
+    if disableInstrumentation() != stats:
+        raise ValueError("Disabling should return the statistics.")
+    countPlayers(61)
+    if 'countPlayers' in inst.stats():
+        raise ValueError("Calls should not be recorded when disabled.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testConcurrentTournaments():
+    """
+    The same members play in two tournaments at once; results and the end of
+    one tournament must not touch the other.
+    """
+    [id1, id2] = [registerMember("Ann"), registerMember("Bob")]
+    for t_id in (11, 12):
+        registerPlayer(t_id, id1)
+        registerPlayer(t_id, id2)
+    reportMatch(11, 1, id1, id2)
+    reportMatch(12, 1, id2, id1)
+    if dict(playerStandings(11))[id1] != 1 or \
+            dict(playerStandings(12))[id1] != 0:
+        raise ValueError("Results should only count in their tournament.")
+    endTournament(11)
+    if countPlayers(11) != 0 or countPlayers(12) != 2:
+        raise ValueError("Ending a tournament should only remove its players.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def testReportRound():
+    players = [registerMember("Ann"), registerMember("Bob"),
+               registerMember("Cid"), registerMember("Dee")]
     for i in players:
-        x -= 1
-        c.execute("UPDATE members "
-                  "SET wins = %s, matches = %s "
-                  "WHERE id = %s;", (x, y, i,))
-    db.commit()
-    db.close()
+        registerPlayer(77, i)
+    [id1, id2, id3, id4] = players
+    reportRound(77, 1, [(id1, id2, False), (id3, id4, True)])
+    wins = dict(playerStandings(77))
+    if (wins[id1], wins[id2], wins[id3], wins[id4]) != (1, 0, .5, .5):
+        raise ValueError("Each result of the round should be recorded.")
+    for bad_round in ([(id1, id3, False), (id3, id4, False)],
+                      [(id1, id3, False), (id2, 2147483646, False)]):
+        try:
+            reportRound(77, 2, bad_round)
+        except ValueError:
+            pass
+        else:
+            raise ValueError("An invalid round should be rejected.")
+    if dict(playerStandings(77)) != wins:
+        raise ValueError("A rejected round should not record any result.")
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+def createTestSet(copies=2):
+    """
+    Create mock records: members A to R, copies times over, seeded from the
+    most wins to the fewest. Loaded in one statement with importMembers; 36
+    members by default, 288 or 576 for a longer tourney.
+    """
+    deleteAll()
+    names = "ABCDEFGHIJKLMNOPQR" * copies
+    importMembers([(name, len(names) - 1 - i, len(names))
+                   for i, name in enumerate(names)],
+                  ('name', 'wins', 'matches'))
 
 
 def runTestCase(is_new=False):
@@ -299,23 +1080,21 @@ def runTestCase(is_new=False):
         tourney = 1
     else:
         deletePlayers()
-        db, c = connect()
-        c.execute("SELECT tourney_id "
-                  "FROM matches "
-                  "GROUP BY tourney_id "
-                  "ORDER BY tourney_id DESC")
-        tourney = (c.fetchone())[0] + 1
-        db.commit()
-        db.close()
+        with getConnection() as (db, c):
+            c.execute("SELECT tourney_id "
+                      "FROM matches "
+                      "GROUP BY tourney_id "
+                      "ORDER BY tourney_id DESC")
+            tourney = (c.fetchone())[0] + 1
 
     #Start fake tourney here.
 
     seedings = membersBySeeding()
     players = [row[0] for row in seedings]
     for i in players:
-        registerPlayer(i)
+        registerPlayer(tourney, i)
 
-    num_of_players = countPlayers()
+    num_of_players = countPlayers(tourney)
     rounds = int(math.ceil(math.log(num_of_players, 2)))
     for i in range(rounds):
         current_round = i + 1
@@ -336,33 +1115,65 @@ def runTestCase(is_new=False):
     for i in rankings:
         print(str(rank) + ". " + i[1] + " --ID: " + str(i[0]))
         rank += 1
-    endTournament()
+    endTournament(tourney)
+
+
+def testSwissTournament():
+    """
+    Plays a whole tourney of the test set through runTestCase.
+    """
+    runTestCase(True)
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+# The tests run on a clone of the seeded template database each, in order
+# unless run by several workers.
+TESTS = [testPlayersMigration, testRegisterMember, testImportMembers,
+         testImportUnicodeNames, testMemberListings, testDeleteMembers,
+         testAddPlayers, testDeletePlayers, testBulkRegistration,
+         testSeededPairings, testMemberStandingsBeforeMatches, testReportMatch,
+         testReportRound, testConcurrentTournaments, testStandingsCache,
+         testInstrumentation, testOpponentScores, testConcurrentWriters,
+         testTiebreaks, testRatings, testPairingEngine, testMatchingPairing,
+         testRoster, testPairingSession, testSimulation, testPairingPool,
+         testSchedules, testEventLog, testBenchmark, testSwissTournament]
+# The tests that need a PostgreSQL server, skipped with --sqlite.
+POSTGRES_TESTS = (testPlayersMigration, testBenchmark)
 
 
 def querySpeedTest(t_id):
-    db, c = connect()
-    c.execute("select tourney_id "
-              "from matches WHERE tourney_id = %s "
-              "LIMIT 1", (t_id,))
-    in_progress = c.fetchone()
-    db.commit()
-    db.close()
+    with getConnection() as (db, c):
+        c.execute("select tourney_id "
+                  "from matches WHERE tourney_id = %s "
+                  "LIMIT 1", (t_id,))
+        in_progress = c.fetchone()
     return in_progress
 
 
 if __name__ == '__main__':
-    deleteAll()
-    testRegisterMember()
-    deleteAll()
-    testDeleteMembers()
-    deleteAll()
-    testAddPlayers()
-    deleteAll()
-    testDeletePlayers()
-    deleteAll()
-    testMemberStandingsBeforeMatches()
-    deleteAll()
-    testReportMatch()
-    deleteAll()
-    runTestCase(True)
-    print "Success!  All tests pass!"
\ No newline at end of file
+    # python test.py [--workers N] [--sqlite [DIR]]; --sqlite runs the tests
+    # without a server, on SQLite databases in DIR or a temporary directory
+    parser = argparse.ArgumentParser(description="Run the tournament tests.")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--sqlite', nargs='?', const='', metavar='DIR')
+    args = parser.parse_args()
+    tests = TESTS
+    if args.sqlite is not None:
+        template = fixtures.SQLiteTemplate(args.sqlite or None)
+        tests = [test for test in TESTS if test not in POSTGRES_TESTS]
+    else:
+        testConnectionPool()
+        testMigrations()
+        template = fixtures.PostgresTemplate(tournament._backend)
+    template.build(createTestSet)
+    try:
+        failures = fixtures.runTests(template, tests, args.workers)
+    finally:
+        template.destroy()
+    for name, trace in failures:
+        print(name + " failed:")
+        print(trace)
+    if failures:
+        sys.exit(1)
+    print "Success!  All tests pass!"
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+#
+# Test cases for tournament_async.py; needs Python 3.7+ with asyncpg,
+# psycopg2 and NumPy, and a PostgreSQL server, like test.py.
+
+import asyncio
+import sys
+
+import pairing
+import tournament
+import tournament_async
+
+
+async def testConcurrentResults():
+    """
+    Registers 400 players and reports 200 results at once, over a pool of
+    ten connections, and checks the standings match the synchronous API's.
+    """
+    tournament.deletePlayers(101)
+    tournament.deleteMatches(101)
+    ids = [tournament.registerMember("Tablet%d" % i) for i in range(400)]
+    await tournament_async.configurePool(max_size=10)
+    await asyncio.gather(*[tournament_async.registerPlayer(101, p_id)
+                           for p_id in ids])
+    if tournament.countPlayers(101) != 400:
+        raise ValueError("Every player should be registered.")
+    pairs = await tournament_async.swissPairings(101)
+    await asyncio.gather(*[tournament_async.reportMatch(101, 1, id1, id2)
+                           for (id1, id2, diff) in pairs])
+    standings = await tournament_async.playerStandings(101)
+    tournament.clearStandingsCache()
+    if standings != tournament.playerStandings(101) or \
+            sorted(wins for (p_id, wins) in standings) != [0] * 200 + [1] * 200:
+        raise ValueError("Every result should be recorded once.")
+    tournament.rebuildOpponentScores(101)
+    pairs = await tournament_async.swissPairings(101)
+    fresh = pairing.PairingSession(*tournament.pairingData(101))
+    if pairs != fresh.pairRound():
+        raise ValueError("The async API should pair as swissPairings.")
+    tournament.deletePlayers(101)
+    tournament.deleteMatches(101)
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+async def testAsyncErrors():
+    """
+    An invalid result is refused and leaves nothing behind, and results of
+    a bracket move its players on.
+    """
+    tournament.deletePlayers(102)
+    tournament.deleteMatches(102)
+    ids = [tournament.registerMember("Bracket%d" % i) for i in range(4)]
+    for p_id in ids:
+        await tournament_async.registerPlayer(102, p_id)
+    tournament.scheduleElimination(102)
+    semis = tournament.scheduledMatches(102)
+    try:
+        await tournament_async.reportMatch(102, 1, semis[0][1], semis[1][1])
+    except ValueError:
+        pass
+    else:
+        raise ValueError("A result off the bracket should be refused.")
+    if tournament.matchEvents(102):
+        raise ValueError("A refused result should not be logged.")
+    for (m_id, id1, id2) in semis:
+        await tournament_async.reportMatch(102, m_id, id1, id2)
+    final = tournament.scheduledMatches(102)
+    if [row[1:] for row in final] != \
+            [tuple(sorted((semis[0][1], semis[1][1])))]:
+        raise ValueError("Bracket winners should meet in the final.")
+    tournament.deletePlayers(102)
+    tournament.deleteMatches(102)
+    func_name = sys._getframe().f_code.co_name
+    print(func_name + " passed!")
+
+
+async def main():
+    await testConcurrentResults()
+    await testAsyncErrors()
+    await tournament_async.closePool()
+    print("Success!  All tests pass!")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# tiebreaks.py -- Swiss tiebreak scores computed with NumPy over a result
+# matrix
+#
+
+import numpy
+
+# The tiebreaks computeTiebreaks() returns, in the default ranking order.
+TIEBREAKS = ('score', 'omw_pct', 'buchholz', 'sonneborn_berger', 'cumulative')
+
+
+def resultMatrix(player_ids, cards):
+    """Returns a tournament's results as two arrays with a row per player
+    and a column per round.
+
+    Args:
+      player_ids: the ids of the tournament's players; row i of the result
+        belongs to player_ids[i].
+      cards: a list of tuples (round, player_id, opponent_id, score), one
+        per player per match, as stored in the matches table. Cards of
+        players not in player_ids are left out.
+
+    Returns:
+      A tuple (opponents, scores):
+        opponents: the row of each round's opponent, or -1 where the player
+          did not play that round
+        scores: the match points scored in each round, 0 where the player
+          did not play
+    """
+    ids = numpy.asarray(player_ids, dtype=numpy.int64)
+    table = numpy.array(cards, dtype=numpy.float64).reshape(-1, 4)
+    if len(ids) == 0:
+        table = table[:0]
+    rounds, round_index = numpy.unique(table[:, 0], return_inverse=True)
+    # map ids to rows through a sorted copy of the ids
+    by_id = numpy.argsort(ids)
+    sorted_ids = ids[by_id]
+    players = table[:, 1].astype(numpy.int64)
+    opps = table[:, 2].astype(numpy.int64)
+    p = numpy.searchsorted(sorted_ids, players).clip(0, len(ids) - 1)
+    o = numpy.searchsorted(sorted_ids, opps).clip(0, len(ids) - 1)
+    known = (sorted_ids[p] == players) & (sorted_ids[o] == opps)
+    opponents = numpy.full((len(ids), len(rounds)), -1, dtype=numpy.int64)
+    scores = numpy.zeros((len(ids), len(rounds)), dtype=numpy.float64)
+    rows = by_id[p[known]]
+    columns = round_index[known]
+    opponents[rows, columns] = by_id[o[known]]
+    scores[rows, columns] = table[known, 3]
+    return opponents, scores
+
+
+def computeTiebreaks(opponents, scores):
+    """Returns every tiebreak in TIEBREAKS for each player of a result matrix,
+    computed with whole-array operations.
+
+    score: match points.
+    omw_pct: opponents' match-win percentage; the average of each opponent's
+      points per match, each counted as at least 1/3.
+    buchholz: the sum of the opponents' match points.
+    sonneborn_berger: the sum of the match points of the opponents beaten,
+      plus half of those drawn.
+    cumulative: the sum of the player's running score after each round.
+
+    Args:
+      opponents, scores: a result matrix, as returned by resultMatrix().
+
+    Returns:
+      A dict mapping each tiebreak name to an array with a value per row.
+    """
+    played = opponents >= 0
+    matches = played.sum(axis=1)
+    score = scores.sum(axis=1)
+    pct = numpy.maximum(score / numpy.maximum(matches, 1), 1.0 / 3)
+    opp = numpy.where(played, opponents, 0)
+    opp_score = numpy.where(played, score[opp], 0)
+    return {
+        'score': score,
+        'omw_pct': (numpy.where(played, pct[opp], 0).sum(axis=1) /
+                    numpy.maximum(matches, 1)),
+        'buchholz': opp_score.sum(axis=1),
+        'sonneborn_berger': (opp_score * scores).sum(axis=1),
+        'cumulative': scores.cumsum(axis=1).sum(axis=1),
+    }
+
+
+def rankOrder(tiebreaks, order=TIEBREAKS, seed_scores=None):
+    """Returns the row indexes of a result matrix, best ranked first.
+
+    Args:
+      tiebreaks: a dict as returned by computeTiebreaks().
+      order: the tiebreak names to rank by, most significant first.
+      seed_scores: an optional array breaking any ties left, highest first.
+
+    Returns:
+      An array of row indexes. Rows still tied keep their original order.
+    """
+    for name in order:
+        if name not in tiebreaks:
+            raise ValueError("Unknown tiebreak: %r" % (name,))
+    keys = [-tiebreaks[name] for name in reversed(order)]
+    if seed_scores is not None:
+        keys.insert(0, -numpy.asarray(seed_scores, dtype=numpy.float64))
+    if not keys:
+        return numpy.arange(len(tiebreaks['score']))
+    # lexsort sorts by its last key first
+    return numpy.lexsort(keys)
@@ -3,14 +3,71 @@
 # tournament.py -- implementation of a Swiss-system tournament
 #
 
-import psycopg2
 import copy
+import functools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import backends
+import instrumentation
+import pairing
+import pairpool
+import ratings
+import schedules
+import simulate
+import tiebreaks
+from dbpool import ConnectionPool
+
+# Shared connection pool and the backend its connections come from; created
+# on first use or by configurePool().
+_pool = None
+_backend = backends.PostgresBackend()
+
+# Standings cache: results of the standings queries keyed by (function name,
+# tourney id). Every write this module makes to a tourney's players or
+# matches drops that tourney's entries; the generation counter keeps a query
+# that raced with such a write from storing its outdated result.
+_standings = {}
+_standings_lock = threading.Lock()
+_standings_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+_standings_generation = 0
+_standings_pid = os.getpid()
+
+# Pairing sessions (pairing.PairingSession) of the tourneys being paired,
+# kept between rounds under the same lock. reportMatch and reportRound apply
+# their results to a tourney's session and deletePlayers its withdrawals;
+# every other write drops it.
+_sessions = {}
+
+# Worker processes that pairTournaments() runs pairing searches in; created
+# on first use or by configurePairingPool().
+_pairing_pool = None
+
+# Instrumentation recording calls to the public functions, or None when
+# instrumentation is off; see enableInstrumentation().
+_instrumentation = None
+_report_at_end = False
+
+# Results are written at this isolation level. Each statement then sees the
+# rows committed before it, and the writers of one tourney's results queue on
+# the row locks of the players they update (see _LOCK_PLAYERS), so none of
+# them works from records another is changing.
+WRITE_ISOLATION = 'READ COMMITTED'
+
+# How often a write aborted by a deadlock or a serialization failure is run
+# again, and the longest delay before the first retry in seconds; the delay
+# is random and its limit doubles with every retry.
+WRITE_RETRIES = 5
+RETRY_DELAY = 0.01
+
 
 def connect(database_name="tournament"):
     """Connect to the PostgreSQL database.  Returns a database connection."""
     # For development with EDB/pgAdmin setup
-    db = psycopg2.connect(host="localhost", dbname="tournament",
-                           user="postgres", password="postgres")
+    db = backends.PostgresBackend(database_name).connect()
     cursor = db.cursor()
     return db, cursor
     # try:
@@ -21,16 +78,254 @@ def connect(database_name="tournament"):
     #     print("Failed to connect.")
 
 
+def configurePool(minconn=1, maxconn=10, health_check_interval=30.0,
+                  timeout=None, database_name=None, cursor_factory=None,
+                  backend=None):
+    """Replaces the module's connection pool. Every function in this module
+    borrows its connection from this pool instead of opening a new one.
+
+    Args:
+      minconn: connections opened up front and kept idle.
+      maxconn: most connections open at one time; lowered to what the
+        backend allows.
+      health_check_interval: seconds a connection may sit idle before it is
+        pinged on checkout; None disables the check.
+      timeout: seconds to wait for a free connection; None waits forever.
+      database_name: the PostgreSQL database to connect to.
+      cursor_factory: a psycopg2 cursor class used for every cursor opened
+        on the pooled connections, e.g. to count or log statements.
+      backend: the database backend, e.g. backends.SQLiteBackend(path) to
+        run without a server. If it is None and neither database_name nor
+        cursor_factory is given, the current backend is kept; by default
+        that is PostgreSQL.
+    """
+    global _pool, _backend
+    closePool()
+    if backend is None and (database_name or cursor_factory):
+        # keep the server, and the database unless another is named, of
+        # the PostgreSQL backend in use
+        current = _backend
+        if not isinstance(current, backends.PostgresBackend):
+            current = backends.PostgresBackend()
+        backend = backends.PostgresBackend(
+            database_name or current.database_name, current.host,
+            current.user, current.password, cursor_factory=cursor_factory)
+    if backend is not None:
+        _backend = backend
+    if _backend.maxconn is not None:
+        maxconn = min(maxconn, _backend.maxconn)
+        minconn = min(minconn, maxconn)
+    _pool = ConnectionPool(_backend.connect,
+                           minconn=minconn, maxconn=maxconn,
+                           health_check_interval=health_check_interval,
+                           timeout=timeout)
+    return _pool
+
+
+def closePool():
+    """Closes all pooled connections. The next query opens a new pool."""
+    global _pool
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
+
+
+@contextmanager
+def getConnection():
+    """Borrows a connection from the pool for the duration of a with block.
+    The transaction is committed when the block exits, rolled back if it
+    raises, and the connection goes back to the pool either way.
+
+    Usage:
+      with getConnection() as (db, c):
+          c.execute(...)
+    """
+    if _pool is None:
+        configurePool()
+    with _pool.connection() as db:
+        c = db.cursor()
+        if _instrumentation is not None:
+            _instrumentation.count('connections')
+            c = instrumentation.InstrumentedCursor(c, _instrumentation)
+        try:
+            yield db, c
+        finally:
+            c.close()
+
+
+def enableInstrumentation(report_at_end=False):
+    """Starts recording, for every public function of this module, the number
+    of calls, connections borrowed, statements executed and rows returned,
+    and the latency of each call. Counts of functions called by other
+    functions here are included in the caller's counts too. While
+    instrumentation is off each call costs one extra global lookup.
+
+    Args:
+      report_at_end: print the statistics as a table whenever
+        endTournament() completes, that call included.
+
+    Returns:
+      The instrumentation.Instrumentation object recording the calls; its
+      stats(), dump(file) and table() report what has been recorded.
+    """
+    global _instrumentation, _report_at_end
+    if _instrumentation is None:
+        _instrumentation = instrumentation.Instrumentation()
+    _report_at_end = report_at_end
+    return _instrumentation
+
+
+def disableInstrumentation():
+    """Stops recording calls. Returns the statistics recorded, as
+    Instrumentation.stats() does, or an empty dict if none were."""
+    global _instrumentation, _report_at_end
+    inst, _instrumentation = _instrumentation, None
+    _report_at_end = False
+    return inst.stats() if inst is not None else {}
+
+
+def _instrumented(func):
+    """Decorates a public function so its calls are recorded while
+    instrumentation is enabled."""
+    @functools.wraps(func)
+    def instrumented(*args, **kwargs):
+        inst = _instrumentation
+        if inst is None:
+            return func(*args, **kwargs)
+        return inst.call(func.__name__, func, *args, **kwargs)
+    return instrumented
+
+
+def _reportingAtEnd(func):
+    """Decorates an instrumented function so that, with report_at_end on,
+    the statistics are printed once its own call has been recorded."""
+    @functools.wraps(func)
+    def reporting(*args, **kwargs):
+        result = func(*args, **kwargs)
+        if _report_at_end and _instrumentation is not None:
+            print(_instrumentation.table())
+        return result
+    return reporting
+
+
+def standingsCacheStats():
+    """Returns the standings cache's counters as a dict with the keys 'hits',
+    'misses', 'invalidations' and 'entries'."""
+    with _standings_lock:
+        stats = dict(_standings_stats)
+        stats['entries'] = len(_standings)
+    return stats
+
+
+def clearStandingsCache():
+    """Empties the standings cache and the pairing sessions, and resets the
+    cache's counters. Needed only when the players or matches tables are
+    changed by another process or by hand, or the pool is moved to another
+    database; this module's own writes keep the cache up to date."""
+    global _standings_generation
+    with _standings_lock:
+        _standings.clear()
+        _sessions.clear()
+        _standings_generation += 1
+        for key in _standings_stats:
+            _standings_stats[key] = 0
+
+
+def _invalidateStandings(t_id=''):
+    """Drops the cached standings and the pairing session of a tourney, or of
+    every tourney if no argument is given. Returns the new generation."""
+    global _standings_generation
+    with _standings_lock:
+        _standings_generation += 1
+        _standings_stats['invalidations'] += 1
+        for key in list(_standings):
+            if t_id == '' or key[1] == t_id:
+                del _standings[key]
+        if t_id == '':
+            _sessions.clear()
+        else:
+            _sessions.pop(t_id, None)
+        return _standings_generation
+
+
+def _checkFork():
+    """Empties the caches in a forked child, which cannot see the parent's
+    invalidations. Must be called holding _standings_lock."""
+    global _standings_pid
+    if _standings_pid != os.getpid():
+        _standings.clear()
+        _sessions.clear()
+        _standings_pid = os.getpid()
+
+
+def _takeSession(t_id):
+    """Takes a tourney's pairing session out of the module, so no other
+    thread uses it while it is changed. Returns a tuple (session,
+    generation); session is None if the tourney has none."""
+    with _standings_lock:
+        _checkFork()
+        return _sessions.pop(t_id, None), _standings_generation
+
+
+def _putSession(t_id, session, generation):
+    """Puts back a session taken by _takeSession, unless the tourney may have
+    changed without it: generation must be the one returned by the caller's
+    own last invalidation, and there must have been no other since."""
+    with _standings_lock:
+        if session is not None and generation == _standings_generation:
+            _checkFork()
+            _sessions[t_id] = session
+
+
+def _cachedStandings(func):
+    """Decorates a function of a tourney id so its result is cached until the
+    tourney's players or matches change."""
+    @functools.wraps(func)
+    def cached(t_id):
+        key = (func.__name__, t_id)
+        hit, results, generation = _cacheLookup(key)
+        if hit:
+            return results
+        results = func(t_id)
+        _cacheStore(key, results, generation)
+        return results
+    return cached
+
+
+def _cacheLookup(key):
+    """Looks a standings query up in the cache. Returns a tuple (hit,
+    results, generation); on a miss, pass generation to _cacheStore()."""
+    with _standings_lock:
+        _checkFork()
+        if key in _standings:
+            _standings_stats['hits'] += 1
+            return True, list(_standings[key]), None
+        _standings_stats['misses'] += 1
+        return False, None, _standings_generation
+
+
+def _cacheStore(key, results, generation):
+    """Caches the results of a standings query, unless the tourney changed
+    since the generation returned by _cacheLookup()."""
+    with _standings_lock:
+        if generation == _standings_generation:
+            _standings[key] = tuple(results)
+
+
+@_instrumented
 def deleteAll():
     """Delete all table rows in database; matches, members, and players."""
-    db, c = connect()
-    c.execute("DELETE FROM matches")
-    c.execute("DELETE FROM players")
-    c.execute("DELETE FROM members")
-    db.commit()
-    db.close()
+    with getConnection() as (db, c):
+        c.execute("DELETE FROM matches")
+        c.execute("DELETE FROM match_events")
+        c.execute("DELETE FROM brackets")
+        c.execute("DELETE FROM rated_tourneys")
+        c.execute("DELETE FROM players")
+        c.execute("DELETE FROM members")
+    _invalidateStandings()
 
 
+@_instrumented
 def deleteMembers(p_id=''):
     """Remove a member from the database. If no argument is given, all members
     are deleted.
@@ -38,73 +333,109 @@ def deleteMembers(p_id=''):
     Args:
       p_id: the member's id.
     """
-    db, c = connect()
-    if p_id != '':
-        c.execute("DELETE FROM members WHERE id = %s", (p_id,))
-    else:
-        c.execute("DELETE FROM members")
-    db.commit()
-    db.close()
+    with getConnection() as (db, c):
+        if p_id != '':
+            c.execute("DELETE FROM members WHERE id = %s", (p_id,))
+        else:
+            c.execute("DELETE FROM members")
 
 
-def deletePlayers(p_id=''):
-    """Remove a player in the current tourney from the database. If no arguments
-    are given, all players will be deleted.
+@_instrumented
+def deletePlayers(t_id='', p_id=''):
+    """Remove a player in a tourney from the database. If no player id is
+    given, all players of the tourney are deleted. If no argument is given,
+    all players of every tourney will be deleted. Raises ValueError if a
+    player id is given without a tournament id.
 
     Args:
+      t_id: the tournament id.
       p_id: the player's id.
     """
-    db, c = connect()
-    if p_id != '':
-        c.execute("DELETE FROM players WHERE id = %s", (p_id,))
-    else:
-        c.execute("DELETE FROM players")
-    db.commit()
-    db.close()
-
-
+    if t_id == '' and p_id != '':
+        raise ValueError("A player can only be deleted from a tournament.")
+    session, generation = _takeSession(t_id)
+    with getConnection() as (db, c):
+        if t_id != '' and p_id != '':
+            c.execute("DELETE FROM players "
+                      "WHERE tourney_id = %s AND id = %s", (t_id, p_id))
+            withdrawn = c.rowcount == 1
+        elif t_id != '' and p_id == '':
+            c.execute("DELETE FROM players WHERE tourney_id = %s", (t_id,))
+        else:
+            c.execute("DELETE FROM players")
+    if _invalidateStandings(t_id) == generation + 1 and session is not None \
+            and p_id != '' and withdrawn:
+        session.removePlayer(p_id)
+        _putSession(t_id, session, generation + 1)
+
+
+@_instrumented
 def deleteMatches(t_id='', m_id=''):
-    """Removes match records of a round from the database. If no match id is
-    given, all matches from a tourney are deleted. If no argument is given,
-    all matches will be deleted.
+    """Removes match records of a round, and their events in the results
+    log, from the database. If no match id is given, all matches from a
+    tourney are deleted. If no argument is given, all matches will be
+    deleted. A tourney whose matches are deleted is no
+    longer counted as rated, so recomputeRatings() leaves it out and ending it
+    again rates it again; its bracket, if any, is deleted too.
 
      Args:
       t_id: the tournament id.
       m_id: the match round id.
      """
-    db, c = connect()
-    if t_id != '' and m_id != '':
-        c.execute("DELETE FROM matches "
-                  "WHERE tourney_id = %s AND match_id = %s", (t_id, m_id,))
-    elif t_id != '' and m_id == '':
-        c.execute("DELETE FROM matches "
-                  "WHERE tourney_id = %s", (t_id))
-    else:
-        c.execute("DELETE FROM matches")
-    db.commit()
-    db.close()
-
-
+    with getConnection() as (db, c):
+        if t_id != '' and m_id != '':
+            c.execute("DELETE FROM matches "
+                      "WHERE tourney_id = %s AND match_id = %s", (t_id, m_id,))
+            c.execute("DELETE FROM match_events "
+                      "WHERE tourney_id = %s AND match_id = %s", (t_id, m_id,))
+        elif t_id != '' and m_id == '':
+            c.execute(_DELETE_TOURNEY_MATCHES, (t_id,))
+            c.execute("DELETE FROM match_events "
+                      "WHERE tourney_id = %s", (t_id,))
+        else:
+            c.execute("DELETE FROM matches")
+            c.execute("DELETE FROM match_events")
+        if m_id == '':
+            if t_id != '':
+                c.execute("DELETE FROM brackets "
+                          "WHERE tourney_id = %s", (t_id,))
+                c.execute("DELETE FROM rated_tourneys "
+                          "WHERE tourney_id = %s", (t_id,))
+            else:
+                c.execute("DELETE FROM brackets")
+                c.execute("DELETE FROM rated_tourneys")
+    _invalidateStandings(t_id)
+
+
+_DELETE_TOURNEY_MATCHES = "DELETE FROM matches WHERE tourney_id = %s"
+
+
+@_instrumented
 def countMembers():
     """Returns the number of members currently registered."""
-    db, c = connect()
-    c.execute("SELECT count(*) FROM members")
-    result = c.fetchone()[0]
-    db.commit()
-    db.close()
+    with getConnection() as (db, c):
+        c.execute("SELECT count(*) FROM members")
+        result = c.fetchone()[0]
     return result
 
 
-def countPlayers():
-    """Returns the number of players currently in the tournament."""
-    db, c = connect()
-    c.execute("SELECT count(*) FROM players")
-    result = c.fetchone()[0]
-    db.commit()
-    db.close()
+@_instrumented
+def countPlayers(t_id):
+    """Returns the number of players currently in the tournament.
+
+    Args:
+      t_id: the tournament id.
+    """
+    with getConnection() as (db, c):
+        c.execute(_COUNT_PLAYERS, (t_id,))
+        result = c.fetchone()[0]
     return result
 
 
+_COUNT_PLAYERS = "SELECT count(*) FROM players WHERE tourney_id = %s"
+
+
+@_instrumented
 def registerMember(name):
     """Adds a member to the database.
 
@@ -113,59 +444,153 @@ def registerMember(name):
 
     Returns: new member's assigned id (important for testing)
     """
-    db, c = connect()
-    c.execute("INSERT INTO members "
-              "VALUES (DEFAULT, %s)", (name,))
-    c.execute("SELECT id FROM members WHERE name = %s", (name,))
-    new_id = c.fetchall()
-    db.commit()
-    db.close()
-    return new_id[0][0]
+    with getConnection() as (db, c):
+        c.execute("INSERT INTO members (name) "
+                  "VALUES (%s) RETURNING id", (name,))
+        new_id = c.fetchone()[0]
+    return new_id
+
+
+@_instrumented
+def importMembers(source, columns=('name',), header=False):
+    """Adds members in bulk by streaming CSV rows into the members table
+    with COPY (a single prepared INSERT on SQLite), in one transaction.
+
+    Args:
+      source: a file object open on CSV text, or an iterable of rows; a row
+        is a tuple of values in the order of columns, or just a name.
+      columns: the members columns present in each row, any of 'name',
+        'wins' and 'matches'.
+      header: True if the first line of a CSV file is a header to skip.
+
+    Returns: the number of members added
+    """
+    for column in columns:
+        if column not in ('name', 'wins', 'matches'):
+            raise ValueError("Unknown members column: %r" % (column,))
+    with getConnection() as (db, c):
+        count = _backend.copyFrom(c, 'members', columns, source, header)
+    return count
 
 
-def registerPlayer(p_id):
-    """Adds a player, or list of players, to the current tournament database.
+@_instrumented
+def registerPlayer(t_id, p_id):
+    """Adds a member to a tournament as a player. A member may play in any
+    number of tournaments at the same time.
 
     Args:
+      t_id: the tournament id.
       p_id: the player's member id.
     """
-    db, c = connect()
-    c.execute("INSERT INTO players (id, name, seed_score) "
-              "SELECT id, name, "
-              "COALESCE(wins / NULLIF(matches,0), 0) "
-              "FROM members "
-              "WHERE id = %s", (p_id,))
-    db.commit()
-    db.close()
+    with getConnection() as (db, c):
+        c.execute(_REGISTER_PLAYER, (t_id, p_id))
+    _invalidateStandings(t_id)
+
+
+# A player's seed score: the member's rating, with the member's win
+# percentage added in a place too small to reorder two ratings, so that seed
+# scores rank players as membersBySeeding() ranks members.
+_SEED_SCORE = ("rating::float8 + "
+               "COALESCE(wins / NULLIF(matches, 0), 0)::float8 * 0.00001")
+_REGISTER_PLAYER = ("INSERT INTO players (tourney_id, id, name, seed_score) "
+                    "SELECT %s, id, name, " + _SEED_SCORE + " "
+                    "FROM members "
+                    "WHERE id = %s")
+
 
+@_instrumented
+def registerPlayers(t_id, p_ids):
+    """Adds a list of members to a tournament in a single statement.
+
+    Args:
+      t_id: the tournament id.
+      p_ids: the members' ids; ids listed twice are registered once.
 
+    Returns: the number of players registered
+    """
+    with getConnection() as (db, c):
+        c.execute("INSERT INTO players (tourney_id, id, name, seed_score) "
+                  "SELECT %s, id, name, " + _SEED_SCORE + " "
+                  "FROM members "
+                  "WHERE id = ANY(%s)", (t_id, list(p_ids)))
+        count = c.rowcount
+    _invalidateStandings(t_id)
+    return count
+
+
+@_instrumented
+def registerTopSeeds(t_id, n):
+    """Adds the n best seeded members, as ordered by membersBySeeding(), to a
+    tournament in a single statement.
+
+    Args:
+      t_id: the tournament id.
+      n: the size of the field.
+
+    Returns: the number of players registered
+    """
+    with getConnection() as (db, c):
+        c.execute("INSERT INTO players (tourney_id, id, name, seed_score) "
+                  "SELECT %s, id, name, " + _SEED_SCORE + " "
+                  "FROM members "
+                  "ORDER BY rating DESC, "
+                  "COALESCE(wins / NULLIF(matches,0), 0) DESC, id "
+                  "LIMIT %s", (t_id, n))
+        count = c.rowcount
+    _invalidateStandings(t_id)
+    return count
+
+
+# The member listings: their columns, their order, and the condition that
+# continues a listing after a given row (the keyset of the last row of a
+# page), written so the leading column can use the listing's index.
+_MEMBERS_BY_SEEDING = (
+    "SELECT id, name, wins, matches, rating AS seed_score FROM members ",
+    "ORDER BY rating DESC, "
+    "COALESCE(wins / NULLIF(matches, 0), 0) DESC, id ",
+    "WHERE rating <= %(seed_score)s::real AND (rating < %(seed_score)s::real "
+    "OR COALESCE(wins / NULLIF(matches, 0), 0) < "
+    "COALESCE(%(wins)s::real / NULLIF(%(matches)s, 0), 0) "
+    "OR (COALESCE(wins / NULLIF(matches, 0), 0) = "
+    "COALESCE(%(wins)s::real / NULLIF(%(matches)s, 0), 0) "
+    "AND id > %(id)s)) ",
+    ('id', 'name', 'wins', 'matches', 'seed_score'))
+_MEMBERS_BY_WINS = (
+    "SELECT id, name, wins, matches FROM members ",
+    "ORDER BY wins DESC, id ",
+    "WHERE wins <= %(wins)s::real AND (wins < %(wins)s::real "
+    "OR id > %(id)s) ",
+    ('id', 'name', 'wins', 'matches'))
+
+
+@_instrumented
 def membersBySeeding():
-    """Returns a list of the members and their win record, sorted
-    by percentage of wins to matches.
+    """Returns a list of the members and their win record, sorted by Elo
+    rating, then by percentage of wins to matches, then by id.
 
     The first entry in the list should be the player in first place, or tied
     for first.
 
     Returns:
-      A list of tuples, each of which contains (id, name, wins, matches):
+      A list of tuples, each of which contains (id, name, wins, matches,
+      seed_score):
         id: the player's unique id (assigned by the database)
         name: the player's full name (as registered)
         wins: the number of matches the player has won
         matches: the number of matches the player has played
+        seed_score: the player's Elo rating
     """
-    db, c = connect()
-    c.execute("SELECT id, name, wins, matches,"
-              "COALESCE(wins / NULLIF(matches,0), 0) AS seed_score "
-              "FROM members "
-              "ORDER BY seed_score DESC")
-    results = c.fetchall()
-    db.commit()
-    db.close()
+    select, order, after, columns = _MEMBERS_BY_SEEDING
+    with getConnection() as (db, c):
+        c.execute(select + order)
+        results = c.fetchall()
     return results
 
 
+@_instrumented
 def membersByWins():
-    """Returns a list of the members and sorted by their win record.
+    """Returns a list of the members and sorted by their win record, then by
+    id.
 
     The first entry in the list should be the player in first place, or tied
     for first.
@@ -177,44 +602,160 @@ def membersByWins():
         wins: the number of matches the player has won
         matches: the number of matches the player has played
     """
-    db, c = connect()
-    c.execute("SELECT id, name, wins, matches "
-              "FROM members "
-              "ORDER BY wins DESC")
-    results = c.fetchall()
-    db.commit()
-    db.close()
+    select, order, after, columns = _MEMBERS_BY_WINS
+    with getConnection() as (db, c):
+        c.execute(select + order)
+        results = c.fetchall()
     return results
 
 
-def playerSeedings():
+def streamMembersBySeeding(batch_size=1000):
+    """Yields the members in the order of membersBySeeding(), reading them
+    from a server-side cursor batch_size rows at a time, so memory use does
+    not grow with the number of members.
+
+    The generator holds a pooled connection, and the transaction the rows
+    are read in, until it is exhausted or closed; don't call other
+    functions of this module while iterating with a pool of one connection.
+
+    Args:
+      batch_size: the rows fetched per round trip.
+
+    Yields:
+      Tuples (id, name, wins, matches, seed_score), as membersBySeeding().
+    """
+    select, order, after, columns = _MEMBERS_BY_SEEDING
+    return _streamRows(select + order, batch_size)
+
+
+def streamMembersByWins(batch_size=1000):
+    """Yields the members in the order of membersByWins(), reading them from
+    a server-side cursor batch_size rows at a time; see
+    streamMembersBySeeding().
+
+    Args:
+      batch_size: the rows fetched per round trip.
+
+    Yields:
+      Tuples (id, name, wins, matches), as membersByWins().
+    """
+    select, order, after, columns = _MEMBERS_BY_WINS
+    return _streamRows(select + order, batch_size)
+
+
+@_instrumented
+def membersBySeedingPage(after=None, limit=50):
+    """Returns a page of the members in the order of membersBySeeding().
+
+    Pages are found by keyset rather than by offset: the next page starts
+    after the last row of the previous one, through the index, so every page
+    costs the same however deep into the listing it is.
+
+    Args:
+      after: the last row of the previous page, or None for the first page.
+      limit: the most rows to return.
+
+    Returns:
+      A list of up to limit tuples (id, name, wins, matches, seed_score), as
+      membersBySeeding(). A page shorter than limit is the last.
+    """
+    return _page(_MEMBERS_BY_SEEDING, after, limit)
+
+
+@_instrumented
+def membersByWinsPage(after=None, limit=50):
+    """Returns a page of the members in the order of membersByWins(); see
+    membersBySeedingPage().
+
+    Args:
+      after: the last row of the previous page, or None for the first page.
+      limit: the most rows to return.
+
+    Returns:
+      A list of up to limit tuples (id, name, wins, matches), as
+      membersByWins().
+    """
+    return _page(_MEMBERS_BY_WINS, after, limit)
+
+
+def _streamRows(query, batch_size):
+    """Yields the rows of a query run on a streaming cursor of a pooled
+    connection, batch_size rows at a time."""
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1.")
+    with getConnection() as (db, c):
+        stream = _backend.streamingCursor(db, batch_size)
+        if _instrumentation is not None:
+            stream = instrumentation.InstrumentedCursor(stream,
+                                                        _instrumentation)
+        try:
+            stream.execute(query)
+            while True:
+                rows = stream.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            stream.close()
+
+
+def _page(listing, after, limit):
+    """Returns the page of a member listing that follows the row after."""
+    params = {'limit': limit}
+    if after is not None:
+        params.update(zip(listing[3], after))
+    with getConnection() as (db, c):
+        c.execute(_pageQuery(listing, after is not None), params)
+        results = c.fetchall()
+    return results
+
+
+def _pageQuery(listing, after):
+    """Returns the SQL of a page of a member listing: the first page, or if
+    after is true, the page after a row given by the listing's columns as
+    named parameters. The page size is %(limit)s."""
+    select, order, condition, columns = listing
+    return select + (condition if after else "") + order + "LIMIT %(limit)s"
+
+
+@_instrumented
+def playerSeedings(t_id):
     """Returns a list of the players and their and their seed score, sorted
-    by percentage of wins to matches.
+    by seed score.
 
     The first entry in the list should be the player in first place, or a player
     tied for first place if there is currently a tie.
 
+    Args:
+      t_id: tournament id.
+
     Returns:
       A list of tuples, each of which contains (id, seed_score):
         id: the player's unique id (assigned by the database)
-        seed_score: the players' wins divided by total number of matches played
-    """
-    db, c = connect()
-    c.execute("SELECT id, seed_score "
-              "FROM players "
-              "ORDER BY seed_score DESC")
-    results = c.fetchall()
-    db.commit()
-    db.close()
+        seed_score: the player's Elo rating when registered, plus a
+          fraction of the win percentage that breaks ties in the rating
+    """
+    with getConnection() as (db, c):
+        c.execute("SELECT id, seed_score "
+                  "FROM players "
+                  "WHERE tourney_id = %s "
+                  "ORDER BY seed_score DESC", (t_id,))
+        results = c.fetchall()
     return results
 
 
-def playersByWins():
+@_instrumented
+@_cachedStandings
+def playersByWins(t_id):
     """Returns a list of the players and their record, sorted by wins.
 
     The first entry in the list should be the player in first place, or tied
     for first.
 
+    Args:
+      t_id: tournament id.
+
     Returns:
       A list of tuples, each of which contains (id, name, wins, matches):
         id: the player's unique id (assigned by the database)
@@ -222,16 +763,17 @@ def playersByWins():
         wins: the number of matches the player has won
         matches: the number of matches the player has played
     """
-    db, c = connect()
-    c.execute("SELECT id, name, wins, matches "
-              "FROM players "
-              "ORDER BY wins DESC")
-    results = c.fetchall()
-    db.commit()
-    db.close()
+    with getConnection() as (db, c):
+        c.execute("SELECT id, name, wins, matches "
+                  "FROM players "
+                  "WHERE tourney_id = %s "
+                  "ORDER BY wins DESC", (t_id,))
+        results = c.fetchall()
     return results
 
 
+@_instrumented
+@_cachedStandings
 def playerStandings(t_id):
     """Returns a list of the players and their match points.
 
@@ -246,50 +788,135 @@ def playerStandings(t_id):
         id: the player's unique id
         wins: the total wins of player thus far in current tourney
     """
-    db, c = connect()
-    c.execute("SELECT p.id, p.wins "
-              "FROM players p "
-              "GROUP BY p.id "
-              "ORDER BY p.wins DESC, p.seed_score DESC", (t_id,))
-    results = c.fetchall()
-    db.commit()
-    db.close()
+    with getConnection() as (db, c):
+        c.execute(_PLAYER_STANDINGS, (t_id,))
+        results = c.fetchall()
     return results
 
 
+_PLAYER_STANDINGS = ("SELECT id, wins "
+                     "FROM players "
+                     "WHERE tourney_id = %s "
+                     "ORDER BY wins DESC, seed_score DESC")
+
+
+@_instrumented
+@_cachedStandings
 def playerRanks(t_id):
     """Returns the players' ranks in order of match points. In the case of ties,
       players are sub-sorted by opponent match wins, then seed_score.
 
+    Opponent scores are kept up to date by reportMatch and reportRound, so
+    this is a plain ordered read of the players table.
+
     Args:
       t_id: tournament id.
 
     Returns:
-      A list of tuples, each of which contains (id, name, wins, omw):
+      A list of tuples, each of which contains (id, name, wins, omw, omw_pct):
         id: the player's unique id.
         name: the name of player.
         wins: the player's win total for tournament
-        omw: the opponent match wins for tournament
-    """
-    db, c = connect()
-    c.execute("SELECT p.id, p.name, p.wins, "
-              "(SELECT SUM(o.wins) FROM players o "
-              "LEFT JOIN matches m "
-              "ON o.id=m.player_id "
-              "WHERE m.opponent_id = p.id AND m.tourney_id = %s) "
-              "AS omw_score "
-              "FROM players p "
-              "ORDER BY p.wins DESC, omw_score DESC, p.seed_score DESC",
-              (t_id,))
-    ranks = c.fetchall()
-    db.commit()
-    db.close()
+        omw: the opponent match wins for tournament; the sum of the match
+          points of every opponent faced (also known as SOS or Buchholz)
+        omw_pct: the opponent match-win percentage; the average of every
+          opponent's match-win percentage, each counted as at least 1/3
+    """
+    with getConnection() as (db, c):
+        c.execute(_PLAYER_RANKS, (t_id,))
+        ranks = c.fetchall()
     return ranks
 
 
+_PLAYER_RANKS = ("SELECT id, name, wins, omw, "
+                 "COALESCE(opp_pct / NULLIF(matches, 0), 0) AS omw_pct "
+                 "FROM players "
+                 "WHERE tourney_id = %s "
+                 "ORDER BY wins DESC, omw DESC, seed_score DESC")
+
+
+@_instrumented
+def playerTiebreaks(t_id, order=tiebreaks.TIEBREAKS):
+    """Returns the players' ranks with every tiebreak in tiebreaks.py,
+    computed in memory from the tournament's matches.
+
+    Args:
+      t_id: tournament id.
+      order: the tiebreaks to rank by, most significant first; ties left
+        are broken by seed_score.
+
+    Returns:
+      A list of tuples, each of which contains (id, name, score, omw_pct,
+      buchholz, sonneborn_berger, cumulative), best ranked first:
+        id: the player's unique id.
+        name: the name of player.
+        score: the player's match points
+        omw_pct: the opponent match-win percentage, as in playerRanks
+        buchholz: the sum of the opponents' match points
+        sonneborn_berger: the sum of the match points of the opponents
+          beaten, plus half of those drawn
+        cumulative: the sum of the player's running score after each round
+    """
+    with getConnection() as (db, c):
+        c.execute("SELECT id, name, seed_score FROM players "
+                  "WHERE tourney_id = %s", (t_id,))
+        players = c.fetchall()
+        c.execute("SELECT match_id, player_id, opponent_id, match_outcome "
+                  "FROM matches WHERE tourney_id = %s "
+                  "AND match_outcome IS NOT NULL", (t_id,))
+        cards = c.fetchall()
+    opponents, scores = tiebreaks.resultMatrix([p[0] for p in players], cards)
+    values = tiebreaks.computeTiebreaks(opponents, scores)
+    ranking = tiebreaks.rankOrder(values, order, [p[2] for p in players])
+    columns = [values[name].tolist() for name in tiebreaks.TIEBREAKS]
+    return [players[i][:2] + tuple(column[i] for column in columns)
+            for i in ranking.tolist()]
+
+
+@_instrumented
+def rebuildOpponentScores(t_id):
+    """Recomputes every player's wins, matches and opponent scores from the
+    matches table of a tournament, for recovery after the stored values have
+    gone wrong (for example after match records were edited by hand).
+
+    Args:
+      t_id: tournament id.
+    """
+    with getConnection() as (db, c):
+        c.execute("UPDATE players "
+                  "SET wins = 0, matches = 0, omw = 0, opp_pct = 0 "
+                  "WHERE tourney_id = %s", (t_id,))
+        c.execute("UPDATE players AS p "
+                  "SET wins = x.wins, matches = x.matches "
+                  "FROM (SELECT player_id, SUM(match_outcome) AS wins, "
+                  "count(*) AS matches "
+                  "FROM matches "
+                  "WHERE tourney_id = %s AND match_outcome IS NOT NULL "
+                  "GROUP BY player_id) AS x "
+                  "WHERE p.tourney_id = %s AND p.id = x.player_id",
+                  (t_id, t_id))
+        c.execute("UPDATE players AS p "
+                  "SET omw = x.omw, opp_pct = x.pct "
+                  "FROM (SELECT m.player_id, SUM(o.wins) AS omw, "
+                  "SUM(GREATEST(o.wins / o.matches, 1.0 / 3)) AS pct "
+                  "FROM matches m "
+                  "JOIN players o ON o.tourney_id = m.tourney_id "
+                  "AND o.id = m.opponent_id "
+                  "WHERE m.tourney_id = %s AND m.match_outcome IS NOT NULL "
+                  "GROUP BY m.player_id) AS x "
+                  "WHERE p.tourney_id = %s AND p.id = x.player_id",
+                  (t_id, t_id))
+    _invalidateStandings(t_id)
+
+
+@_instrumented
 def reportMatch(t_id, m_id, win_id, lose_id, draw=False):
     """Records the outcome of a single match between two players to the
-    players' table only; not the members' table.
+    players' table only; not the members' table. A scheduled match (see
+    scheduleRoundRobin and scheduleElimination) gets its outcome filled in,
+    and in a bracket the winner and loser go on to their next matches. The
+    result is also appended to the match_events log; see voidResult,
+    replaceResult and rebuildStandings.
 
     Args:
       t_id: tournament id.
@@ -298,69 +925,536 @@ def reportMatch(t_id, m_id, win_id, lose_id, draw=False):
       lose_id: the id number of the player who lost.
       draw: draw if True; can accept False (optional)
     """
-    db, c = connect()
-    # set records with 'draw' points
-    if draw is True:
-        # update player 1 record
-        c.execute("UPDATE players "
-                  "SET wins = (wins + .5), matches = (matches + 1) "
-                  "WHERE id = %s;", (lose_id,))
-        # update player 2 record
-        c.execute("UPDATE players "
-                  "SET wins = (wins + .5), matches = (matches + 1) "
-                  "WHERE id = %s;", (win_id,))
-        # update player 1 tourney card
-        c.execute("INSERT INTO matches (tourney_id, match_id, player_id, "
-                  "opponent_id, match_outcome) "
-                  "VALUES (%s, %s, %s, %s, %s)",
-                  (t_id, m_id, win_id, lose_id, .5))
-        # update player 2 tourney card
-        c.execute("INSERT INTO matches (tourney_id,match_id, player_id, "
-                  "opponent_id, match_outcome) "
-                  "VALUES (%s, %s, %s, %s, %s)",
-                  (t_id, m_id, lose_id, win_id, .5))
-    # set records of match both in match table and player table
-    elif draw is False:
-        # update lose_id record
-        c.execute("UPDATE players "
-                  "SET matches = (matches + 1) "
-                  "WHERE id = %s;", (lose_id,))
-        # update lose_id record
+    _reportResults(t_id, m_id, [(win_id, lose_id, draw)])
+
+
+@_instrumented
+def reportRound(t_id, m_id, results):
+    """Records the outcomes of every match of a round in a single transaction.
+    The players and matches tables are each written with one statement. If
+    any result is invalid nothing is recorded. Scheduled matches are handled
+    as in reportMatch.
+
+    Args:
+      t_id: tournament id.
+      m_id: match (round) id.
+      results: a list of tuples, each of which contains (win_id, lose_id,
+        draw):
+          win_id: the id number of the player who won.
+          lose_id: the id number of the player who lost.
+          draw: True if the match was a draw, otherwise False.
+    """
+    _reportResults(t_id, m_id, results)
+
+
+def _reportResults(t_id, m_id, results):
+    """Records results as reportRound does, retrying on conflicts."""
+    def write(c):
+        _runSteps(c, _recordResults(t_id, m_id, results))
+        _runSteps(c, _advanceBrackets(t_id, m_id, results))
+
+    session, generation = _takeSession(t_id)
+    _writeTransaction(write)
+    _applyResults(t_id, results, session, generation)
+
+
+def _writeTransaction(write):
+    """Calls write(c) with a cursor in a transaction of its own at
+    WRITE_ISOLATION, and returns what it returns. A transaction the database
+    aborts to resolve a conflict with concurrent writers is rolled back and
+    run again, up to WRITE_RETRIES times, after a random delay."""
+    attempt = 0
+    while True:
+        try:
+            with getConnection() as (db, c):
+                _backend.beginTransaction(c, WRITE_ISOLATION)
+                return write(c)
+        except Exception as e:
+            if attempt >= WRITE_RETRIES or not _backend.isRetryable(e):
+                raise
+        if _instrumentation is not None:
+            _instrumentation.count('retries')
+        time.sleep(_retryDelay(attempt))
+        attempt += 1
+
+
+def _retryDelay(attempt):
+    """Returns the seconds to wait before retrying a write that failed
+    attempt + 1 times. The random spread keeps writers that collided from
+    colliding again."""
+    return random.uniform(0, RETRY_DELAY * 2 ** attempt)
+
+
+def _applyResults(t_id, results, session, generation):
+    """Invalidates a tourney's standings after results were recorded, and
+    applies the results to its pairing session, taken by _takeSession
+    before they were written, unless another write happened meanwhile."""
+    if _invalidateStandings(t_id) == generation + 1 and session is not None:
+        session.addResults(results)
+        _putSession(t_id, session, generation + 1)
+
+
+# Locks the rows of the given players and of their opponents, in id order,
+# before their records are changed: opponent scores are computed from the
+# records of both, and locking in one order lets concurrent writers queue
+# instead of deadlocking. Parameters: (t_id, p_ids, t_id, p_ids).
+_LOCK_PLAYERS = ("SELECT id FROM players "
+                 "WHERE tourney_id = %s AND (id = ANY(%s) OR id IN "
+                 "(SELECT opponent_id FROM matches "
+                 "WHERE tourney_id = %s AND player_id = ANY(%s) "
+                 "AND match_outcome IS NOT NULL)) "
+                 "ORDER BY id FOR UPDATE")
+
+# Inserts the cards of played matches, each a tuple (tourney_id, match_id,
+# player_id, opponent_id, match_outcome). A scheduled match is already
+# there, without an outcome, and gets it filled in.
+_INSERT_CARDS = ("INSERT INTO matches (tourney_id, match_id, "
+                 "player_id, opponent_id, match_outcome) "
+                 "VALUES %s "
+                 "ON CONFLICT (match_id, player_id, tourney_id) DO UPDATE "
+                 "SET match_outcome = excluded.match_outcome "
+                 "WHERE matches.match_outcome IS NULL "
+                 "AND matches.opponent_id = excluded.opponent_id")
+
+
+# Each of these takes a VALUES list of (tourney_id, player_id, points) rows,
+# with the _RESULT_POINTS template. _UPDATE_OPPONENT_SCORES applies the
+# change in each player's wins and match win percentage to the players they
+# have already met; _ADD_RESULT_POINTS then updates the players' records.
+_RESULT_POINTS = "(%s::integer, %s::integer, %s::real)"
+_UPDATE_OPPONENT_SCORES = (
+    "WITH v (tourney_id, id, wins) AS (VALUES %s) "
+    "UPDATE players AS o "
+    "SET omw = o.omw + x.omw, opp_pct = o.opp_pct + x.pct "
+    "FROM (SELECT m.tourney_id, m.player_id, "
+    "SUM(v.wins) AS omw, "
+    "SUM(GREATEST((p.wins + v.wins) / (p.matches + 1), "
+    "1.0 / 3) - COALESCE(GREATEST(p.wins / "
+    "NULLIF(p.matches, 0), 1.0 / 3), 0)) AS pct "
+    "FROM v "
+    "JOIN players p ON p.tourney_id = v.tourney_id "
+    "AND p.id = v.id "
+    "JOIN matches m ON m.tourney_id = v.tourney_id "
+    "AND m.opponent_id = v.id AND m.match_outcome IS NOT NULL "
+    "GROUP BY m.tourney_id, m.player_id) AS x "
+    "WHERE o.tourney_id = x.tourney_id "
+    "AND o.id = x.player_id")
+_ADD_RESULT_POINTS = ("WITH v (tourney_id, id, wins) AS (VALUES %s) "
+                      "UPDATE players AS p "
+                      "SET wins = p.wins + v.wins, matches = p.matches + 1 "
+                      "FROM v "
+                      "WHERE p.tourney_id = v.tourney_id AND p.id = v.id")
+
+# Logs results, each a tuple (tourney_id, match_id, win_id, lose_id, draw).
+_INSERT_EVENTS = ("INSERT INTO match_events (tourney_id, match_id, win_id, "
+                  "lose_id, draw) VALUES %s")
+
+# Adds the new opponent's record to each player's opponent scores, from a
+# VALUES list of (tourney_id, player_id, opponent_id) rows.
+_RESULT_OPPONENTS = "(%s::integer, %s::integer, %s::integer)"
+_ADD_OPPONENT_RECORDS = ("WITH v (tourney_id, id, opponent_id) AS (VALUES %s) "
+                         "UPDATE players AS p "
+                         "SET omw = p.omw + o.wins, "
+                         "opp_pct = p.opp_pct + "
+                         "GREATEST(o.wins / o.matches, 1.0 / 3) "
+                         "FROM v "
+                         "JOIN players o ON o.tourney_id = v.tourney_id "
+                         "AND o.id = v.opponent_id "
+                         "WHERE p.tourney_id = v.tourney_id AND p.id = v.id")
+
+
+def _recordResults(t_id, m_id, results):
+    """Yields the statements that write match results to the players,
+    matches and match_events tables; run them with _runSteps(). Raises
+    TypeError or ValueError, before or after writing, if a result is
+    invalid; the caller's transaction must then be rolled back."""
+    points = {}
+    cards = []
+    events = []
+    for (win_id, lose_id, draw) in results:
+        if draw is True:
+            win_points = lose_points = .5
+        elif draw is False:
+            win_points, lose_points = 1, 0
+        else:
+            raise TypeError("Draw argument can only be True or False.")
+        if win_id == lose_id:
+            raise ValueError("Player %s cannot play against themselves."
+                             % win_id)
+        for p_id in (win_id, lose_id):
+            if p_id in points:
+                raise ValueError("Player %s has more than one result in "
+                                 "round %s." % (p_id, m_id))
+        points[win_id] = win_points
+        points[lose_id] = lose_points
+        # each player's tourney card
+        cards.append((t_id, m_id, win_id, lose_id, win_points))
+        cards.append((t_id, m_id, lose_id, win_id, lose_points))
+        events.append((t_id, m_id, win_id, lose_id, draw))
+    if not cards:
+        return
+    p_ids = sorted(points)
+    yield _statement(_LOCK_PLAYERS, (t_id, p_ids, t_id, p_ids))
+    values = [(t_id, p_id, wins) for (p_id, wins) in points.items()]
+    # Existing opponents of each player see that player's wins and match win
+    # percentage change; apply the differences before the players are
+    # updated, while the old records are still in place.
+    yield _valuesStatement(_UPDATE_OPPONENT_SCORES, values, _RESULT_POINTS)
+    rows, count = yield _valuesStatement(_ADD_RESULT_POINTS, values,
+                                         _RESULT_POINTS)
+    if count != len(points):
+        raise ValueError("Every player in a result must be registered in "
+                         "the tournament.")
+    rows, count = yield _valuesStatement(_INSERT_CARDS, cards)
+    if count != len(cards):
+        raise ValueError("A player in these results already has a result or "
+                         "another opponent in round %s." % m_id)
+    yield _valuesStatement(_INSERT_EVENTS, events)
+    # Each player adds the new record of this round's opponent.
+    yield _valuesStatement(_ADD_OPPONENT_RECORDS,
+                           [(t_id, card[2], card[3]) for card in cards],
+                           _RESULT_OPPONENTS)
+
+
+def _statement(sql, params=None):
+    """A statement for _runSteps(): sql run with its params."""
+    return ('execute', sql, params, None)
+
+
+def _valuesStatement(sql, rows, template=None):
+    """A statement for _runSteps(): sql, whose single %s stands for a VALUES
+    list, run with every row in rows as the backend's executeValues() runs
+    it. Templates cast every placeholder that the statement does not give a
+    type, so drivers that send parameters apart from the SQL can run it."""
+    return ('values', sql, rows, template)
+
+
+def _runSteps(c, steps):
+    """Runs the statements yielded by a generator, such as _recordResults(),
+    on cursor c, sending the result of each back into the generator as a
+    tuple (rows, rowcount); rows is None for a statement returning none.
+    The same generators run on asyncpg in tournament_async.py."""
+    result = None
+    while True:
+        try:
+            kind, sql, params, template = steps.send(result)
+        except StopIteration:
+            return
+        if kind == 'values':
+            _backend.executeValues(c, sql, params, template=template)
+            rows = None
+        else:
+            c.execute(sql, params)
+            rows = c.fetchall() if c.description is not None else None
+        result = (rows, c.rowcount)
+
+
+@_instrumented
+def voidResult(t_id, m_id, p_id):
+    """Cancels a result reported in error, as if the match had not been
+    played. A void event is appended to the match_events log, the match is
+    removed from the matches table, and only the players whose standings
+    depend on it are updated: the two players and their opponents.
+
+    Args:
+      t_id: tournament id.
+      m_id: match (round) id.
+      p_id: the id of either player of the match.
+
+    Returns:
+      The voided result, as a tuple (win_id, lose_id, draw).
+    """
+    result = _writeTransaction(
+        lambda c: _voidResult(c, t_id, m_id, p_id))
+    _invalidateStandings(t_id)
+    return result
+
+
+@_instrumented
+def replaceResult(t_id, m_id, win_id, lose_id, draw=False):
+    """Corrects the result of a match already reported: voids it as
+    voidResult does and reports the new result in its place, in a single
+    transaction.
+
+    Args:
+      t_id: tournament id.
+      m_id: match (round) id.
+      win_id: the id number of the player who won.
+      lose_id: the id number of the player who lost.
+      draw: draw if True; can accept False (optional)
+
+    Returns:
+      The replaced result, as a tuple (win_id, lose_id, draw).
+    """
+    def write(c):
+        result = _voidResult(c, t_id, m_id, win_id)
+        if set(result[:2]) != set((win_id, lose_id)):
+            raise ValueError("Players %s and %s did not meet in round %s."
+                             % (win_id, lose_id, m_id))
+        _runSteps(c, _recordResults(t_id, m_id, [(win_id, lose_id, draw)]))
+        return result
+
+    result = _writeTransaction(write)
+    _invalidateStandings(t_id)
+    return result
+
+
+def _voidResult(c, t_id, m_id, p_id):
+    """Voids the result of a player's match in a round using cursor c.
+    Returns the result as (win_id, lose_id, draw)."""
+    find = ("SELECT e.event_id, e.win_id, e.lose_id, e.draw "
+            "FROM match_events e "
+            "WHERE e.tourney_id = %s AND e.match_id = %s "
+            "AND %s IN (e.win_id, e.lose_id) AND e.voids IS NULL "
+            "AND NOT EXISTS (SELECT 1 FROM match_events v "
+            "WHERE v.voids = e.event_id)")
+    c.execute(find, (t_id, m_id, p_id))
+    row = c.fetchone()
+    if row is not None:
+        # read the result again once its players are locked, in case a
+        # concurrent writer voided it meanwhile
+        p_ids = list(row[1:3])
+        c.execute(_LOCK_PLAYERS, (t_id, p_ids, t_id, p_ids))
+        c.execute(find, (t_id, m_id, p_id))
+        if c.fetchone() != row:
+            row = None
+    if row is None:
+        raise ValueError("Player %s has no result in round %s."
+                         % (p_id, m_id))
+    event_id, win_id, lose_id, draw = row
+    draw = bool(draw)
+    c.execute("SELECT 1 FROM brackets WHERE tourney_id = %s LIMIT 1",
+              (t_id,))
+    if c.fetchone() is not None:
+        raise ValueError("The results of a bracket cannot be corrected; "
+                         "their players have moved on.")
+    c.execute("INSERT INTO match_events (tourney_id, match_id, win_id, "
+              "lose_id, draw, voids) VALUES (%s, %s, %s, %s, %s, %s)",
+              (t_id, m_id, win_id, lose_id, draw, event_id))
+    c.execute("DELETE FROM matches "
+              "WHERE tourney_id = %s AND match_id = %s "
+              "AND player_id IN (%s, %s)", (t_id, m_id, win_id, lose_id))
+    c.execute("UPDATE players "
+              "SET wins = wins - CASE id WHEN %s THEN %s::real "
+              "ELSE %s::real END, matches = matches - 1 "
+              "WHERE tourney_id = %s AND id IN (%s, %s)",
+              (win_id, .5 if draw else 1, .5 if draw else 0,
+               t_id, win_id, lose_id))
+    # The players' opponents see their records change.
+    p_ids = [win_id, lose_id]
+    c.execute("UPDATE players AS p "
+              "SET omw = COALESCE((SELECT SUM(o.wins) "
+              "FROM matches m JOIN players o "
+              "ON o.tourney_id = m.tourney_id AND o.id = m.opponent_id "
+              "WHERE m.tourney_id = p.tourney_id AND m.player_id = p.id "
+              "AND m.match_outcome IS NOT NULL), 0), "
+              "opp_pct = COALESCE((SELECT "
+              "SUM(GREATEST(o.wins / o.matches, 1.0 / 3)) "
+              "FROM matches m JOIN players o "
+              "ON o.tourney_id = m.tourney_id AND o.id = m.opponent_id "
+              "WHERE m.tourney_id = p.tourney_id AND m.player_id = p.id "
+              "AND m.match_outcome IS NOT NULL), 0) "
+              "WHERE p.tourney_id = %s AND (p.id = ANY(%s) OR p.id IN "
+              "(SELECT opponent_id FROM matches "
+              "WHERE tourney_id = %s AND player_id = ANY(%s) "
+              "AND match_outcome IS NOT NULL))",
+              (t_id, p_ids, t_id, p_ids))
+    return win_id, lose_id, draw
+
+
+@_instrumented
+def rebuildStandings(t_id):
+    """Rebuilds a tournament's standings and match records from its
+    match_events log, for recovery after they have gone wrong. The log is
+    read in a single pass; the standings are then computed in memory and
+    written back with one statement per table.
+
+    Args:
+      t_id: tournament id.
+
+    Returns: the number of results replayed
+    """
+    with getConnection() as (db, c):
+        c.execute("SELECT event_id, match_id, win_id, lose_id, draw, voids "
+                  "FROM match_events WHERE tourney_id = %s "
+                  "ORDER BY event_id", (t_id,))
+        results = {}
+        for event_id, m_id, win_id, lose_id, draw, voids in c:
+            if voids is None:
+                results[event_id] = (m_id, win_id, lose_id, draw)
+            else:
+                results.pop(voids, None)
+        cards = []
+        for m_id, win_id, lose_id, draw in results.values():
+            cards.append((t_id, m_id, win_id, lose_id, .5 if draw else 1))
+            cards.append((t_id, m_id, lose_id, win_id, .5 if draw else 0))
+        wins = {}
+        matches = {}
+        for card in cards:
+            wins[card[2]] = wins.get(card[2], 0.0) + card[4]
+            matches[card[2]] = matches.get(card[2], 0) + 1
+        omw = dict.fromkeys(wins, 0.0)
+        opp_pct = dict.fromkeys(wins, 0.0)
+        for card in cards:
+            o_id = card[3]
+            omw[card[2]] += wins[o_id]
+            opp_pct[card[2]] += max(wins[o_id] / matches[o_id], 1.0 / 3)
         c.execute("UPDATE players "
-                  "SET wins = (wins + 1), matches = (matches + 1) "
-                  "WHERE id = %s;", (win_id,))
-        # update win_id tourney card
-        c.execute("INSERT INTO matches (tourney_id, match_id, player_id, "
-                  "opponent_id, match_outcome) "
-                  "VALUES (%s ,%s, %s, %s, %s)",
-                  (t_id, m_id, win_id, lose_id, 1))
-        # update lose_id tourney card
-        c.execute("INSERT INTO matches (tourney_id, match_id, player_id, "
-                  "opponent_id, match_outcome) "
-                  "VALUES (%s, %s, %s, %s, %s)",
-                  (t_id, m_id, lose_id, win_id, 0))
-    else:
-        raise TypeError("Draw argument can only be True or False.")
-    db.commit()
-    db.close()
+                  "SET wins = 0, matches = 0, omw = 0, opp_pct = 0 "
+                  "WHERE tourney_id = %s", (t_id,))
+        c.execute("DELETE FROM matches "
+                  "WHERE tourney_id = %s AND match_outcome IS NOT NULL",
+                  (t_id,))
+        if cards:
+            _backend.executeValues(c, _INSERT_CARDS, cards)
+            _backend.executeValues(
+                c, "WITH v (tourney_id, id, wins, matches, omw, opp_pct) "
+                   "AS (VALUES %s) "
+                   "UPDATE players AS p "
+                   "SET wins = v.wins, matches = v.matches, "
+                   "omw = v.omw, opp_pct = v.opp_pct "
+                   "FROM v "
+                   "WHERE p.tourney_id = v.tourney_id AND p.id = v.id",
+                [(t_id, p_id, wins[p_id], matches[p_id], omw[p_id],
+                  opp_pct[p_id]) for p_id in wins],
+                template="(%s, %s, %s::real, %s, %s::real, %s::real)")
+    _invalidateStandings(t_id)
+    return len(results)
+
+
+@_instrumented
+def matchEvents(t_id):
+    """Returns a tournament's match_events log, oldest first.
 
+    Args:
+      t_id: tournament id.
 
-def endTournament():
+    Returns:
+      A list of tuples, each of which contains (event_id, m_id, win_id,
+      lose_id, draw, voids):
+        event_id: the event's unique id, in the order of recording
+        m_id: match (round) id
+        win_id, lose_id: the players, the winner first
+        draw: True if the match was a draw
+        voids: for a void event, the event_id of the result it cancels;
+          None for a result
+    """
+    with getConnection() as (db, c):
+        c.execute("SELECT event_id, match_id, win_id, lose_id, draw, voids "
+                  "FROM match_events WHERE tourney_id = %s "
+                  "ORDER BY event_id", (t_id,))
+        events = [row[:4] + (bool(row[4]),) + row[5:] for row in c]
+    return events
+
+
+@_reportingAtEnd
+@_instrumented
+def endTournament(t_id):
     """To be ran at the end of each tournament. This function updates member
-    data with data from players table, and then clears the players table.
+    data with the tournament's data from the players table, applies the
+    tournament's matches to the members' Elo ratings, and then removes the
+    tournament's players, bracket and unplayed scheduled matches. Other
+    tournaments are not affected.
+
+    Args:
+      t_id: the tournament id.
+    """
+    with getConnection() as (db, c):
+        c.execute(_ADD_MEMBER_RECORDS, (t_id,))
+        c.execute("DELETE FROM players WHERE tourney_id = %s", (t_id,))
+        c.execute("DELETE FROM matches "
+                  "WHERE tourney_id = %s AND match_outcome IS NULL", (t_id,))
+        c.execute("DELETE FROM brackets WHERE tourney_id = %s", (t_id,))
+        _rateTournament(c, t_id)
+    _invalidateStandings(t_id)
+    print("EoT. Members' records updated and tourney's players cleared.")
+
+
+# Adds a tournament's records to its members' records.
+_ADD_MEMBER_RECORDS = ("UPDATE members AS m "
+                       "SET wins = p.wins + m.wins, "
+                       "matches = p.matches + m.matches "
+                       "FROM players p "
+                       "WHERE p.tourney_id = %s AND m.id = p.id")
+
+
+@_instrumented
+def rateTournament(t_id):
+    """Applies a tournament's matches to the Elo ratings of its members, round
+    by round. endTournament does this; a tournament is only ever rated once.
+    Matches against the BYE are not rated.
+
+    Args:
+      t_id: the tournament id.
+
+    Returns: True if the ratings were updated, False if the tournament had
+      already been rated
+    """
+    with getConnection() as (db, c):
+        rated = _rateTournament(c, t_id)
+    return rated
+
+
+@_instrumented
+def recomputeRatings(k=ratings.K_FACTOR):
+    """Recomputes every member's Elo rating from scratch by replaying the
+    matches of all rated tournaments, in order of tourney id and round, in a
+    single pass.
+
+    Args:
+      k: the K-factor.
+
+    Returns: the number of matches replayed
     """
-    db, c = connect()
-    c.execute("UPDATE members m "
-              "SET wins = p.wins + m.wins, matches = p.matches + m.matches "
-              "FROM players p "
-              "WHERE m.id = p.id")
-    db.commit()
-    db.close()
-    deletePlayers()
-    print("EoT. Members' records updated and players table cleared.")
+    with getConnection() as (db, c):
+        c.execute(_RATED_MATCHES +
+                  "AND m.tourney_id IN (SELECT tourney_id FROM rated_tourneys) "
+                  "ORDER BY 1")
+        matches = c.fetchall()
+        c.execute("UPDATE members SET rating = %s", (ratings.INITIAL_RATING,))
+        _storeRatings(c, ratings.eloRatings({}, matches, k))
+    return len(matches)
+
+
+# Every match once, as (round, player_id, opponent_id, score), between two
+# members; matches against the BYE or deleted members are left out.
+_RATED_MATCHES = ("SELECT dense_rank() OVER "
+                  "(ORDER BY m.tourney_id, m.match_id), "
+                  "m.player_id, m.opponent_id, m.match_outcome "
+                  "FROM matches m "
+                  "JOIN members p ON p.id = m.player_id "
+                  "JOIN members o ON o.id = m.opponent_id "
+                  "WHERE m.player_id < m.opponent_id "
+                  "AND m.match_outcome IS NOT NULL ")
+_TOURNEY_RATED_MATCHES = _RATED_MATCHES + "AND m.tourney_id = %s ORDER BY 1"
+
+
+def _rateTournament(c, t_id):
+    c.execute("INSERT INTO rated_tourneys (tourney_id) VALUES (%s) "
+              "ON CONFLICT DO NOTHING", (t_id,))
+    if c.rowcount == 0:
+        return False
+    c.execute(_TOURNEY_RATED_MATCHES, (t_id,))
+    matches = c.fetchall()
+    c.execute("SELECT id, rating FROM members WHERE id IN "
+              "(SELECT player_id FROM matches WHERE tourney_id = %s)",
+              (t_id,))
+    _storeRatings(c, ratings.eloRatings(dict(c.fetchall()), matches))
+    return True
+
+
+def _storeRatings(c, new_ratings):
+    if not new_ratings:
+        return
+    _backend.executeValues(
+        c, "WITH v (id, rating) AS (VALUES %s) "
+           "UPDATE members AS m SET rating = v.rating "
+           "FROM v WHERE m.id = v.id",
+        list(new_ratings.items()), template="(%s, %s::real)")
 
 
-def swissPairings(t_id):
+@_instrumented
+def swissPairings(t_id, method='search', budget=None):
     """Returns a list of pairs of players for the next round of a match.
     This function pools other functions to create pairs that provide the
     tournament with results that are more aligned with the players
@@ -369,9 +1463,21 @@ def swissPairings(t_id):
     odd number of players, and no player gets more than one bye. This
     program works as long as the number of rounds is roughly log2 n;
     n being the number of players. Can work with more.
+    Standings and match history are loaded once into the tournament's
+    pairing session (pairing.PairingSession), which later calls reuse:
+    reportMatch and reportRound apply their results to it, so pairing the
+    next round runs no queries. The pairing search itself runs in memory.
 
     Args:
       t_id: the tournament id.
+      method: 'search' (default) pairs with pairing.pairPlayers, a fast
+        greedy search that backtracks when stuck; 'matching' pairs with
+        pairing.matchPlayers, a minimum-cost perfect matching that takes
+        O(n^3) time but never backtracks and fails only if no pairing exists.
+      budget: if given, the search runs in the pairing pool (see
+        configurePairingPool()) and may take this many seconds; past that,
+        pairing.fallbackPairs() pairs the round instead. None runs the
+        search in this process however long it takes.
 
     Returns:
       A list of tuples, each of which contains (id1, id2, diff)
@@ -379,32 +1485,119 @@ def swissPairings(t_id):
         id2: the second player's unique id
         diff: the absolute difference in players' match points
     """
-    db, c = connect()
-    c.execute("SELECT * "
-              "FROM matches "
-              "WHERE tourney_id = %s", (t_id,))
-    in_progress = c.fetchone()
-    db.commit()
-    db.close()
-    num_of_players = countPlayers()
-    if in_progress == None:
+    pool = _pairingPool() if budget is not None else None
+    return _finishPairing(t_id, *_startPairing(t_id, method, pool, budget))
+
+
+@_instrumented
+def pairTournaments(t_ids, method='search', budget=None):
+    """Pairs the next round of several tournaments at once, e.g. side
+    events closing a round together. Their searches run in parallel in the
+    pairing pool (see configurePairingPool()), each within its budget, as
+    swissPairings(t_id, method, budget) would run them.
+
+    Args:
+      t_ids: the tournament ids.
+      method: as for swissPairings().
+      budget: the seconds each search may take; the pool's budget if None.
+
+    Returns:
+      A dict mapping each tournament id to its pairs, as returned by
+      swissPairings().
+    """
+    pool = _pairingPool()
+    started = [(t_id, _startPairing(t_id, method, pool, budget))
+               for t_id in t_ids]
+    return dict((t_id, _finishPairing(t_id, *state))
+                for t_id, state in started)
+
+
+def configurePairingPool(processes=None, budget=10.0):
+    """Replaces the pool of worker processes that pairTournaments() and
+    swissPairings(budget=...) run their searches in.
+
+    Args:
+      processes: the most searches running at once; one per CPU if None.
+      budget: the seconds a search may take when no budget is given.
+    """
+    global _pairing_pool
+    closePairingPool()
+    _pairing_pool = pairpool.PairingPool(processes, budget)
+    return _pairing_pool
+
+
+def closePairingPool():
+    """Closes the pairing pool. The next search run in it opens a new one."""
+    global _pairing_pool
+    if _pairing_pool is not None:
+        _pairing_pool.close()
+        _pairing_pool = None
+
+
+def _pairingPool():
+    if _pairing_pool is None:
+        configurePairingPool()
+    return _pairing_pool
+
+
+def _startPairing(t_id, method, pool, budget):
+    """Takes a tourney's pairing session and pairs its first round, or
+    starts the search for a later round: in this process if pool is None,
+    else as a job in pool. Returns a tuple (session, generation, pairs),
+    where pairs may be a pairpool.PairingJob."""
+    if method not in ('search', 'matching'):
+        raise ValueError("Pairing method must be 'search' or 'matching'.")
+    session, generation = _takeSession(t_id)
+    if session is None:
+        session = pairing.PairingSession(*pairingData(t_id))
+    if not session.played():
         # initial pairings
-        if num_of_players % 2 != 0:
-            db, c = connect()
-            c.execute("INSERT INTO players (id, name, seed_score) "
-                      "VALUES (2147483647, 'BYE', 0)")
-            db.commit()
-            db.close()
-        num_of_players = countPlayers()
-        players = [row[0] for row in playerStandings(t_id)]
-        pairs_list = []
-        for i in range(num_of_players / 2):
-            pairs_list.append((players[i], players[i + num_of_players / 2], 0))
-    else:
+        if len(session) % 2 != 0:
+            with getConnection() as (db, c):
+                c.execute(_INSERT_BYE, (t_id,))
+            generation = _addBye(t_id, session, generation)
+        pairs_list = _initialPairs(session)
+    elif pool is None:
         # subsequent pairing
-        players = [row[0] for row in playerStandings(t_id)]
-        pairs_list = recursivePairFinder(t_id, players, num_of_players)
-    if len(pairs_list) == (num_of_players / 2):
+        pairs_list = session.pairRound(method) or []
+    else:
+        pairs_list = pool.submit(session.standings(), session.opponents,
+                                 method, budget)
+    return session, generation, pairs_list
+
+
+_INSERT_BYE = ("INSERT INTO players (tourney_id, id, name, seed_score) "
+               "VALUES (%s, 2147483647, 'BYE', 0)")
+
+
+def _addBye(t_id, session, generation):
+    """Adds the BYE, just inserted by _INSERT_BYE, to a tourney's session.
+    Returns the generation to put the session back with."""
+    if _invalidateStandings(t_id) == generation + 1:
+        generation += 1
+    session.addPlayer(2147483647, 0)
+    return generation
+
+
+def _initialPairs(session):
+    """Pairs the first round: the field is split in halves by seeding, and
+    each player in the top half meets the player as far down the bottom
+    half."""
+    players = [row[0] for row in session.standings()]
+    half = len(players) // 2
+    pairs_list = []
+    for i in range(half):
+        pairs_list.append((players[i], players[i + half], 0))
+    return pairs_list
+
+
+def _finishPairing(t_id, session, generation, pairs_list):
+    """Waits for a pairing started by _startPairing(), puts the session
+    back and checks that every player is paired."""
+    if isinstance(pairs_list, pairpool.PairingJob):
+        pairs_list = pairs_list.result() or []
+    _putSession(t_id, session, generation)
+    if len(pairs_list) == (len(session) // 2):
         return pairs_list
     else:
         raise ValueError("swissPairings is not returning the expected number "
@@ -412,6 +1605,245 @@ def swissPairings(t_id):
                          "rounds for this style of tournament being exceeded.")
 
 
+@_instrumented
+def simulateTournament(t_id, rounds, trials=10000, top=8, draw_rate=0.0,
+                       processes=None, seed=None):
+    """Returns each player's chance of finishing in the top places of a Swiss
+    tournament once its remaining rounds are played, from the current
+    standings and the players' ratings. The rounds are simulated trials
+    times in memory, paired as swissPairings pairs them, over a process
+    pool; see simulate.simulateEvent().
+
+    Args:
+      t_id: the tournament id.
+      rounds: the number of rounds left to play.
+      trials: the number of simulated runs.
+      top: the number of places counted, e.g. 8 for the top eight.
+      draw_rate: the chance of any match being drawn.
+      processes: the worker processes; None for one per CPU.
+      seed: seeds the random numbers, for a repeatable result.
+
+    Returns:
+      A dict mapping each player id to a chance between 0 and 1.
+    """
+    standings, history = pairingData(t_id)
+    return simulate.simulateEvent(standings, history, rounds, trials, top,
+                                  draw_rate, processes, seed)
+
+
+@_instrumented
+def scheduleRoundRobin(t_id):
+    """Schedules a round-robin between the players of a tournament, every
+    round up front, so no pairing search runs between rounds. The matches
+    are stored in the matches table without an outcome; play them in round
+    order and report them with reportMatch or reportRound.
+
+    Args:
+      t_id: the tournament id; it must not have any matches yet.
+
+    Returns:
+      A list of rounds, each a list of tuples (id1, id2), one per match;
+      round 1 comes first. With an odd number of players, each round one
+      player sits out.
+    """
+    with getConnection() as (db, c):
+        rounds = schedules.roundRobin(_scheduleField(c, t_id))
+        _runSteps(c, _scheduleMatches(
+            t_id, [(m_id, id1, id2)
+                   for m_id, pairs in enumerate(rounds, 1)
+                   for (id1, id2) in pairs]))
+    return rounds
+
+
+@_instrumented
+def scheduleElimination(t_id, double=False):
+    """Schedules a seeded elimination bracket between the players of a
+    tournament, every match up front. Matches whose players are known are
+    stored in the matches table without an outcome; the others are
+    scheduled by reportMatch and reportRound as the matches they depend on
+    are reported. A bracket match cannot be a draw.
+
+    Args:
+      t_id: the tournament id; it must not have any matches yet.
+      double: True for double elimination, False for single elimination;
+        see schedules.py.
+
+    Returns:
+      A list of tuples (slot, round, home, away), one per bracket match, as
+      returned by schedules.singleElimination().
+    """
+    with getConnection() as (db, c):
+        ids = _scheduleField(c, t_id)
+        if double:
+            bracket = schedules.doubleElimination(ids)
+        else:
+            bracket = schedules.singleElimination(ids)
+        rows = []
+        ready = []
+        for slot, m_id, home, away in bracket:
+            rows.append((t_id, slot, m_id) + _bracketSide(home) +
+                        _bracketSide(away))
+            if not isinstance(home, str) and not isinstance(away, str):
+                ready.append((m_id, home, away))
+        _backend.executeValues(
+            c, "INSERT INTO brackets (tourney_id, slot, match_id, "
+               "home_from, home_id, away_from, away_id) VALUES %s",
+            rows)
+        _runSteps(c, _scheduleMatches(t_id, ready))
+    return bracket
+
+
+@_instrumented
+def scheduledMatches(t_id, m_id=None):
+    """Returns the scheduled matches of a tournament that are still to be
+    played and whose players are both known.
+
+    Args:
+      t_id: the tournament id.
+      m_id: a round to list the matches of; every round if None.
+
+    Returns:
+      A list of tuples, each of which contains (m_id, id1, id2), ordered by
+      round:
+        m_id: the round the match is scheduled in
+        id1, id2: the players' unique ids, the lower first
+    """
+    with getConnection() as (db, c):
+        if m_id is None:
+            c.execute("SELECT match_id, player_id, opponent_id "
+                      "FROM matches "
+                      "WHERE tourney_id = %s AND match_outcome IS NULL "
+                      "AND player_id < opponent_id "
+                      "ORDER BY match_id, player_id", (t_id,))
+        else:
+            c.execute("SELECT match_id, player_id, opponent_id "
+                      "FROM matches "
+                      "WHERE tourney_id = %s AND match_id = %s "
+                      "AND match_outcome IS NULL "
+                      "AND player_id < opponent_id "
+                      "ORDER BY player_id", (t_id, m_id))
+        matches = c.fetchall()
+    return matches
+
+
+def _scheduleField(c, t_id):
+    """Returns the ids of a tournament's players, best seed first. Raises
+    ValueError if the tournament already has matches."""
+    c.execute("SELECT 1 FROM matches WHERE tourney_id = %s LIMIT 1", (t_id,))
+    if c.fetchone() is not None:
+        raise ValueError("Tournament %s already has matches." % t_id)
+    c.execute("SELECT id FROM players WHERE tourney_id = %s "
+              "ORDER BY seed_score DESC, id", (t_id,))
+    return [row[0] for row in c.fetchall()]
+
+
+def _bracketSide(side):
+    """Returns a side of a bracket match as (from, id) for the brackets
+    table: a player id is known now, 'W<slot>' and 'L<slot>' later."""
+    if isinstance(side, str):
+        return side, None
+    return None, side
+
+
+def _scheduleMatches(t_id, matches):
+    """Yields the statement that stores matches (m_id, id1, id2) in the
+    matches table without an outcome; run it with _runSteps()."""
+    cards = []
+    for m_id, id1, id2 in matches:
+        cards.append((t_id, m_id, id1, id2, None))
+        cards.append((t_id, m_id, id2, id1, None))
+    if cards:
+        yield _valuesStatement(
+            "INSERT INTO matches (tourney_id, match_id, "
+            "player_id, opponent_id, match_outcome) "
+            "VALUES %s",
+            cards)
+
+
+def _advanceBrackets(t_id, m_id, results):
+    """Yields the statements that move the winners and losers of a round's
+    bracket matches on to their next matches, and schedule those whose
+    players are now both known; run them with _runSteps(). Raises ValueError
+    if a result does not belong to a bracket match of the round; does
+    nothing if the round has no bracket matches."""
+    rows, count = yield _statement(
+        "SELECT slot, home_id, away_id FROM brackets "
+        "WHERE tourney_id = %s AND match_id = %s", (t_id, m_id))
+    slots = dict((frozenset((home_id, away_id)), slot)
+                 for slot, home_id, away_id in rows)
+    if not slots:
+        return
+    decided = {}
+    for (win_id, lose_id, draw) in results:
+        slot = slots.get(frozenset((win_id, lose_id)))
+        if slot is None:
+            raise ValueError("Players %s and %s do not meet in round %s of "
+                             "the bracket." % (win_id, lose_id, m_id))
+        if draw:
+            raise ValueError("A bracket match cannot be a draw.")
+        decided['W%d' % slot] = win_id
+        decided['L%d' % slot] = lose_id
+    sources = list(decided)
+    rows, count = yield _statement(
+        "SELECT slot, match_id, home_from, away_from, home_id, away_id "
+        "FROM brackets "
+        "WHERE tourney_id = %s "
+        "AND (home_from = ANY(%s) OR away_from = ANY(%s))",
+        (t_id, sources, sources))
+    sides = []
+    ready = []
+    for (slot, next_id, home_from, away_from, home_id, away_id) in rows:
+        home_id = decided.get(home_from, home_id)
+        away_id = decided.get(away_from, away_id)
+        sides.append((t_id, slot, home_id, away_id))
+        if home_id is not None and away_id is not None:
+            ready.append((next_id, home_id, away_id))
+    if sides:
+        yield _valuesStatement(
+            "WITH v (tourney_id, slot, home_id, away_id) AS (VALUES %s) "
+            "UPDATE brackets AS b "
+            "SET home_id = v.home_id, away_id = v.away_id "
+            "FROM v "
+            "WHERE b.tourney_id = v.tourney_id AND b.slot = v.slot",
+            sides, "(%s::integer, %s::integer, %s::integer, %s::integer)")
+    # _scheduleMatches() takes no results back
+    for statement in _scheduleMatches(t_id, ready):
+        yield statement
+
+
+@_instrumented
+def pairingData(t_id):
+    """Returns everything the pairing engine needs for a tournament, loaded
+    with a single connection.
+
+    Args:
+      t_id: the tournament id.
+
+    Returns:
+      A tuple (standings, history):
+        standings: a list of tuples (id, wins, seed_score), ordered by wins
+          then seed_score, best first.
+        history: a list of tuples (player_id, opponent_id), one per match
+          record of the tournament.
+    """
+    with getConnection() as (db, c):
+        c.execute(_PAIRING_STANDINGS, (t_id,))
+        standings = c.fetchall()
+        c.execute(_PAIRING_HISTORY, (t_id,))
+        history = c.fetchall()
+    return standings, history
+
+
+_PAIRING_STANDINGS = ("SELECT id, wins, seed_score "
+                      "FROM players "
+                      "WHERE tourney_id = %s "
+                      "ORDER BY wins DESC, seed_score DESC, id")
+_PAIRING_HISTORY = ("SELECT player_id, opponent_id "
+                    "FROM matches "
+                    "WHERE tourney_id = %s")
+
+
+@_instrumented
 def remainingOpponents(t_id, p_id):
     """Returns a list opponents that player had not yet had a match with.
 
@@ -425,20 +1857,24 @@ def remainingOpponents(t_id, p_id):
         opponent_id: the opponent's unique id (assigned by the database)
         diff: absolute difference in win totals
     """
-    db, c = connect()
-    c.execute("SELECT p.id, o.id, ABS(p.wins - o.wins) AS diff "
-              "FROM players p, players o "
-              "WHERE p.id = %s AND o.id != p.id AND o.id NOT IN "
-              "(SELECT opponent_id "
-              "FROM matches "
-              "WHERE player_id=p.id AND tourney_id=%s) "
-              "ORDER BY diff, o.seed_score", (p_id, t_id))
-    remaining_opp = c.fetchall()
-    db.commit()
-    db.close()
+    with getConnection() as (db, c):
+        c.execute(_REMAINING_OPPONENTS, (t_id, p_id))
+        remaining_opp = c.fetchall()
     return remaining_opp
 
 
+_REMAINING_OPPONENTS = ("SELECT p.id, o.id, ABS(p.wins - o.wins) AS diff "
+                        "FROM players p, players o "
+                        "WHERE p.tourney_id = %s "
+                        "AND o.tourney_id = p.tourney_id "
+                        "AND p.id = %s AND o.id != p.id AND o.id NOT IN "
+                        "(SELECT opponent_id "
+                        "FROM matches "
+                        "WHERE player_id=p.id AND tourney_id=p.tourney_id) "
+                        "ORDER BY diff, o.seed_score")
+
+
+@_instrumented
 def recursivePairFinder(t_id, players, size):
     """Returns a list with the best combination of pairings. It tries to
     match the players with the same match points, if more than one option is
@@ -44,16 +44,28 @@ DROP TABLE players;
 
 CREATE TABLE players
 (
-  id serial NOT NULL,
-  seed_score real DEFAULT 0,
+  tourney_id integer NOT NULL,
+  id integer NOT NULL,
+  seed_score double precision DEFAULT 0,
   name text,
   matches integer DEFAULT 0,
   wins real DEFAULT 0,
-  CONSTRAINT players_pkey PRIMARY KEY (id)
+  omw real DEFAULT 0,
+  opp_pct real DEFAULT 0,
+  CONSTRAINT players_pkey PRIMARY KEY (tourney_id, id)
 )
 WITH (
   OIDS=FALSE
 );
 
+-- A player is a member entered in one tournament; a member may play in many
+-- tournaments at once. omw: sum of the wins of every opponent faced, kept up
+-- to date by reportMatch. opp_pct: sum of those opponents' match-win
+-- percentages, each at least 1/3; divided by matches it gives OMW%.
 
-
+-- Per-tournament standings (playerStandings, pairingData) and ranks
+-- (playerRanks) read these indexes in order instead of sorting.
+CREATE INDEX players_standings_idx
+  ON players (tourney_id, wins DESC, seed_score DESC);
+CREATE INDEX players_ranks_idx
+  ON players (tourney_id, wins DESC, omw DESC, seed_score DESC);
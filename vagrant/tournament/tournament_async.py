@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+#
+# tournament_async.py -- asyncio variant of the tournament API, on asyncpg
+#
+# Result entry from many clients at once, e.g. judges' tablets, spends most
+# of its time waiting on the database. These coroutines wait without holding
+# a thread, on connections from a shared asyncpg pool, so one event loop can
+# serve hundreds of submissions at a time. They run the same statements as
+# tournament.py and share its standings cache and pairing sessions, so both
+# APIs can be used side by side in one process.
+#
+# Requires Python 3.7 or newer and asyncpg, and psycopg2 and NumPy for
+# tournament.py; pg_config.sh installs them for python3.7.
+#
+
+import asyncio
+import contextlib
+import re
+
+import asyncpg
+
+import backends
+import pairing
+import tournament
+
+# Shared connection pool; created on first use or by configurePool().
+_pool = None
+_pool_options = dict(database="tournament", host="localhost",
+                     user="postgres", password="postgres")
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+# Statements whose rows _execute() fetches; the rest only report a count.
+_RETURNS_ROWS = re.compile(r"^\s*SELECT\b|\bRETURNING\b", re.IGNORECASE)
+
+
+async def configurePool(min_size=1, max_size=10, database_name="tournament",
+                        host="localhost", user="postgres",
+                        password="postgres"):
+    """Replaces the module's connection pool, which every coroutine here
+    borrows its connection from.
+
+    Args:
+      min_size: connections opened up front and kept idle.
+      max_size: most connections open at one time; further callers wait
+        for a free connection without blocking the event loop.
+      database_name: the PostgreSQL database to connect to.
+      host, user, password: the server and the credentials to use.
+    """
+    global _pool, _pool_options
+    await closePool()
+    _pool_options = dict(min_size=min_size, max_size=max_size,
+                         database=database_name, host=host, user=user,
+                         password=password)
+    _pool = await asyncpg.create_pool(**_pool_options)
+    return _pool
+
+
+async def closePool():
+    """Closes all pooled connections. The next call opens a new pool."""
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        await pool.close()
+
+
+@contextlib.asynccontextmanager
+async def getConnection(isolation=None):
+    """Borrows a connection from the pool for the duration of an async with
+    block, inside a transaction that is committed when the block exits and
+    rolled back if it raises.
+
+    Args:
+      isolation: the transaction's isolation level, e.g. 'READ COMMITTED';
+        the server's default if None.
+
+    Usage:
+      async with getConnection() as conn:
+          await conn.fetch(...)
+    """
+    global _pool
+    if _pool is None:
+        pool = await asyncpg.create_pool(**_pool_options)
+        # another caller may have created the pool meanwhile
+        if _pool is None:
+            _pool = pool
+        else:
+            await pool.close()
+    if isolation is not None:
+        isolation = isolation.lower().replace(' ', '_')
+    async with _pool.acquire() as conn:
+        async with conn.transaction(isolation=isolation):
+            yield conn
+
+
+async def registerPlayer(t_id, p_id):
+    """Adds a member to a tournament as a player; see
+    tournament.registerPlayer().
+
+    Args:
+      t_id: the tournament id.
+      p_id: the player's member id.
+    """
+    async with getConnection() as conn:
+        await _execute(conn, tournament._REGISTER_PLAYER, (t_id, p_id))
+    tournament._invalidateStandings(t_id)
+
+
+async def reportMatch(t_id, m_id, win_id, lose_id, draw=False):
+    """Records the outcome of a single match; see tournament.reportMatch().
+
+    Args:
+      t_id: tournament id.
+      m_id: match (round) id.
+      win_id: the id number of the player who won.
+      lose_id: the id number of the player who lost.
+      draw: draw if True; can accept False (optional)
+    """
+    results = [(win_id, lose_id, draw)]
+    session, generation = tournament._takeSession(t_id)
+    attempt = 0
+    while True:
+        try:
+            async with getConnection(tournament.WRITE_ISOLATION) as conn:
+                await _runSteps(conn, tournament._recordResults(
+                    t_id, m_id, results))
+                await _runSteps(conn, tournament._advanceBrackets(
+                    t_id, m_id, results))
+            break
+        except asyncpg.PostgresError as e:
+            # as tournament._writeTransaction() retries conflicts
+            if attempt >= tournament.WRITE_RETRIES or \
+                    e.sqlstate not in backends.RETRY_SQLSTATES:
+                raise
+        await asyncio.sleep(tournament._retryDelay(attempt))
+        attempt += 1
+    tournament._applyResults(t_id, results, session, generation)
+
+
+async def playerStandings(t_id):
+    """Returns a list of the players and their match points, best first,
+    from the standings cache shared with tournament.playerStandings().
+
+    Arg:
+      t_id: tournament id.
+
+    Returns:
+      A list of tuples, each of which contains (id, wins):
+        id: the player's unique id
+        wins: the total wins of player thus far in current tourney
+    """
+    key = ('playerStandings', t_id)
+    hit, results, generation = tournament._cacheLookup(key)
+    if hit:
+        return results
+    async with getConnection() as conn:
+        results, count = await _execute(conn, tournament._PLAYER_STANDINGS,
+                                        (t_id,))
+    tournament._cacheStore(key, results, generation)
+    return results
+
+
+async def swissPairings(t_id, method='search'):
+    """Returns the pairs for the next round; see tournament.swissPairings().
+    The pairing search runs in the event loop's default executor, so it
+    does not hold up other coroutines.
+
+    Args:
+      t_id: the tournament id.
+      method: 'search' or 'matching', as for tournament.swissPairings().
+
+    Returns:
+      A list of tuples, each of which contains (id1, id2, diff)
+        id1: the first player's unique id
+        id2: the second player's unique id
+        diff: the absolute difference in players' match points
+    """
+    if method not in ('search', 'matching'):
+        raise ValueError("Pairing method must be 'search' or 'matching'.")
+    session, generation = tournament._takeSession(t_id)
+    if session is None:
+        async with getConnection() as conn:
+            standings, count = await _execute(
+                conn, tournament._PAIRING_STANDINGS, (t_id,))
+            history, count = await _execute(
+                conn, tournament._PAIRING_HISTORY, (t_id,))
+        session = pairing.PairingSession(standings, history)
+    if not session.played():
+        if len(session) % 2 != 0:
+            async with getConnection() as conn:
+                await _execute(conn, tournament._INSERT_BYE, (t_id,))
+            generation = tournament._addBye(t_id, session, generation)
+        pairs_list = tournament._initialPairs(session)
+    else:
+        loop = asyncio.get_running_loop()
+        pairs_list = await loop.run_in_executor(None, session.pairRound,
+                                                method)
+    return tournament._finishPairing(t_id, session, generation, pairs_list)
+
+
+async def _runSteps(conn, steps):
+    """Runs the statements yielded by a generator of tournament.py, such as
+    tournament._recordResults(), on conn, as tournament._runSteps() runs
+    them on a cursor."""
+    result = None
+    while True:
+        try:
+            kind, sql, params, template = steps.send(result)
+        except StopIteration:
+            return
+        if kind == 'values':
+            if template is None:
+                template = "(" + ", ".join(["%s"] * len(params[0])) + ")"
+            sql = sql.replace("%s", ", ".join([template] * len(params)), 1)
+            params = [value for row in params for value in row]
+        result = await _execute(conn, sql, params)
+
+
+async def _execute(conn, sql, params=None):
+    """Runs a statement written for psycopg2 on conn, through the
+    connection's statement cache. Returns a tuple (rows, rowcount); rows is
+    a list of tuples, or None if the statement returns no rows."""
+    query, args = _query(sql, params)
+    if _RETURNS_ROWS.search(query):
+        rows = [tuple(row) for row in await conn.fetch(query, *args)]
+        return rows, len(rows)
+    # the status is the command tag, e.g. 'UPDATE 3' or 'INSERT 0 2'
+    status = await conn.execute(query, *args)
+    return None, int(status.split()[-1])
+
+
+def _query(sql, params):
+    """Returns a psycopg2 query as asyncpg takes it: a tuple of the SQL with
+    its placeholders numbered $1, $2, ... and the list of arguments."""
+    args = []
+    numbers = {}
+    values = iter(params if not isinstance(params, dict) else ())
+
+    def number(match):
+        if match.group(0) == '%%':
+            return '%'
+        name = match.group(1)
+        if name is None:
+            args.append(next(values))
+            return '$%d' % len(args)
+        if name not in numbers:
+            args.append(params[name])
+            numbers[name] = len(args)
+        return '$%d' % numbers[name]
+
+    if params is None:
+        # like psycopg2, leave a query without parameters as it is
+        return sql, args
+    return _PLACEHOLDER.sub(number, sql), args
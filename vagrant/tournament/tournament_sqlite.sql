@@ -0,0 +1,88 @@
+-- Schema of the tournament database for the SQLite backend (backends.py).
+-- Mirrors tournament.sql with every migration in migrations/ applied; keep
+-- the two in step when adding a migration.
+
+CREATE TABLE matches
+(
+  match_id integer NOT NULL,
+  match_outcome real DEFAULT 0,
+  player_id integer NOT NULL,
+  opponent_id integer NOT NULL,
+  tourney_id integer NOT NULL,
+  CONSTRAINT matches_pkey PRIMARY KEY (match_id, player_id, tourney_id)
+);
+
+CREATE TABLE members
+(
+  id integer PRIMARY KEY,
+  name text NOT NULL,
+  wins real DEFAULT 0,
+  matches integer DEFAULT 0,
+  rating real NOT NULL DEFAULT 1500
+);
+
+CREATE TABLE players
+(
+  tourney_id integer NOT NULL,
+  id integer NOT NULL,
+  seed_score double precision DEFAULT 0,
+  name text,
+  matches integer DEFAULT 0,
+  wins real DEFAULT 0,
+  omw real DEFAULT 0,
+  opp_pct real DEFAULT 0,
+  CONSTRAINT players_pkey PRIMARY KEY (tourney_id, id)
+);
+
+CREATE TABLE rated_tourneys
+(
+  tourney_id integer NOT NULL,
+  CONSTRAINT rated_tourneys_pkey PRIMARY KEY (tourney_id)
+);
+
+CREATE TABLE brackets
+(
+  tourney_id integer NOT NULL,
+  slot integer NOT NULL,
+  match_id integer NOT NULL,
+  home_from text,
+  away_from text,
+  home_id integer,
+  away_id integer,
+  CONSTRAINT brackets_pkey PRIMARY KEY (tourney_id, slot)
+);
+
+CREATE TABLE match_events
+(
+  event_id integer PRIMARY KEY,
+  tourney_id integer NOT NULL,
+  match_id integer NOT NULL,
+  win_id integer NOT NULL,
+  lose_id integer NOT NULL,
+  draw boolean NOT NULL DEFAULT false,
+  voids bigint,
+  recorded_at timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX players_standings_idx
+  ON players (tourney_id, wins DESC, seed_score DESC);
+CREATE INDEX players_ranks_idx
+  ON players (tourney_id, wins DESC, omw DESC, seed_score DESC);
+CREATE INDEX matches_player_idx
+  ON matches (tourney_id, player_id);
+CREATE INDEX matches_opponent_idx
+  ON matches (tourney_id, opponent_id);
+CREATE INDEX members_wins_id_idx
+  ON members (wins DESC, id);
+CREATE INDEX members_rating_idx
+  ON members (rating DESC, (COALESCE(wins / NULLIF(matches, 0), 0)) DESC, id);
+CREATE INDEX brackets_round_idx
+  ON brackets (tourney_id, match_id);
+CREATE INDEX brackets_home_idx
+  ON brackets (tourney_id, home_from);
+CREATE INDEX brackets_away_idx
+  ON brackets (tourney_id, away_from);
+CREATE INDEX match_events_tourney_idx
+  ON match_events (tourney_id, match_id);
+CREATE INDEX match_events_voids_idx
+  ON match_events (voids);